@@ -71,18 +71,78 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'payment_API.wsgi.application'
+ASGI_APPLICATION = 'payment_API.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Configured from the environment. DB_ENGINE is 'sqlite' (default) or 'postgresql'.
+# Setting DB_REPLICA_NAME (and DB_REPLICA_HOST for PostgreSQL) adds a 'replica'
+# alias that payments.routers.PrimaryReplicaRouter uses for list/retrieve/export reads.
+
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+
+# SQLite profile for single-node deployments: payments.sqlite applies SQLITE_PRAGMAS
+# to every new connection, transactions take the write lock up front (IMMEDIATE)
+# and serialized_atomic() queues this process's writers on an in-process lock.
+# The journal mode is stored in the database file itself, so SQLITE_JOURNAL_MODE
+# is applied once per database with `manage.py sqlite_journal_mode`.
+SQLITE_TUNING = os.getenv('SQLITE_TUNING', 'true').lower() in ('true', '1')
+SQLITE_JOURNAL_MODE = 'WAL' if SQLITE_TUNING else None
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    # Negative values are KiB, so this is a 64 MiB page cache per connection
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', '-65536')),
+    'temp_store': 'MEMORY',
+} if SQLITE_TUNING else {}
+SQLITE_SERIALIZE_WRITES = SQLITE_TUNING and os.getenv('SQLITE_SERIALIZE_WRITES', 'true').lower() in ('true', '1')
+
+
+def database_config(name, host=None):
+    if DB_ENGINE == 'sqlite':
+        config = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': name,
+            'OPTIONS': {},
+        }
+        if SQLITE_TUNING:
+            config['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+        return config
+    config = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': name,
+        'USER': os.getenv('DB_USER', ''),
+        'PASSWORD': os.getenv('DB_PASSWORD', ''),
+        'HOST': host or os.getenv('DB_HOST', ''),
+        'PORT': os.getenv('DB_PORT', ''),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
     }
+    if os.getenv('DB_POOL', 'false').lower() in ('true', '1'):
+        # psycopg connection pool; replaces persistent connections
+        config['CONN_MAX_AGE'] = 0
+        config['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+        }
+    return config
+
+
+DATABASES = {
+    'default': database_config(os.getenv('DB_NAME', str(BASE_DIR / 'db.sqlite3'))),
 }
 
+if os.getenv('DB_REPLICA_NAME'):
+    DATABASES['replica'] = database_config(os.getenv('DB_REPLICA_NAME'), host=os.getenv('DB_REPLICA_HOST'))
+    # Tests run against the primary's test database through the replica alias
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['payments.routers.PrimaryReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -129,17 +189,88 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 PAYSTACK_SECRET_KEY = 'sk_test_d28d1a11a7f0b4011e21025085aa676bfff6aa2d'
 PAYSTACK_PUBLIC_KEY = 'pk_test_957f2a057f8866e5d2fe0c305c31067d5abd09da'
 
+# Outbound Paystack HTTP client (pooled, keep-alive session per worker process)
+PAYSTACK_CONNECT_TIMEOUT = float(os.getenv('PAYSTACK_CONNECT_TIMEOUT', '3.05'))
+PAYSTACK_READ_TIMEOUT = float(os.getenv('PAYSTACK_READ_TIMEOUT', '10'))
+PAYSTACK_POOL_MAXSIZE = int(os.getenv('PAYSTACK_POOL_MAXSIZE', '10'))
+PAYSTACK_MAX_RETRIES = int(os.getenv('PAYSTACK_MAX_RETRIES', '3'))
+PAYSTACK_BACKOFF_FACTOR = float(os.getenv('PAYSTACK_BACKOFF_FACTOR', '0.3'))
+PAYSTACK_BACKOFF_JITTER = float(os.getenv('PAYSTACK_BACKOFF_JITTER', '0.2'))
+PAYSTACK_ASYNC_MAX_CONNECTIONS = int(os.getenv('PAYSTACK_ASYNC_MAX_CONNECTIONS', '200'))
+PAYSTACK_ASYNC_MAX_KEEPALIVE = int(os.getenv('PAYSTACK_ASYNC_MAX_KEEPALIVE', '50'))
+
+# Circuit breaker around Paystack calls, with its state in the PAYSTACK_BREAKER_CACHE cache
+# (shared by all workers when that cache is Redis): after PAYSTACK_BREAKER_FAILURES failures
+# in a row, calls fail fast with a 503 for PAYSTACK_BREAKER_RECOVERY seconds, then one probe is let through
+PAYSTACK_BREAKER_FAILURES = int(os.getenv('PAYSTACK_BREAKER_FAILURES', '5'))
+PAYSTACK_BREAKER_RECOVERY = float(os.getenv('PAYSTACK_BREAKER_RECOVERY', '30'))
+PAYSTACK_BREAKER_CACHE = os.getenv('PAYSTACK_BREAKER_CACHE', 'default')
+# Outbound calls per second across all workers (token bucket in the database); 0 disables the limit.
+# Calls wait up to PAYSTACK_RATE_LIMIT_WAIT seconds for a token before failing fast with a 503
+PAYSTACK_RATE_LIMIT = float(os.getenv('PAYSTACK_RATE_LIMIT', '0'))
+PAYSTACK_RATE_BURST = int(os.getenv('PAYSTACK_RATE_BURST', '0')) or None
+PAYSTACK_RATE_LIMIT_WAIT = float(os.getenv('PAYSTACK_RATE_LIMIT_WAIT', '1'))
+
+# In-process threads draining the webhook queue; set to 0 when running process_webhooks workers
+PAYSTACK_WEBHOOK_LOCAL_WORKERS = int(os.getenv('PAYSTACK_WEBHOOK_LOCAL_WORKERS', '1'))
+# Webhooks for a payment that is not saved yet are retried after PAYSTACK_WEBHOOK_RETRY_DELAY
+# seconds, doubling up to PAYSTACK_WEBHOOK_RETRY_MAX_DELAY, and fail after PAYSTACK_WEBHOOK_MAX_ATTEMPTS tries
+PAYSTACK_WEBHOOK_MAX_ATTEMPTS = int(os.getenv('PAYSTACK_WEBHOOK_MAX_ATTEMPTS', '10'))
+PAYSTACK_WEBHOOK_RETRY_DELAY = float(os.getenv('PAYSTACK_WEBHOOK_RETRY_DELAY', '5'))
+PAYSTACK_WEBHOOK_RETRY_MAX_DELAY = float(os.getenv('PAYSTACK_WEBHOOK_RETRY_MAX_DELAY', '3600'))
+
 
 REST_FRAMEWORK = {
     'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.URLPathVersioning',
     'DEFAULT_VERSION': 'v1',
     'ALLOWED_VERSIONS': ['v1'],
     'VERSION_PARAM': 'version',
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'payments.pagination.KeysetPagination',
     'PAGE_SIZE': 10,
+    'DEFAULT_RENDERER_CLASSES': [
+        'payments.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 
+# Shared cache tier; without REDIS_URL the default is Django's per-process local memory cache
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+
+# Response cache for payment and charge retrieve/calculate_total (payments.cache):
+# an in-process LRU, plus the PAYMENTS_CACHE_ALIAS cache as a shared tier. With a
+# shared tier, local hits are checked against its generation counters so an
+# invalidation in one process is seen by all of them.
+# Without a shared tier, transitions made by other processes (other workers,
+# process_webhooks, reconcile_payments) are not seen until entries time out, so
+# the cache is only on by default when a shared tier is configured. Set
+# PAYMENTS_CACHE_ENABLED=true to use the local tier alone in a single process.
+PAYMENTS_CACHE_ALIAS = os.getenv('PAYMENTS_CACHE_ALIAS', 'default' if REDIS_URL else '') or None
+PAYMENTS_CACHE_ENABLED = os.getenv(
+    'PAYMENTS_CACHE_ENABLED', 'true' if PAYMENTS_CACHE_ALIAS else 'false').lower() in ('true', '1')
+PAYMENTS_CACHE_LOCAL_SIZE = int(os.getenv('PAYMENTS_CACHE_LOCAL_SIZE', '10000'))
+PAYMENTS_CACHE_TIMEOUT = int(os.getenv('PAYMENTS_CACHE_TIMEOUT', '300'))
+
+
+# Idempotency-Key handling for mutating payment actions (payments.idempotency)
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', str(24 * 60 * 60)))
+# Seconds before a key whose first request never finished can be taken over
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', '60'))
+# Seconds a duplicate waits for the first request's response before getting a 409
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv('IDEMPOTENCY_WAIT_TIMEOUT', '10'))
+
+
+# List-accepting POST on payments, refunds and charges
+BULK_CREATE_MAX_ITEMS = int(os.getenv('BULK_CREATE_MAX_ITEMS', '10000'))
+BULK_CREATE_BATCH_SIZE = int(os.getenv('BULK_CREATE_BATCH_SIZE', '1000'))
+
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
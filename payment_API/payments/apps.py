@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
 
 
 class PaymentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'payments'
+
+    def ready(self):
+        from .sqlite import apply_sqlite_profile
+        connection_created.connect(apply_sqlite_profile, dispatch_uid='payments.sqlite_profile')
+
+        from .cache import invalidate_cached_instance
+        for model_name in ('Payment', 'PaymentCharge'):
+            model = self.get_model(model_name)
+            post_save.connect(invalidate_cached_instance, sender=model, dispatch_uid=f'payments.cache.save.{model_name}')
+            post_delete.connect(invalidate_cached_instance, sender=model, dispatch_uid=f'payments.cache.delete.{model_name}')
+
+        from .rollups import ROLLUP_MODELS, remove_from_rollups
+        for model in ROLLUP_MODELS.values():
+            pre_delete.connect(remove_from_rollups, sender=model, dispatch_uid=f'payments.rollups.delete.{model.__name__}')
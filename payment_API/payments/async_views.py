@@ -0,0 +1,100 @@
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .idempotency import async_idempotent
+from .models import Payment
+from .paystack import AsyncPaystackMixin
+from .reconcile import FAILED_PAYSTACK_STATUSES
+from .resilience import ServiceUnavailableError
+import logging
+
+# Async (ASGI) versions of the Paystack-bound payment actions.
+# Served under api/v1/async/ so one ASGI worker can hold many Paystack calls in flight.
+logger = logging.getLogger(__name__)
+
+paystack = AsyncPaystackMixin()
+
+
+@csrf_exempt
+@require_POST
+@async_idempotent
+async def initiate_payment(request, pk):
+    try:
+        payment = await Payment.objects.aget(pk=pk)
+    except Payment.DoesNotExist:
+        return JsonResponse({"detail": "No Payment matches the given query."}, status=404)
+
+    callback_url = request.build_absolute_uri(reverse('payment-process', kwargs={'pk': str(payment.transaction_id)}))
+    try:
+        paystack_response = await paystack.initialize_payment(amount=payment.amount, email=payment.email, callback_url=callback_url)
+
+        payment.payment_reference = paystack_response['data']['reference']
+        await payment.asave(update_fields=['payment_reference', 'updated_at'])
+
+        return JsonResponse({
+            "status": "success",
+            "message": "Payment Link",
+            "data": {
+                "authorization_url": paystack_response['data']['authorization_url'],
+                "reference": paystack_response['data']['reference']
+                }
+        })
+    except ServiceUnavailableError as e:
+        response = JsonResponse({
+            "error": str(e)}, status=503)
+        response['Retry-After'] = str(e.retry_after)
+        return response
+    except Exception as e:
+        return JsonResponse({
+            "error": str(e)}, status=400)
+
+
+@csrf_exempt
+@require_POST
+@async_idempotent
+async def verify_payment(request, pk):
+    try:
+        payment = await Payment.objects.aget(pk=pk)
+    except Payment.DoesNotExist:
+        return JsonResponse({"detail": "No Payment matches the given query."}, status=404)
+
+    reference = payment.payment_reference
+    try:
+        verification_response = await paystack.verify_payment(reference)
+        paystack_status = verification_response['data']['status']
+
+        # Statuses that are neither settled nor failed (ongoing, pending...) leave the payment pending
+        if paystack_status == "success":
+            transitioned = await sync_to_async(payment.mark_as_paid)()
+        elif paystack_status in FAILED_PAYSTACK_STATUSES:
+            transitioned = await sync_to_async(payment.mark_as_failed)()
+        else:
+            return JsonResponse({
+                "message": "Payment is still pending",
+                "data": verification_response['data']
+                }, status=202)
+        if not transitioned:
+            return JsonResponse({
+                "error": "Payment is not pending",
+                "data": verification_response['data']
+                }, status=409)
+        if paystack_status == "success":
+            return JsonResponse({
+                "message": "Payment verified successfully",
+                "data": verification_response['data']
+                }, status=200)
+        return JsonResponse({
+            "message": "Payment failed",
+            "data": verification_response['data']
+            }, status=400)
+    except ServiceUnavailableError as e:
+        response = JsonResponse({
+            "error": str(e)}, status=503)
+        response['Retry-After'] = str(e.retry_after)
+        return response
+    except Exception as e:
+        logger.error(f"Error verifying payment: {str(e)}")
+        return JsonResponse({
+            "error": str(e)}, status=400)
@@ -0,0 +1,69 @@
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+from .sqlite import serialized_atomic
+
+
+class BulkCreateMixin:
+    """
+    Lets POST on the collection endpoint accept a JSON list of objects
+    Items are validated in one pass (related objects are fetched with one query
+    per relation), then inserted with bulk_create in batches inside a single
+    transaction. Any invalid item rejects the whole request with per-item errors
+    """
+    # Related fields resolved up front for the whole request, name -> model
+    bulk_related_fields = {}
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+
+        max_items = getattr(settings, 'BULK_CREATE_MAX_ITEMS', 10000)
+        if not request.data or len(request.data) > max_items:
+            return Response({
+                "error": f"Expected between 1 and {max_items} items"}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.context['prefetched'] = self.prefetch_bulk_related(request.data)
+        if not serializer.is_valid():
+            errors = serializer.errors
+            if isinstance(errors, dict) and all(isinstance(key, int) for key in errors):
+                # Newer DRF versions key list errors by index; report one entry per item
+                errors = [errors.get(index, {}) for index in range(len(request.data))]
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        model = self.get_queryset().model
+        instances = [model(**item) for item in serializer.validated_data]
+        errors = [{} for _ in instances]
+        for index, instance in enumerate(instances):
+            try:
+                self.validate_bulk_instance(instance)
+            except ValueError as e:
+                errors[index] = {"non_field_errors": [str(e)]}
+        if any(errors):
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        with serialized_atomic():
+            created = model.objects.bulk_create(
+                instances, batch_size=getattr(settings, 'BULK_CREATE_BATCH_SIZE', 1000))
+        return Response(self.fast_serializer_class().many_instances(created), status=status.HTTP_201_CREATED)
+
+    def prefetch_bulk_related(self, items):
+        prefetched = {}
+        for name, related_model in self.bulk_related_fields.items():
+            pks = set()
+            for item in items:
+                value = item.get(name) if isinstance(item, dict) else None
+                if isinstance(value, (int, str)) and str(value).isdigit():
+                    pks.add(int(value))
+            prefetched[name] = related_model.objects.in_bulk(pks)
+        return prefetched
+
+    def validate_bulk_instance(self, instance):
+        """
+        Runs the model-level checks save() would run, without per-row queries
+        """
+        instance.clean()
+        validate_tax = getattr(instance, 'validate_tax', None)
+        if validate_tax is not None:
+            validate_tax()
@@ -0,0 +1,242 @@
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+import hashlib
+import threading
+import time
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with per-entry expiry
+    Implements the subset of Django's cache API the response cache uses
+    """
+
+    def __init__(self, maxsize=10000, timeout=300):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key, now):
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            return _MISSING
+        value, expires = item
+        if expires is not None and expires <= now:
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            values = {key: self._get(key, now) for key in keys}
+        return {key: value for key, value in values.items() if value is not _MISSING}
+
+    def set(self, key, value, timeout=_MISSING):
+        timeout = self.timeout if timeout is _MISSING else timeout
+        expires = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def add(self, key, value, timeout=_MISSING):
+        with self._lock:
+            exists = self._get(key, time.monotonic()) is not _MISSING
+        if not exists:
+            self.set(key, value, timeout)
+        return not exists
+
+    def incr(self, key, delta=1):
+        with self._lock:
+            value = self._get(key, time.monotonic())
+            if value is _MISSING:
+                raise ValueError(f"Key '{key}' not found")
+            self._data[key] = (value + delta, self._data[key][1])
+            return value + delta
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of per-object response data: an in-process LRU, then
+    Django's cache framework when PAYMENTS_CACHE_ALIAS is set
+    Each object has one entry per tier holding all its cached variants
+    (retrieve, calculate_total, ...) and a single generation counter, kept in
+    the shared tier when there is one so every process sees an invalidation.
+    Invalidation bumps the generation and drops the entries, so a response built
+    from a read that raced with the invalidation is stored under the old
+    generation and ignored, and so is another process's local copy
+    """
+
+    def __init__(self):
+        self.local = LRUCache(
+            maxsize=getattr(settings, 'PAYMENTS_CACHE_LOCAL_SIZE', 10000),
+            timeout=getattr(settings, 'PAYMENTS_CACHE_TIMEOUT', 300),
+        )
+
+    @property
+    def shared(self):
+        alias = getattr(settings, 'PAYMENTS_CACHE_ALIAS', None)
+        return caches[alias] if alias else None
+
+    @property
+    def tiers(self):
+        shared = self.shared
+        return [self.local, shared] if shared is not None else [self.local]
+
+    @property
+    def enabled(self):
+        # A local tier alone can't see other processes' invalidations, so it is opt-in
+        return getattr(settings, 'PAYMENTS_CACHE_ENABLED', self.shared is not None)
+
+    def object_key(self, model, pk):
+        return f"payments:response:{model._meta.label_lower}:{pk}"
+
+    def get(self, model, pk, variant):
+        """
+        Returns (cached, token); token must be passed to set() on a miss
+        A local hit still reads the generation from the shared tier, but not the entry
+        """
+        key = self.object_key(model, pk)
+        generation_key = f"{key}:generation"
+        shared = self.shared
+        if shared is None:
+            values = self.local.get_many([key, generation_key])
+            candidates = [(self.local, values.get(key))]
+        else:
+            local_entry = self.local.get_many([key]).get(key)
+            local_hit = local_entry is not None and variant in local_entry['variants']
+            values = shared.get_many([generation_key] if local_hit else [key, generation_key])
+            if local_hit and local_entry['generation'] != values.get(generation_key, 0):
+                # Invalidated by another process since it was stored locally
+                values[key] = shared.get(key)
+            candidates = [(self.local, local_entry), (shared, values.get(key))]
+        generation = values.get(generation_key, 0)
+
+        misses = []
+        for tier, entry in candidates:
+            if entry is None or entry['generation'] != generation:
+                entry = None
+            elif variant in entry['variants']:
+                cached = entry['variants'][variant]
+                # Backfill the tiers in front of the one that hit
+                self.set(model, pk, variant, cached, misses)
+                return cached, None
+            misses.append((tier, generation, entry))
+        return None, misses
+
+    def set(self, model, pk, variant, cached, token):
+        key = self.object_key(model, pk)
+        timeout = getattr(settings, 'PAYMENTS_CACHE_TIMEOUT', 300)
+        for tier, generation, entry in token:
+            variants = dict(entry['variants']) if entry else {}
+            variants[variant] = cached
+            tier.set(key, {'generation': generation, 'variants': variants}, timeout)
+
+    def invalidate(self, model, pks):
+        keys = [self.object_key(model, pk) for pk in pks]
+        shared = self.shared
+        generations = self.local if shared is None else shared
+        for key in keys:
+            generation_key = f"{key}:generation"
+            generations.add(generation_key, 0, timeout=None)
+            try:
+                generations.incr(generation_key)
+            except ValueError:
+                # Evicted between add() and incr(); the entries go below
+                pass
+        for tier in self.tiers:
+            tier.delete_many(keys)
+
+    def invalidate_on_commit(self, model, pks):
+        """
+        Invalidates once the current transaction commits, so a miss cannot
+        reload the row before the change is visible
+        """
+        pks = list(pks)
+        if pks:
+            transaction.on_commit(lambda: self.invalidate(model, pks))
+
+    def clear(self):
+        self.local.clear()
+
+
+response_cache = ResponseCache()
+
+
+def invalidate_cached_instance(sender, instance, **kwargs):
+    """
+    post_save/post_delete receiver for writes that bypass the transition methods
+    """
+    response_cache.invalidate_on_commit(sender, [instance.pk])
+
+
+class CachedResponseMixin:
+    """
+    Serves retrieve and other per-object GET actions from response_cache with
+    ETag/Last-Modified validators derived from the row's updated_at, answering
+    matching If-None-Match/If-Modified-Since requests with 304
+    Cache hits skip get_object(), so only use this on viewsets without
+    object permissions. Misses read from the primary so a lagging replica
+    cannot refill the cache with a superseded row
+    """
+
+    def cached_response(self, request, pk, build):
+        """
+        build() returns (data, updated_at) for the object, or raises Http404
+        """
+        model = self.get_queryset().model
+        try:
+            # One cache key per object whatever the URL spelling ("5", "05")
+            pk = model._meta.pk.to_python(pk)
+        except ValidationError:
+            raise Http404
+        variant = f"{self.action}?{request.query_params.urlencode()}"
+        cached, token = response_cache.get(model, pk, variant) if response_cache.enabled else (None, None)
+        if cached is None:
+            data, updated_at = build()
+            validator = f"{model._meta.label_lower}:{pk}:{variant}:{updated_at.isoformat()}"
+            cached = {
+                'data': data,
+                'etag': f'"{hashlib.md5(validator.encode("utf-8")).hexdigest()}"',
+                'last_modified': int(updated_at.timestamp()),
+            }
+            if token is not None:
+                response_cache.set(model, pk, variant, cached, token)
+
+        not_modified = get_conditional_response(request, etag=cached['etag'], last_modified=cached['last_modified'])
+        response = not_modified or Response(cached['data'])
+        response['ETag'] = cached['etag']
+        response['Last-Modified'] = http_date(cached['last_modified'])
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+
+        def build():
+            serializer = self.get_fast_serializer()
+            row = self.get_fast_row(serializer, kwargs[lookup_url_kwarg])
+            return serializer.to_representation(row), row['updated_at']
+        return self.cached_response(request, kwargs[lookup_url_kwarg], build)
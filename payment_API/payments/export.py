@@ -0,0 +1,94 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from .models import Payment, PaymentRefund, PaymentCharge
+from .routers import replica_reads
+import csv
+import io
+
+BASE_EXPORT_FIELDS = ['transaction_id', 'amount', 'customer_name', 'email', 'status', 'paid',
+                      'created_at', 'updated_at']
+
+# Ledger tables covered by the export endpoints and the export_payments command
+EXPORT_MODELS = {
+    'payments': (Payment, BASE_EXPORT_FIELDS + ['payment_reference']),
+    'refunds': (PaymentRefund, BASE_EXPORT_FIELDS + ['original_payment', 'refund_reason', 'refund_transaction_id']),
+    'charges': (PaymentCharge, BASE_EXPORT_FIELDS + ['description', 'tax']),
+}
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _encode_value(value):
+    if value is None:
+        return ''
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def iter_csv(queryset, fields, chunk_size=2000):
+    """
+    Yields a CSV export of queryset one line at a time
+    Rows are read with a server-side cursor, so memory use stays constant
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return value
+
+    writer.writerow(fields)
+    yield flush()
+    for row in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        writer.writerow([_encode_value(value) for value in row])
+        yield flush()
+
+
+def iter_ndjson(queryset, fields, chunk_size=2000):
+    """
+    Yields a newline-delimited JSON export of queryset one object at a time
+    """
+    encoder = DjangoJSONEncoder()
+    for row in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        yield encoder.encode(dict(zip(fields, row))) + '\n'
+
+
+def iter_export(queryset, fields, output='csv', chunk_size=2000):
+    if output not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {output}")
+    exporter = iter_csv if output == 'csv' else iter_ndjson
+    return exporter(queryset.order_by('created_at', 'transaction_id'), fields, chunk_size=chunk_size)
+
+
+class StreamingExportMixin:
+    """
+    Adds a GET export/ action streaming the (filtered) table as CSV or NDJSON
+    Choose the format with ?output=csv|ndjson
+    """
+    export_fields = None
+    export_chunk_size = 2000
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        output = request.query_params.get('output', 'csv')
+        if output not in EXPORT_FORMATS:
+            raise ValidationError({"detail": f"output must be one of {', '.join(EXPORT_FORMATS)}"})
+        fields = self.export_fields or self.get_serializer_class().Meta.fields
+        queryset = self.filter_queryset(self.get_queryset())
+        # The stream is consumed after the view returns, so pin the database now
+        with replica_reads():
+            queryset = queryset.using(router.db_for_read(queryset.model))
+
+        response = StreamingHttpResponse(
+            iter_export(queryset, fields, output=output, chunk_size=self.export_chunk_size),
+            content_type=EXPORT_FORMATS[output],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{self.basename}.{output}"'
+        return response
@@ -0,0 +1,223 @@
+from decimal import Decimal
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from rest_framework.response import Response
+from .routers import replica_reads
+from .models import PaymentCharge
+from .serializers import PaymentSerializer, PaymentHistorySerializer, PaymentRefundSerializer, PaymentChargeSerializer
+
+# Field types whose representation of a database value is the value itself.
+IDENTITY_FIELDS = (
+    serializers.CharField,
+    serializers.BooleanField,
+    serializers.IntegerField,
+    serializers.ReadOnlyField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+
+def _decimal_converter(field):
+    """
+    Mirrors DecimalField.to_representation, skipping quantize() for values
+    the database already returns at the field's scale
+    """
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce_to_string or field.localize or field.normalize_output or field.decimal_places is None:
+        return lambda tz: field.to_representation
+    exponent = -field.decimal_places
+
+    def convert(value):
+        if isinstance(value, Decimal) and value.as_tuple().exponent == exponent:
+            return f'{value:f}'
+        return field.to_representation(value)
+    return lambda tz: convert
+
+
+def _datetime_converter(field):
+    """
+    Mirrors DateTimeField.to_representation for ISO 8601 output of aware datetimes
+    """
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601 or hasattr(field, 'timezone'):
+        return lambda tz: field.to_representation
+
+    def bind(tz):
+        if tz is None:
+            return field.to_representation
+
+        def convert(value):
+            if not timezone.is_aware(value):
+                return field.to_representation(value)
+            value = value.astimezone(tz).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return convert
+    return bind
+
+
+class FastModelSerializer:
+    """
+    Read-only serializer working on .values() rows instead of model instances
+    The field tree of serializer_class is built once per class and each field's
+    representation is applied straight to the column value, so the output is
+    the same as serializer_class(many=True).data without per-row overhead
+    """
+    serializer_class = None
+    computed_fields = ()
+    # Fields read from queryset annotations, name -> expression factory.
+    # Model instances serialized through many_instances() provide them as attributes.
+    annotations = {}
+    # Related fields that can be expanded in place, name -> FastModelSerializer class.
+    # Expanded objects are read through the same .values() query with a JOIN.
+    expandable_fields = {}
+
+    def __init__(self, expand=()):
+        cls = type(self)
+        if '_converters' not in cls.__dict__:
+            cls._converters = cls.build_converters()
+        # Converters are bound to the active timezone once per serializer
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        self.converters = [
+            (name, converter if converter in (None, False) else converter(tz))
+            for name, converter in cls._converters
+        ]
+        self.nested = {name: cls.expandable_fields[name]() for name in expand if name in cls.expandable_fields}
+
+    @classmethod
+    def build_converters(cls):
+        """
+        Returns (name, converter) pairs: None for computed fields, False for
+        fields whose value is used as-is, otherwise a factory taking the timezone
+        """
+        converters = []
+        for name, field in cls.serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if name in cls.computed_fields:
+                converters.append((name, None))
+            elif isinstance(field, serializers.ChoiceField):
+                # String choices map back to themselves
+                identity = all(isinstance(key, str) for key in field.choices)
+                converters.append((name, False if identity else (lambda tz, f=field: f.to_representation)))
+            elif isinstance(field, IDENTITY_FIELDS):
+                converters.append((name, False))
+            elif isinstance(field, serializers.DecimalField):
+                converters.append((name, _decimal_converter(field)))
+            elif isinstance(field, serializers.DateTimeField):
+                converters.append((name, _datetime_converter(field)))
+            else:
+                converters.append((name, lambda tz, f=field: f.to_representation))
+        return converters
+
+    @property
+    def source_fields(self):
+        names = [name for name, converter in self.converters if converter is not None]
+        for name in ('created_at', 'transaction_id'):
+            if name not in names:
+                names.append(name)
+        for name, nested in self.nested.items():
+            names.extend(f'{name}__{field}' for field in nested.source_fields)
+        return names
+
+    def values(self, queryset):
+        """
+        Returns queryset as .values() rows holding source_fields
+        """
+        if self.annotations:
+            queryset = queryset.annotate(**{name: factory() for name, factory in self.annotations.items()})
+        return queryset.values(*self.source_fields)
+
+    def to_representation(self, row):
+        representation = {}
+        for name, converter in self.converters:
+            if converter is None:
+                representation[name] = getattr(self, f'get_{name}')(row)
+                continue
+            value = row[name]
+            representation[name] = value if value is None or converter is False else converter(value)
+        for name, nested in self.nested.items():
+            if row[name] is not None:
+                prefix = f'{name}__'
+                representation[name] = nested.to_representation(
+                    {field: row[prefix + field] for field in nested.source_fields})
+        return representation
+
+    def many(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+    def many_instances(self, instances):
+        """
+        Serializes already loaded model instances through the same converters
+        """
+        opts = self.serializer_class.Meta.model._meta
+        attnames = [
+            (name, name if name in self.annotations else opts.get_field(name).attname)
+            for name in self.source_fields if '__' not in name
+        ]
+        return self.many({name: getattr(obj, attname) for name, attname in attnames} for obj in instances)
+
+
+class FastPaymentSerializer(FastModelSerializer):
+    serializer_class = PaymentSerializer
+
+
+class FastPaymentHistorySerializer(FastModelSerializer):
+    serializer_class = PaymentHistorySerializer
+    expandable_fields = {'original_payment': FastPaymentSerializer}
+
+
+class FastPaymentRefundSerializer(FastModelSerializer):
+    serializer_class = PaymentRefundSerializer
+    expandable_fields = {'original_payment': FastPaymentSerializer}
+
+
+class FastPaymentChargeSerializer(FastModelSerializer):
+    serializer_class = PaymentChargeSerializer
+    annotations = {'total_amount': PaymentCharge.total_amount_expression}
+
+
+class FastReadMixin:
+    """
+    Serves list and retrieve from .values() rows through fast_serializer_class
+    ?expand=<field>[,<field>] inlines related objects from the same query
+    Object-level permission checks are skipped on retrieve, so only use this
+    on viewsets without object permissions
+    """
+    fast_serializer_class = None
+
+    def get_fast_serializer(self):
+        expand = [name for name in self.request.query_params.get('expand', '').split(',') if name]
+        return self.fast_serializer_class(expand=expand)
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_fast_serializer()
+        rows = serializer.values(self.filter_queryset(self.get_queryset()))
+
+        with replica_reads():
+            page = self.paginate_queryset(rows)
+            if page is not None:
+                return self.get_paginated_response(serializer.many(page))
+            return Response(serializer.many(rows))
+
+    def get_fast_row(self, serializer, lookup):
+        """
+        Returns the .values() row for one object, or raises Http404
+        """
+        rows = serializer.values(self.filter_queryset(self.get_queryset()))
+        try:
+            row = rows.filter(**{self.lookup_field: lookup}).first()
+        except (TypeError, ValueError, ValidationError):
+            row = None
+        if row is None:
+            raise Http404
+        return row
+
+    def retrieve(self, request, *args, **kwargs):
+        serializer = self.get_fast_serializer()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        with replica_reads():
+            row = self.get_fast_row(serializer, kwargs[lookup_url_kwarg])
+        return Response(serializer.to_representation(row))
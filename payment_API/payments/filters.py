@@ -0,0 +1,67 @@
+from datetime import datetime, time
+from decimal import Decimal, InvalidOperation
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from .money import from_minor_units, to_minor_units
+
+
+def parse_date_bound(value, end_of_day=False):
+    # parse_datetime also accepts a bare date (as midnight), so dates are tried first
+    try:
+        day = parse_date(value)
+        parsed = parse_datetime(value) if day is None else datetime.combine(day, time.max if end_of_day else time.min)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({"detail": f"Invalid date: {value}"})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_amount(name, value):
+    """
+    Parses a money query parameter; MoneyField cannot store fractions of a
+    minor unit, so those are rejected here rather than failing in the query
+    """
+    try:
+        amount = Decimal(value)
+        if amount.is_finite():
+            return from_minor_units(to_minor_units(amount))
+    except (InvalidOperation, ValueError):
+        pass
+    raise ValidationError({"detail": f"{name} must be an amount with at most 2 decimal places"})
+
+
+class PaymentFilterMixin:
+    """
+    Query-string filters shared by the payment viewsets
+    Supports status, email, paid, amount, amount_min/amount_max and
+    created_after/created_before (ISO dates or datetimes); ranges are inclusive
+    """
+    filtered_actions = ('list', 'export')
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action not in self.filtered_actions:
+            return queryset
+        params = self.request.query_params
+
+        if params.get('status'):
+            queryset = queryset.filter(status=params['status'].upper())
+        if params.get('email'):
+            queryset = queryset.filter(email=params['email'])
+        if params.get('paid'):
+            paid = params['paid'].lower()
+            if paid not in ('true', 'false', '1', '0'):
+                raise ValidationError({"detail": "paid must be true or false"})
+            queryset = queryset.filter(paid=paid in ('true', '1'))
+        for name, lookup in (('amount', 'amount'), ('amount_min', 'amount__gte'), ('amount_max', 'amount__lte')):
+            if params.get(name):
+                queryset = queryset.filter(**{lookup: parse_amount(name, params[name])})
+        if params.get('created_after'):
+            queryset = queryset.filter(created_at__gte=parse_date_bound(params['created_after']))
+        if params.get('created_before'):
+            queryset = queryset.filter(created_at__lte=parse_date_bound(params['created_before'], end_of_day=True))
+        return queryset
@@ -0,0 +1,240 @@
+from asgiref.sync import sync_to_async
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError
+from django.http import JsonResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
+from .models import IdempotencyKey
+from .sqlite import serialized_atomic
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+REPLAY_HEADER = 'Idempotent-Replayed'
+
+
+def request_fingerprint(request):
+    """
+    Digest of the method, path and body a key was first used with
+    """
+    digest = hashlib.sha256(f"{request.method} {request.path}\n".encode('utf-8'))
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def request_principal(request, user):
+    """
+    Who a key belongs to: the authenticated user, or else the client address
+    as DRF throttling identifies it (honouring NUM_PROXIES)
+    Keys are scoped to it, so clients cannot replay or block each other's keys
+    """
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"anon:{BaseThrottle().get_ident(request)}"
+
+
+def claim_key(principal, key, fingerprint):
+    """
+    Tries to become the request that runs for principal's key
+    Returns (record, claimed); record is None if the key was released in the
+    meantime and the claim should be retried
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400))
+    try:
+        with serialized_atomic():
+            return IdempotencyKey.objects.create(
+                principal=principal, key=key, request_hash=fingerprint, locked_at=now, expires_at=expires_at), True
+    except IntegrityError:
+        pass
+
+    record = IdempotencyKey.objects.filter(principal=principal, key=key).first()
+    if record is None:
+        return None, False
+    abandoned = (
+        record.status == 'PROCESSING'
+        and record.locked_at <= now - timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 60))
+    )
+    if record.expires_at > now and not abandoned:
+        return record, False
+
+    # Take over an expired key, or one whose first request died mid-flight.
+    # The update is conditional so only one of several waiters wins.
+    taken = IdempotencyKey.objects.filter(pk=record.pk, status=record.status, locked_at=record.locked_at).update(
+        request_hash=fingerprint, status='PROCESSING', response_status=None, response_body=None,
+        locked_at=now, expires_at=expires_at)
+    if not taken:
+        return None, False
+    logger.info(f"Idempotency key {key} of {principal} taken over ({'abandoned' if abandoned else 'expired'})")
+    record.request_hash, record.status, record.locked_at = fingerprint, 'PROCESSING', now
+    return record, True
+
+
+MISMATCH_ERROR = "Idempotency-Key was already used for a different request"
+IN_PROGRESS_ERROR = "A request with this Idempotency-Key is still in progress"
+KEY_TOO_LONG_ERROR = "Idempotency-Key must be at most 255 characters"
+
+
+def check_key(principal, key, fingerprint):
+    """
+    Makes one attempt at claiming principal's key
+    Returns (record, outcome), outcome being 'claimed' (run the request),
+    'replay' (return the stored response), 'mismatch' (the key was used for a
+    different request), 'wait' (the first request is still running) or
+    'retry' (the key was released meanwhile)
+    """
+    record, claimed = claim_key(principal, key, fingerprint)
+    if claimed:
+        return record, 'claimed'
+    if record is None:
+        return None, 'retry'
+    if record.request_hash != fingerprint:
+        return record, 'mismatch'
+    if record.status == 'COMPLETED':
+        return record, 'replay'
+    return record, 'wait'
+
+
+def store_response(record, status_code, body):
+    IdempotencyKey.objects.filter(pk=record.pk).update(
+        status='COMPLETED', response_status=status_code, response_body=body)
+
+
+def release_key(record):
+    IdempotencyKey.objects.filter(pk=record.pk).delete()
+
+
+def replay(record):
+    response = Response(record.response_body, status=record.response_status)
+    response[REPLAY_HEADER] = 'true'
+    return response
+
+
+def idempotent(view_method):
+    """
+    Makes a mutating view method honour the Idempotency-Key request header
+    Keys are scoped to the requesting principal (see request_principal)
+    The first request with a key runs and its response is stored; replays get
+    the stored response without running the view again, and duplicates that
+    arrive while the first is still running wait for its result
+    Exceptions and 5xx responses release the key so the client can retry
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.META.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({"error": KEY_TOO_LONG_ERROR}, status=status.HTTP_400_BAD_REQUEST)
+
+        principal = request_principal(request, request.user)
+        fingerprint = request_fingerprint(request)
+        deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT_TIMEOUT', 10)
+        delay = 0.02
+        while True:
+            record, outcome = check_key(principal, key, fingerprint)
+            if outcome == 'claimed':
+                break
+            if outcome == 'mismatch':
+                return Response({"error": MISMATCH_ERROR}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if outcome == 'replay':
+                return replay(record)
+            if outcome == 'wait':
+                if time.monotonic() >= deadline:
+                    return Response({"error": IN_PROGRESS_ERROR}, status=status.HTTP_409_CONFLICT)
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            release_key(record)
+            raise
+        if response.status_code >= 500 or not isinstance(response, Response):
+            release_key(record)
+            return response
+        store_response(record, response.status_code, response.data)
+        return response
+    return wrapper
+
+
+def async_idempotent(view):
+    """
+    idempotent() for async function views returning JsonResponse
+    The key table is accessed through sync_to_async and duplicates wait with
+    asyncio.sleep, so waiting never blocks the event loop
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        key = request.META.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return await view(request, *args, **kwargs)
+        if len(key) > 255:
+            return JsonResponse({"error": KEY_TOO_LONG_ERROR}, status=status.HTTP_400_BAD_REQUEST)
+
+        user = await request.auser() if hasattr(request, 'auser') else None
+        principal = request_principal(request, user)
+        fingerprint = request_fingerprint(request)
+        deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT_TIMEOUT', 10)
+        delay = 0.02
+        while True:
+            record, outcome = await sync_to_async(check_key)(principal, key, fingerprint)
+            if outcome == 'claimed':
+                break
+            if outcome == 'mismatch':
+                return JsonResponse({"error": MISMATCH_ERROR}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if outcome == 'replay':
+                response = JsonResponse(record.response_body, status=record.response_status, safe=False)
+                response[REPLAY_HEADER] = 'true'
+                return response
+            if outcome == 'wait':
+                if time.monotonic() >= deadline:
+                    return JsonResponse({"error": IN_PROGRESS_ERROR}, status=status.HTTP_409_CONFLICT)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.5)
+
+        try:
+            response = await view(request, *args, **kwargs)
+        except Exception:
+            await sync_to_async(release_key)(record)
+            raise
+        if response.status_code >= 500 or not isinstance(response, JsonResponse):
+            await sync_to_async(release_key)(record)
+            return response
+        await sync_to_async(store_response)(record, response.status_code, json.loads(response.content))
+        return response
+    return wrapper
+
+
+def purge_expired_keys(batch_size=1000):
+    """
+    Deletes expired idempotency keys in batches
+    Returns the number of keys deleted
+    """
+    deleted = 0
+    while True:
+        pks = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=pks).delete()[0]
+
+
+class IdempotentCreateMixin:
+    """
+    Applies idempotent() to the viewset's create (single or bulk)
+    """
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
@@ -0,0 +1,37 @@
+from contextlib import contextmanager
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from payments.sqlite import set_journal_mode
+import math
+import shutil
+import tempfile
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+@contextmanager
+def throwaway_database():
+    """
+    Runs the block against freshly created test databases, torn down afterwards
+    The SQLite test database is put in a temporary file in SQLITE_JOURNAL_MODE
+    rather than in memory, so the numbers are representative
+    """
+    runner = DiscoverRunner(verbosity=0, interactive=False)
+    connection = connections['default']
+    tmpdir = None
+    if connection.vendor == 'sqlite' and not connection.settings_dict['TEST'].get('NAME'):
+        tmpdir = tempfile.mkdtemp(prefix='payments-benchmark-')
+        connection.settings_dict['TEST']['NAME'] = f"{tmpdir}/benchmark.sqlite3"
+    old_config = runner.setup_databases()
+    if tmpdir:
+        set_journal_mode(connection)
+    try:
+        yield
+    finally:
+        connections.close_all()
+        runner.teardown_databases(old_config)
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
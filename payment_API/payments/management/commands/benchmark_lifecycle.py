@@ -0,0 +1,118 @@
+from collections import defaultdict
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from payments.testing import FakePaystackServer
+from payments.models import Payment
+from payments.views import PaymentViewSet
+from payments.webhooks import drain_webhook_events
+from ._benchmark import percentile, throwaway_database
+import random
+import threading
+import time
+
+ENDPOINTS = ('create', 'initiate', 'webhook', 'verify', 'retrieve')
+
+
+class Command(BaseCommand):
+    help = (
+        "Drives the payment lifecycle (create, initiate, signed webhook, verify, retrieve) against a "
+        "local fake Paystack server in a throwaway database and reports latency, throughput and "
+        "queries per endpoint"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=200, help="Number of payment lifecycles")
+        parser.add_argument('--concurrency', type=int, default=8, help="Lifecycles run in parallel threads")
+        parser.add_argument('--latency', type=float, default=0.05, help="Simulated Paystack latency in seconds")
+        parser.add_argument('--failure-rate', type=float, default=0.0,
+                            help="Fraction of payments Paystack settles as failed")
+
+    def handle(self, *args, **options):
+        self.stats = defaultdict(list)
+        self.lock = threading.Lock()
+
+        base_url = PaymentViewSet.PAYSTACK_BASE_URL
+        try:
+            with throwaway_database():
+                with FakePaystackServer(latency=options['latency'], secret_key=settings.PAYSTACK_SECRET_KEY) as server:
+                    PaymentViewSet.PAYSTACK_BASE_URL = server.base_url
+                    PaymentViewSet().get_paystack_breaker().reset()
+                    elapsed = self.run_lifecycles(server, options)
+                drain_webhook_events()
+                self.report(elapsed, options)
+        finally:
+            PaymentViewSet.PAYSTACK_BASE_URL = base_url
+
+    def run_lifecycles(self, server, options):
+        indexes = iter(range(options['payments']))
+
+        def worker():
+            client = APIClient()
+            try:
+                while True:
+                    with self.lock:
+                        index = next(indexes, None)
+                    if index is None:
+                        return
+                    failed = random.random() < options['failure_rate']
+                    self.lifecycle(client, server, index, 'failed' if failed else 'success')
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['concurrency'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+    def lifecycle(self, client, server, index, outcome):
+        response = self.call('create', client.post, '/api/v1/payments/', {
+            'customer_name': f"Customer {index}", 'amount': '19.99', 'email': f"user{index}@example.com",
+        }, format='json')
+        pk = response.json()['transaction_id']
+        response = self.call('initiate', client.post, f'/api/v1/payments/{pk}/initiate_payment/')
+        if response.status_code != 200:
+            return
+        body, signature = server.settle(response.json()['data']['reference'], outcome)
+        self.call('webhook', client.post, '/api/v1/webhook/paystack/', body,
+                  content_type='application/json', HTTP_X_PAYSTACK_SIGNATURE=signature)
+        self.call('verify', client.post, f'/api/v1/payments/{pk}/verify_payment/')
+        self.call('retrieve', client.get, f'/api/v1/payments/{pk}/')
+
+    def call(self, endpoint, method, *args, **kwargs):
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            started = time.perf_counter()
+            response = method(*args, **kwargs)
+            elapsed = time.perf_counter() - started
+        with self.lock:
+            self.stats[endpoint].append((elapsed, sum(len(queries) for queries in captured), response.status_code))
+        return response
+
+    def report(self, elapsed, options):
+        total = options['payments']
+        requests = sum(len(calls) for calls in self.stats.values())
+        self.stdout.write(
+            f"{total} lifecycles in {elapsed:.2f}s: {total / elapsed:.1f} lifecycles/s, {requests / elapsed:.1f} req/s "
+            f"(concurrency {options['concurrency']}, Paystack latency {options['latency'] * 1000:.0f} ms)"
+        )
+        self.stdout.write(f"{'endpoint':<10} {'calls':>6} {'p50 ms':>8} {'p99 ms':>8} {'queries':>8} {'non-2xx':>8}")
+        for endpoint in ENDPOINTS:
+            calls = self.stats.get(endpoint)
+            if not calls:
+                continue
+            latencies = [latency * 1000 for latency, _, _ in calls]
+            queries = sum(count for _, count, _ in calls) / len(calls)
+            errors = sum(1 for _, _, status in calls if not 200 <= status < 300)
+            self.stdout.write(
+                f"{endpoint:<10} {len(calls):>6} {percentile(latencies, 0.5):>8.1f} {percentile(latencies, 0.99):>8.1f} "
+                f"{queries:>8.1f} {errors:>8}"
+            )
+        statuses = {status: Payment.objects.filter(status=status).count() for status in ('COMPLETED', 'FAILED', 'PENDING')}
+        self.stdout.write("Final payment statuses: " + ", ".join(f"{status} {count}" for status, count in statuses.items()))
@@ -0,0 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client
+from payments import async_views
+from payments.testing import FakePaystackServer
+from payments.models import Payment
+from payments.views import PaymentViewSet
+from ._benchmark import percentile, throwaway_database
+import asyncio
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the throughput of the sync (WSGI) and async (ASGI) verify_payment views against a "
+        "local fake Paystack server, in a throwaway database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help="Number of verify requests per run")
+        parser.add_argument('--latency', type=float, default=0.05, help="Simulated Paystack latency in seconds")
+        parser.add_argument('--sync-workers', type=int, default=8, help="Threads serving the sync view (one request per thread)")
+        parser.add_argument('--concurrency', type=int, default=200, help="Requests in flight for the async view")
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        base_url = PaymentViewSet.PAYSTACK_BASE_URL
+        try:
+            with throwaway_database(), FakePaystackServer(latency=options['latency']) as server:
+                PaymentViewSet.PAYSTACK_BASE_URL = server.base_url
+                async_views.paystack.PAYSTACK_BASE_URL = server.base_url
+                PaymentViewSet().get_paystack_breaker().reset()
+
+                # The fake server verifies references it did not issue as successful
+                payments = Payment.objects.bulk_create([
+                    Payment(customer_name="Benchmark", amount='19.99', email=f"user{i}@example.com",
+                            payment_reference=f"ref-{i}")
+                    for i in range(2 * total)
+                ])
+                pks = [payment.pk for payment in payments]
+
+                sync_elapsed, sync_latencies, sync_errors = self.run_sync(pks[:total], options['sync_workers'])
+                async_elapsed, async_latencies, async_errors = asyncio.run(
+                    self.run_async(pks[total:], options['concurrency']))
+        finally:
+            PaymentViewSet.PAYSTACK_BASE_URL = base_url
+            async_views.paystack.PAYSTACK_BASE_URL = base_url
+
+        self.stdout.write(
+            f"{total} verify_payment requests per view, Paystack latency {options['latency'] * 1000:.0f} ms")
+        self.stdout.write(f"{'view':<24} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'non-2xx':>8}")
+        for label, elapsed, latencies, errors in (
+            (f"sync ({options['sync_workers']} threads)", sync_elapsed, sync_latencies, sync_errors),
+            (f"async ({options['concurrency']} in flight)", async_elapsed, async_latencies, async_errors),
+        ):
+            self.stdout.write(
+                f"{label:<24} {total / elapsed:>8.1f} {percentile(latencies, 0.5) * 1000:>8.1f} "
+                f"{percentile(latencies, 0.99) * 1000:>8.1f} {errors:>8}"
+            )
+
+    def run_sync(self, pks, workers):
+        def verify(pk):
+            started = time.perf_counter()
+            response = Client().post(f'/api/v1/payments/{pk}/verify_payment/')
+            return time.perf_counter() - started, response.status_code
+
+        def run_worker(pks):
+            try:
+                return [verify(pk) for pk in pks]
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = [result for chunk in pool.map(run_worker, [pks[i::workers] for i in range(workers)])
+                       for result in chunk]
+        return self.summarize(time.perf_counter() - started, results)
+
+    async def run_async(self, pks, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def verify(pk):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(f'/api/v1/async/payments/{pk}/verify_payment/')
+                return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(verify(pk) for pk in pks))
+        return self.summarize(time.perf_counter() - started, results)
+
+    @staticmethod
+    def summarize(elapsed, results):
+        latencies = [latency for latency, _ in results]
+        errors = sum(1 for _, status_code in results if not 200 <= status_code < 300)
+        return elapsed, latencies, errors
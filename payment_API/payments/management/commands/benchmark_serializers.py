@@ -0,0 +1,51 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from payments.fast_serializers import FastPaymentSerializer, FastPaymentChargeSerializer
+from payments.models import Payment, PaymentCharge
+from payments.renderers import FastJSONRenderer
+from ._benchmark import throwaway_database
+import time
+
+
+class Command(BaseCommand):
+    help = "Compares ModelSerializer and fast-path serialization cost per row, in a throwaway database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help="Rows per page")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed iterations per serializer")
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        with throwaway_database():
+            Payment.objects.bulk_create([
+                Payment(customer_name=f"Customer {i}", amount=Decimal('19.99') + i, email=f"user{i}@example.com")
+                for i in range(rows)
+            ])
+            PaymentCharge.objects.bulk_create([
+                PaymentCharge(customer_name=f"Customer {i}", amount=Decimal('19.99') + i, email=f"user{i}@example.com",
+                              description="Service charge", tax=0.75)
+                for i in range(rows)
+            ])
+            for fast_class in (FastPaymentSerializer, FastPaymentChargeSerializer):
+                self.compare(fast_class, rows, options['repeat'])
+
+    def compare(self, fast_class, rows, repeat):
+        serializer_class = fast_class.serializer_class
+        model = serializer_class.Meta.model
+        fast = fast_class()
+        instances = list(model.objects.order_by('-transaction_id')[:rows])
+        values = list(fast.values(model.objects.order_by('-transaction_id'))[:rows])
+
+        classic = self.time(lambda: JSONRenderer().render(serializer_class(instances, many=True).data), repeat)
+        fast_time = self.time(lambda: FastJSONRenderer().render(fast.many(values)), repeat)
+        self.stdout.write(
+            f"{model.__name__:<14} classic {classic / rows * 1e6:7.2f} us/row   "
+            f"fast {fast_time / rows * 1e6:7.2f} us/row   ({classic / fast_time:.1f}x)"
+        )
+
+    def time(self, func, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - started) / repeat
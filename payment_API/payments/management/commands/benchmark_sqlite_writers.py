@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from payments.sqlite import pragma_statements
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+SCHEMA = [
+    "CREATE TABLE payment (id INTEGER PRIMARY KEY, status TEXT NOT NULL, version INTEGER NOT NULL DEFAULT 0)",
+    "CREATE TABLE transition (id INTEGER PRIMARY KEY, payment_id INTEGER NOT NULL, to_status TEXT NOT NULL)",
+    "CREATE TABLE webhook (id INTEGER PRIMARY KEY, reference TEXT UNIQUE NOT NULL)",
+]
+
+
+class Command(BaseCommand):
+    help = ("Compares concurrent SQLite writers on a scratch database file with the stock "
+            "rollback journal and with the SQLITE_JOURNAL_MODE and SQLITE_PRAGMAS profile")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help="Concurrent writer threads")
+        parser.add_argument('--operations', type=int, default=300, help="Write transactions per writer")
+        parser.add_argument('--rows', type=int, default=2000, help="Payments seeded before each run")
+        parser.add_argument('--timeout', type=float, default=5.0,
+                            help="sqlite3 connect timeout in seconds for the stock run (Django's default)")
+
+    def handle(self, *args, **options):
+        if not settings.SQLITE_PRAGMAS:
+            raise CommandError("SQLITE_TUNING is disabled, there is no profile to compare against")
+        runs = [
+            ('stock', dict(pragmas=[], begin='BEGIN', lock=None)),
+            ('tuned', dict(pragmas=[f"PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}"] + pragma_statements(),
+                           begin='BEGIN IMMEDIATE', lock=threading.Lock())),
+        ]
+        for label, config in runs:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                self._seed(path, options['rows'], config['pragmas'])
+                committed, errors, elapsed = self._run(path, options, **config)
+            attempts = committed + errors
+            self.stdout.write(
+                f"{label}: {committed / elapsed:8.1f} commits/s  "
+                f"lock errors {errors}/{attempts} ({100 * errors / attempts:.1f}%)  ({elapsed:.2f}s)"
+            )
+
+    def _connect(self, path, statements, timeout):
+        connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        for statement in statements:
+            connection.execute(statement)
+        return connection
+
+    def _seed(self, path, rows, statements):
+        connection = self._connect(path, statements, 5.0)
+        for statement in SCHEMA:
+            connection.execute(statement)
+        connection.execute("BEGIN")
+        connection.executemany("INSERT INTO payment (id, status) VALUES (?, 'PENDING')", ((i,) for i in range(1, rows + 1)))
+        connection.execute("COMMIT")
+        connection.close()
+
+    def _run(self, path, options, pragmas, begin, lock):
+        counts = {'committed': 0, 'errors': 0}
+        counts_lock = threading.Lock()
+
+        def writer(index):
+            # Same shape as a status transition: read the row, update it and
+            # record the change, plus a webhook-style insert
+            connection = self._connect(path, pragmas, options['timeout'])
+            rng = random.Random(index)
+            committed = errors = 0
+            for operation in range(options['operations']):
+                payment_id = rng.randint(1, options['rows'])
+                if lock is not None:
+                    lock.acquire()
+                try:
+                    connection.execute(begin)
+                    status, = connection.execute("SELECT status FROM payment WHERE id = ?", (payment_id,)).fetchone()
+                    connection.execute("UPDATE payment SET status = ?, version = version + 1 WHERE id = ?",
+                                       ('COMPLETED' if status == 'PENDING' else 'PENDING', payment_id))
+                    connection.execute("INSERT INTO transition (payment_id, to_status) VALUES (?, ?)", (payment_id, status))
+                    connection.execute("INSERT INTO webhook (reference) VALUES (?)", (f"ref-{index}-{operation}",))
+                    connection.execute("COMMIT")
+                    committed += 1
+                except sqlite3.OperationalError:
+                    if connection.in_transaction:
+                        connection.execute("ROLLBACK")
+                    errors += 1
+                finally:
+                    if lock is not None:
+                        lock.release()
+            connection.close()
+            with counts_lock:
+                counts['committed'] += committed
+                counts['errors'] += errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['writers']) as pool:
+            list(pool.map(writer, range(options['writers'])))
+        return counts['committed'], counts['errors'], time.perf_counter() - started
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router
+from payments.export import EXPORT_FORMATS, EXPORT_MODELS, iter_export
+from payments.filters import parse_date_bound
+from payments.routers import replica_reads
+from rest_framework.exceptions import ValidationError
+
+
+class Command(BaseCommand):
+    help = "Streams payments, refunds or charges to a CSV or NDJSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', choices=sorted(EXPORT_MODELS), help="Table to export")
+        parser.add_argument('--output', choices=sorted(EXPORT_FORMATS), default='csv', help="Export format")
+        parser.add_argument('--file', default='-', help="Destination file, '-' for stdout")
+        parser.add_argument('--created-after', help="ISO date or datetime (inclusive)")
+        parser.add_argument('--created-before', help="ISO date or datetime (inclusive)")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Rows fetched per cursor round-trip")
+
+    def handle(self, *args, **options):
+        model, fields = EXPORT_MODELS[options['table']]
+        with replica_reads():
+            queryset = model.objects.using(router.db_for_read(model))
+        try:
+            if options['created_after']:
+                queryset = queryset.filter(created_at__gte=parse_date_bound(options['created_after']))
+            if options['created_before']:
+                queryset = queryset.filter(created_at__lte=parse_date_bound(options['created_before'], end_of_day=True))
+        except ValidationError as e:
+            raise CommandError(e.detail['detail'])
+
+        rows = iter_export(queryset, fields, output=options['output'], chunk_size=options['chunk_size'])
+        if options['file'] == '-':
+            for row in rows:
+                self.stdout.write(row, ending='')
+            return
+        with open(options['file'], 'w', newline='', encoding='utf-8') as destination:
+            destination.writelines(rows)
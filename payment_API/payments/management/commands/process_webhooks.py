@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from payments.webhooks import drain_webhook_events
+import time
+
+
+class Command(BaseCommand):
+    help = "Applies queued Paystack webhook events to payments"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Events applied per transaction")
+        parser.add_argument('--loop', action='store_true', help="Keep polling the queue instead of exiting when empty")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to sleep between polls with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            handled = drain_webhook_events(batch_size=options['batch_size'])
+            if handled:
+                self.stdout.write(f"Processed {handled} webhook events")
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
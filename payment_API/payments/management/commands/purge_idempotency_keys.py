@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from payments.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = "Deletes stored Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Keys deleted per query")
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys(batch_size=options['batch_size'])
+        self.stdout.write(f"Deleted {deleted} expired idempotency keys")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from payments.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recomputes the payment summary rollups from the payment and refund tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Rows read per database round trip")
+
+    def handle(self, *args, **options):
+        written = rebuild_rollups(chunk_size=options['chunk_size'])
+        self.stdout.write(f"Wrote {written} rollup rows")
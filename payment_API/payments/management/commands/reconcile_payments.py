@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from payments.reconcile import reconcile_pending_payments
+
+
+class Command(BaseCommand):
+    help = "Verifies every pending payment with a Paystack reference and updates its status"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help="Concurrent Paystack verify calls")
+        parser.add_argument('--chunk-size', type=int, default=500, help="Payments verified and written per batch")
+        parser.add_argument('--limit', type=int, default=None, help="Maximum number of payments to check")
+
+    def handle(self, *args, **options):
+        results = reconcile_pending_payments(
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+            limit=options['limit'],
+        )
+        self.stdout.write(
+            f"Checked {results['checked']}: {results['completed']} completed, "
+            f"{results['failed']} failed, {results['errors']} errors"
+        )
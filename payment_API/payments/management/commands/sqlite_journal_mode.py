@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from payments.sqlite import set_journal_mode
+
+JOURNAL_MODES = ['DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF']
+
+
+class Command(BaseCommand):
+    help = ("Sets the journal mode of a SQLite database (SQLITE_JOURNAL_MODE by default). "
+            "The mode is stored in the database file, so this runs once per database")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help="Database alias")
+        parser.add_argument('--mode', type=str.upper, choices=JOURNAL_MODES, help="Journal mode to set")
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError(f"{options['database']} is not a SQLite database")
+        mode = options['mode'] or getattr(settings, 'SQLITE_JOURNAL_MODE', None)
+        if not mode:
+            raise CommandError("SQLITE_JOURNAL_MODE is not set; pass --mode")
+        self.stdout.write(f"{options['database']}: journal_mode = {set_journal_mode(connection, mode)}")
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_key', models.CharField(max_length=255, unique=True)),
+                ('event', models.CharField(max_length=100)),
+                ('reference', models.CharField(blank=True, db_index=True, max_length=255, null=True)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('RECEIVED', 'RECEIVED'), ('PROCESSED', 'PROCESSED'), ('FAILED', 'FAILED')], default='RECEIVED', max_length=10)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='webhook_event_queue_idx')],
+            },
+        ),
+    ]
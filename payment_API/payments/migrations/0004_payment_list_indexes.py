@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_payment_state_machine'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['-created_at', '-transaction_id'], name='payment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', '-created_at', '-transaction_id'], name='payment_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['email', '-created_at', '-transaction_id'], name='payment_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentcharge',
+            index=models.Index(fields=['-created_at', '-transaction_id'], name='paymentcharge_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentcharge',
+            index=models.Index(fields=['status', '-created_at', '-transaction_id'], name='paymentcharge_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentcharge',
+            index=models.Index(fields=['email', '-created_at', '-transaction_id'], name='paymentcharge_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymenthistory',
+            index=models.Index(fields=['-created_at', '-transaction_id'], name='paymenthistory_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymenthistory',
+            index=models.Index(fields=['status', '-created_at', '-transaction_id'], name='paymenthistory_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymenthistory',
+            index=models.Index(fields=['email', '-created_at', '-transaction_id'], name='paymenthistory_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentrefund',
+            index=models.Index(fields=['-created_at', '-transaction_id'], name='paymentrefund_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentrefund',
+            index=models.Index(fields=['status', '-created_at', '-transaction_id'], name='paymentrefund_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentrefund',
+            index=models.Index(fields=['email', '-created_at', '-transaction_id'], name='paymentrefund_email_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def split_notes(apps, schema_editor):
+    """
+    Moves each line of the old notes blob into its own PaymentHistoryNote row
+    """
+    PaymentHistory = apps.get_model('payments', 'PaymentHistory')
+    PaymentHistoryNote = apps.get_model('payments', 'PaymentHistoryNote')
+    batch = []
+    histories = PaymentHistory.objects.exclude(notes__isnull=True).exclude(notes='')
+    for history_id, notes in histories.values_list('pk', 'notes').iterator(chunk_size=2000):
+        for line in notes.split('\n'):
+            batch.append(PaymentHistoryNote(history_id=history_id, note=line))
+        if len(batch) >= 2000:
+            PaymentHistoryNote.objects.bulk_create(batch)
+            batch = []
+    PaymentHistoryNote.objects.bulk_create(batch)
+    # auto_now_add stamps the migration time; date migrated notes by their history's last update
+    PaymentHistoryNote.objects.update(created_at=Subquery(
+        PaymentHistory.objects.filter(pk=OuterRef('history_id')).values('updated_at')[:1]))
+
+
+def join_notes(apps, schema_editor):
+    PaymentHistory = apps.get_model('payments', 'PaymentHistory')
+    PaymentHistoryNote = apps.get_model('payments', 'PaymentHistoryNote')
+    notes = {}
+    for history_id, note in PaymentHistoryNote.objects.order_by('history_id', 'id').values_list('history_id', 'note'):
+        notes.setdefault(history_id, []).append(note)
+    for history_id, lines in notes.items():
+        PaymentHistory.objects.filter(pk=history_id).update(notes='\n'.join(lines))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_payment_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentHistoryNote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('note', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('history', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='history_notes', to='payments.paymenthistory')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['history', 'id'], name='payment_history_note_idx')],
+            },
+        ),
+        migrations.RunPython(split_notes, join_notes),
+        migrations.RemoveField(
+            model_name='paymenthistory',
+            name='notes',
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0005_payment_history_notes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_model', models.CharField(max_length=50)),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('PENDING', 'PENDING'), ('COMPLETED', 'COMPLETED'), ('FAILED', 'FAILED')], max_length=10)),
+                ('email_domain', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('payment_model', 'day', 'status', 'email_domain'), name='payment_rollup_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,69 @@
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import migrations, models
+import payments.money
+
+# Every money column becomes a BIGINT of minor units (kobo). Each column is
+# first widened so it can hold its values multiplied by 100, the values are
+# rescaled row by row in Python with exact Decimal arithmetic, and then the
+# column is switched to MoneyField.
+MONEY_FIELDS = [
+    ('payment', 'amount', 10, {}),
+    ('paymenthistory', 'amount', 10, {}),
+    ('paymentrefund', 'amount', 10, {}),
+    ('paymentcharge', 'amount', 10, {}),
+    ('paymentcharge', 'tax', 10, {'default': 0}),
+    ('paymentrollup', 'total_amount', 16, {'default': 0}),
+]
+WIDE_MAX_DIGITS = 20
+BATCH_SIZE = 1000
+
+
+def rescale(apps, scale):
+    for model_name, field_name, _, _ in MONEY_FIELDS:
+        model = apps.get_model('payments', model_name)
+        batch = []
+        for obj in model.objects.only('pk', field_name).iterator(chunk_size=BATCH_SIZE):
+            value = getattr(obj, field_name)
+            if value is None:
+                continue
+            value = (Decimal(str(value)) * scale).quantize(Decimal(1) if scale > 1 else Decimal('0.01'), ROUND_HALF_UP)
+            setattr(obj, field_name, value)
+            batch.append(obj)
+            if len(batch) == BATCH_SIZE:
+                model.objects.bulk_update(batch, [field_name])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, [field_name])
+
+
+def to_minor_units(apps, schema_editor):
+    rescale(apps, Decimal(100))
+
+
+def from_minor_units(apps, schema_editor):
+    rescale(apps, Decimal('0.01'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0006_payment_rollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name=model_name,
+            name=field_name,
+            field=models.DecimalField(decimal_places=2, max_digits=WIDE_MAX_DIGITS, **options),
+        )
+        for model_name, field_name, _, options in MONEY_FIELDS
+    ] + [
+        migrations.RunPython(to_minor_units, from_minor_units),
+    ] + [
+        migrations.AlterField(
+            model_name=model_name,
+            name=field_name,
+            field=payments.money.MoneyField(decimal_places=2, max_digits=max_digits, **options),
+        )
+        for model_name, field_name, max_digits, options in MONEY_FIELDS
+    ]
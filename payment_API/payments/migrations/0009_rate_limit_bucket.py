@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0008_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('tokens', models.FloatField()),
+                ('updated_at', models.FloatField(help_text='Unix time of the last refill')),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0010_webhook_event_retries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='principal',
+            field=models.CharField(default='', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='idempotencykey',
+            name='key',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name='idempotencykey',
+            constraint=models.UniqueConstraint(fields=('principal', 'key'), name='idempotency_key_per_principal'),
+        ),
+    ]
@@ -1,4 +1,12 @@
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, IntegrityError, models, transaction
+from django.db.models import ExpressionWrapper, F, Sum, Value
+from django.utils import timezone
+from decimal import Decimal
+from .cache import response_cache
+from .money import MoneyField, round_to_minor_unit
+from .sqlite import serialized_atomic
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,6 +18,12 @@ class PaymentOperationError(Exception):
     """
     pass
 
+class InvalidTransitionError(PaymentOperationError):
+    """
+    Raised when a status change is not allowed by the payment state machine
+    """
+    pass
+
 class BasePayment(models.Model):
     """
         Abstract model for payment operations
@@ -22,20 +36,99 @@ class BasePayment(models.Model):
 
     transaction_id = models.AutoField(primary_key=True)
     customer_name = models.CharField(max_length=55)
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    amount = MoneyField(max_digits=10, decimal_places=2)
     email = models.EmailField()
     status = models.CharField(max_length=10, choices=PAYMENT_STATUS, default='PENDING')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     paid = models.BooleanField(default=False)
-    
+    version = models.PositiveIntegerField(default=0)
+
+    # Allowed status changes: current status -> statuses it may move to
+    TRANSITIONS = {
+        'PENDING': ('COMPLETED', 'FAILED'),
+        'COMPLETED': (),
+        'FAILED': (),
+    }
+    # Whether transitions are counted in PaymentRollup
+    track_rollups = False
+    # Written only by transition_to and transition_queryset
+    STATE_FIELDS = ('status', 'paid', 'version')
 
     class Meta:
         abstract = True
+        # Keyset pagination and list filters scan these newest-first
+        indexes = [
+            models.Index(fields=['-created_at', '-transaction_id'], name='%(class)s_created_idx'),
+            models.Index(fields=['status', '-created_at', '-transaction_id'], name='%(class)s_status_idx'),
+            models.Index(fields=['email', '-created_at', '-transaction_id'], name='%(class)s_email_idx'),
+        ]
 
     def __str__(self):
         return f"{self.email} - {self.amount} - {self.status}"
     
+    def save(self, *args, **kwargs):
+        """
+        Saves the payment; updates of an existing row leave the state fields
+        alone, so saving a stale instance cannot undo a transition
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            skipped = set(self.STATE_FIELDS) | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+            ]
+        if self._state.adding or not self.rollup_fields_changed(kwargs.get('update_fields')):
+            super().save(*args, **kwargs)
+            return
+        # Move a settled row to its new bucket, from the stored values rather than this instance's
+        with serialized_atomic():
+            bucket = self.rollup_bucket()
+            super().save(*args, **kwargs)
+            if bucket is not None:
+                status, email, amount, day = bucket
+                new_email, new_amount = type(self)._default_manager.filter(pk=self.pk).values_list('email', 'amount').get()
+                if (new_email, new_amount) != (email, amount):
+                    PaymentRollup.record(self._meta.model_name, status, [(email, amount)], day, sign=-1)
+                    PaymentRollup.record(self._meta.model_name, status, [(new_email, new_amount)], day)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if cls.track_rollups:
+            # Lets save() skip the rollup check when the rollup fields were not changed
+            instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def rollup_fields_changed(self, update_fields=None):
+        """
+        Whether saving may change the rollup bucket of a settled row
+        """
+        if not self.track_rollups:
+            return False
+        loaded = getattr(self, '_loaded_values', {})
+        return any(
+            name not in loaded or getattr(self, name) != loaded[name]
+            for name in PaymentRollup.BUCKET_FIELDS if update_fields is None or name in update_fields
+        )
+
+    def rollup_bucket(self):
+        """
+        Returns (status, email, amount, day) of the rollup bucket the stored row
+        is counted in, or None if it is not settled; locks the row
+        Rows are bucketed like rebuild_rollups does: by the day of the
+        transition that settled them, or by updated_at before transitions were recorded
+        """
+        row = type(self)._default_manager.select_for_update().filter(pk=self.pk).values_list(
+            'status', 'email', 'amount', 'updated_at').first()
+        if row is None or row[0] not in PaymentRollup.SETTLED_STATUSES:
+            return None
+        status, email, amount, updated_at = row
+        settled_at = PaymentTransition.objects.filter(
+            payment_model=self._meta.model_name, object_id=self.pk, to_status=status
+        ).order_by('-id').values_list('created_at', flat=True).first()
+        return status, email, amount, timezone.localdate(settled_at or updated_at)
+
     def clean(self):
         """
         Validates the payment data before saving
@@ -48,36 +141,126 @@ class BasePayment(models.Model):
         if '@' not in self.email:
             raise ValueError("Invalid email format")
 
-    def mark_as_paid(self):
+    @classmethod
+    def source_statuses(cls, new_status):
+        """
+        Returns the statuses a payment may move to new_status from
+        Raises InvalidTransitionError if no status leads to new_status
+        """
+        sources = tuple(status for status, targets in cls.TRANSITIONS.items() if new_status in targets)
+        if not sources:
+            raise InvalidTransitionError(f"No transition leads to {new_status}")
+        return sources
+
+    def transition_to(self, new_status, paid, reason=None):
+        """
+        Moves the payment to new_status with a conditional UPDATE guarded by the
+        allowed source statuses, and records the transition in the same transaction
+        Returns True if the transition happened
+        """
+        manager = type(self)._default_manager
+        now = timezone.now()
+        with serialized_atomic():
+            for from_status in self.source_statuses(new_status):
+                rows = manager.filter(pk=self.pk, status=from_status)
+                if rows.update(status=new_status, paid=paid, updated_at=now, version=F('version') + 1):
+                    break
+            else:
+                return False
+            PaymentTransition.objects.create(
+                payment_model=self._meta.model_name,
+                object_id=self.pk,
+                from_status=from_status,
+                to_status=new_status,
+                reason=reason,
+            )
+            if self.track_rollups:
+                # The stored values, which this instance may not have caught up with
+                row = manager.filter(pk=self.pk).values_list('email', 'amount').get()
+                PaymentRollup.record(self._meta.model_name, new_status, [row], timezone.localdate(now))
+            response_cache.invalidate_on_commit(type(self), [self.pk])
+        self.status, self.paid, self.updated_at = new_status, paid, now
+        # Defer the field so the bumped value is loaded only if it is read
+        self.__dict__.pop('version', None)
+        return True
+
+    @classmethod
+    def transition_queryset(cls, queryset, new_status, paid, reason=None):
+        """
+        Applies a transition to every row of queryset still in an allowed source
+        status, locking the rows and recording one transition per row
+        Returns the number of rows moved
+        """
+        now = timezone.now()
+        moved = 0
+        with serialized_atomic():
+            for from_status in cls.source_statuses(new_status):
+                locked = list(
+                    queryset.select_for_update().filter(status=from_status).values_list('pk', 'email', 'amount')
+                )
+                if not locked:
+                    continue
+                rows = [pk for pk, _, _ in locked]
+                cls._default_manager.filter(pk__in=rows, status=from_status).update(
+                    status=new_status, paid=paid, updated_at=now, version=F('version') + 1)
+                PaymentTransition.objects.bulk_create([
+                    PaymentTransition(
+                        payment_model=cls._meta.model_name,
+                        object_id=pk,
+                        from_status=from_status,
+                        to_status=new_status,
+                        reason=reason,
+                    )
+                    for pk in rows
+                ])
+                if cls.track_rollups:
+                    PaymentRollup.record(
+                        cls._meta.model_name, new_status, [(email, amount) for _, email, amount in locked],
+                        timezone.localdate(now))
+                response_cache.invalidate_on_commit(cls, rows)
+                moved += len(rows)
+        return moved
+
+    def mark_as_paid(self, reason=None):
         """
         Marks the payment as paid and sets the status to 'COMPLETED'
-        Raises PaymentOperationError if the operation fails
+        Returns False if the payment was no longer pending
+        Raises PaymentOperationError if the operation fails; database errors
+        such as a lock timeout are raised unchanged so callers can retry
         """
         try:
-
-            self.paid = True
-            self.status = 'COMPLETED'
-            self.save()
-            logger.info(f"Payment {self.transaction_id} marked as paid")
+            transitioned = self.transition_to('COMPLETED', True, reason=reason)
+        except DatabaseError:
+            raise
         except Exception as e:
             logger.error(f"Error marking payment as paid: {e}")
             raise PaymentOperationError("Error marking payment as paid")
+        if transitioned:
+            logger.info(f"Payment {self.transaction_id} marked as paid")
+        else:
+            logger.info(f"Payment {self.transaction_id} is not pending, not marked as paid")
+        return transitioned
         
     
-    def mark_as_failed(self):
+    def mark_as_failed(self, reason=None):
         """
         Marks the payment as failed and sets the status to 'FAILED'
-        Raises PaymentOperationError if the operation fails
+        Returns False if the payment was no longer pending
+        Raises PaymentOperationError if the operation fails; database errors
+        such as a lock timeout are raised unchanged so callers can retry
         """
         try:
-
-            self.paid = False
-            self.status = 'FAILED'
-            self.save()
-            logger.error(f"Payment {self.transaction_id} marked as failed")
+            transitioned = self.transition_to('FAILED', False, reason=reason)
+        except DatabaseError:
+            raise
         except Exception as e:
             logger.error(f"Error marking payment as failed: {e}")
             raise PaymentOperationError("Error marking payment as failed")
+        if transitioned:
+            logger.error(f"Payment {self.transaction_id} marked as failed")
+        else:
+            logger.info(f"Payment {self.transaction_id} is not pending, not marked as failed")
+        return transitioned
         
     
 
@@ -89,8 +272,9 @@ class Payment(BasePayment):
 
 
     payment_reference = models.CharField(max_length=255, blank=True, null=True, unique=True)
+    track_rollups = True
 
-    class Meta:
+    class Meta(BasePayment.Meta):
         constraints = [
             models.CheckConstraint(
                 check=models.Q(amount__gt=0), name='payment_positive_amount'),
@@ -100,17 +284,18 @@ class Payment(BasePayment):
     def process_payment(self):
         """
         Processes the payment by marking it as paid
-        Returns True if the payment is processed successfully
+        Returns True if the payment is processed successfully, False if it was not pending
         Raises PaymentOperationError if the operation fails
         """
         try:
-            self.mark_as_paid()
-            logger.info(f"Payment {self.transaction_id} processed Successfully")
-            return True
-        except Exception as e:
+            processed = self.mark_as_paid()
+            if processed:
+                logger.info(f"Payment {self.transaction_id} processed Successfully")
+            return processed
+        except (PaymentOperationError, ValidationError, ValueError) as e:
             error_message = f"Payment {self.transaction_id} failed to process: {e}"
             logger.error(error_message)
-            self.mark_as_failed(error_message)
+            self.mark_as_failed(reason=error_message)
             raise PaymentOperationError(error_message)
   
 
@@ -124,24 +309,37 @@ class PaymentHistory(BasePayment):
     Tracks the history of a payment, includes notes
     """
     original_payment = models.ForeignKey(Payment, on_delete=models.CASCADE)
-    notes = models.TextField(blank=True, null=True)
 
     def add_note(self, note):
         """
-        Adds a note to the payment history
+        Appends a note to the payment history with a single INSERT
+        Returns the created PaymentHistoryNote
         Raises PaymentOperationError if the operation fails
         """
         try:
-            if self.notes:
-                self.notes += f"\n{note}"
-            else:
-                self.notes = note
-            self.save()
+            entry = PaymentHistoryNote.objects.create(history_id=self.pk, note=note)
             logger.info(f"Note added to payment {self.transaction_id}")
+            return entry
         except Exception as e:
             logger.error(f"Error adding note to payment {self.transaction_id}: {e}")
             raise PaymentOperationError(f"Error adding note to payment {self.transaction_id}: {e}")
 
+class PaymentHistoryNote(models.Model):
+    """
+    Append-only note attached to a payment history entry
+    """
+    history = models.ForeignKey(PaymentHistory, on_delete=models.CASCADE, related_name='history_notes')
+    note = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['history', 'id'], name='payment_history_note_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.history_id}: {self.note[:50]}"
+
 class PaymentRefund(BasePayment):
     """
     Handles refunds operations for existing payments
@@ -149,6 +347,7 @@ class PaymentRefund(BasePayment):
     original_payment = models.ForeignKey(Payment, on_delete=models.CASCADE)
     refund_reason = models.TextField(blank=True, null=True)
     refund_transaction_id = models.CharField(max_length=255, blank=True, null=True)
+    track_rollups = True
 
     def clean(self):
         """
@@ -162,17 +361,31 @@ class PaymentRefund(BasePayment):
     def process_refund(self):
         """
         Process the refund and mark it as paid
-        Returns True if the refund is processed successfully
+        The original payment row is locked so concurrent refunds for the same
+        payment are serialized and can never exceed its amount
+        Returns True if the refund is processed successfully, False if it was not pending
+        Only business-rule violations mark the refund as failed; database errors
+        such as a lock timeout propagate unchanged so the caller can retry
         """
         try:
-            self.full_clean()
-            self.mark_as_paid()
-            logger.info(f"Payment {self.transaction_id} refunded successfully")           
-            return True
-        except Exception as e:
+            with serialized_atomic():
+                self.original_payment = Payment.objects.select_for_update().get(pk=self.original_payment_id)
+                self.full_clean()
+                if self.original_payment.status != 'COMPLETED':
+                    raise PaymentOperationError("Original payment is not completed")
+                refunded = PaymentRefund.objects.filter(
+                    original_payment_id=self.original_payment_id, status='COMPLETED'
+                ).exclude(pk=self.pk).aggregate(total=Sum('amount'))['total'] or 0
+                if refunded + self.amount > self.original_payment.amount:
+                    raise PaymentOperationError("Total refunds cannot exceed the original payment amount")
+                processed = self.mark_as_paid()
+            if processed:
+                logger.info(f"Payment {self.transaction_id} refunded successfully")
+            return processed
+        except (PaymentOperationError, ValidationError, ValueError) as e:
             error_message = f"Payment {self.transaction_id} failed to process: {e}"
             logger.error(error_message)
-            self.mark_as_failed(error_message)
+            self.mark_as_failed(reason=error_message)
             raise PaymentOperationError(error_message)
         
 class PaymentCharge(BasePayment):
@@ -180,7 +393,7 @@ class PaymentCharge(BasePayment):
     Handles additional chargers with tax calcuklation
     """
     description = models.CharField(max_length=255)
-    tax = models.FloatField(default=0)
+    tax = MoneyField(max_digits=10, decimal_places=2, default=0)
 
     class meta:
         constraints = [
@@ -192,7 +405,29 @@ class PaymentCharge(BasePayment):
         """
         Calculates the total amount including tax
         """
-        return self.amount + self.tax
+        return round_to_minor_unit(self.amount) + round_to_minor_unit(self.tax)
+
+    @property
+    def total_amount(self):
+        return self.calculate_total()
+
+    @classmethod
+    def total_amount_expression(cls):
+        """
+        amount + tax computed by the database, in minor units
+        """
+        return ExpressionWrapper(F('amount') + F('tax'), output_field=cls._meta.get_field('amount'))
+
+    @classmethod
+    def calculate_totals(cls, pks):
+        """
+        Returns {pk: total amount} for many charges with one query
+        """
+        return dict(
+            cls.objects.filter(pk__in=pks)
+            .annotate(total=cls.total_amount_expression())
+            .values_list('pk', 'total')
+        )
     
     def validate_tax(self):
         """
@@ -204,6 +439,166 @@ class PaymentCharge(BasePayment):
     def save(self, *args, **kwargs):
         self.validate_tax()
         super().save(*args, **kwargs)
-        
 
 
+class WebhookEvent(models.Model):
+    """
+    Raw Paystack webhook deliveries, stored on receipt and applied by workers
+    event_key is unique so duplicate deliveries are only stored once
+    Events for a payment that is not saved yet stay RECEIVED and are retried
+    from next_attempt_at, with backoff, until they run out of attempts
+    """
+    EVENT_STATUS = (
+        ('RECEIVED', 'RECEIVED'),
+        ('PROCESSED', 'PROCESSED'),
+        ('FAILED', 'FAILED'),
+    )
+
+    event_key = models.CharField(max_length=255, unique=True)
+    event = models.CharField(max_length=100)
+    reference = models.CharField(max_length=255, blank=True, null=True, db_index=True)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=EVENT_STATUS, default='RECEIVED')
+    error = models.TextField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(blank=True, null=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='webhook_event_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event} - {self.reference} - {self.status}"
+
+
+class PaymentTransition(models.Model):
+    """
+    Append-only log of payment status changes, written in the same
+    transaction as the status update
+    """
+    payment_model = models.CharField(max_length=50)
+    object_id = models.IntegerField()
+    from_status = models.CharField(max_length=10, choices=BasePayment.PAYMENT_STATUS)
+    to_status = models.CharField(max_length=10, choices=BasePayment.PAYMENT_STATUS)
+    reason = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['payment_model', 'object_id'], name='payment_transition_obj_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.payment_model} {self.object_id}: {self.from_status} -> {self.to_status}"
+
+
+
+class PaymentRollup(models.Model):
+    """
+    Settled totals per model, day, status and payer email domain
+    Updated in the same transaction as each transition, amount or email edit
+    and delete of a settled row, and rebuilt from the ledger by the
+    rebuild_rollups command. Writes that bypass the model (queryset.update())
+    need a rebuild
+    """
+    SETTLED_STATUSES = ('COMPLETED', 'FAILED')
+    # Fields of a settled row that decide its bucket and total
+    BUCKET_FIELDS = ('email', 'amount')
+
+    payment_model = models.CharField(max_length=50)
+    day = models.DateField()
+    status = models.CharField(max_length=10, choices=BasePayment.PAYMENT_STATUS)
+    email_domain = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+    total_amount = MoneyField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['payment_model', 'day', 'status', 'email_domain'], name='payment_rollup_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.payment_model} {self.day} {self.status} {self.email_domain}: {self.count}"
+
+    @staticmethod
+    def email_domain_of(email):
+        return email.rsplit('@', 1)[-1].lower()
+
+    @classmethod
+    def record(cls, payment_model, status, rows, day, sign=1):
+        """
+        Adds (email, amount) rows to the rollup buckets for status on day,
+        or takes them out with sign=-1, dropping buckets that become empty
+        Runs one UPDATE per email domain, plus an INSERT for new buckets
+        """
+        buckets = {}
+        for email, amount in rows:
+            email_domain = cls.email_domain_of(email)
+            count, total = buckets.get(email_domain, (0, 0))
+            buckets[email_domain] = (count + sign, total + sign * Decimal(amount))
+
+        amount_field = cls._meta.get_field('total_amount')
+        for email_domain, (count, total) in buckets.items():
+            key = dict(payment_model=payment_model, day=day, status=status, email_domain=email_domain)
+            increment = dict(count=F('count') + count, total_amount=F('total_amount') + Value(total, output_field=amount_field))
+            if sign < 0:
+                cls.objects.filter(**key).update(**increment)
+                cls.objects.filter(count=0, **key).delete()
+                continue
+            if cls.objects.filter(**key).update(**increment):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(count=count, total_amount=total, **key)
+            except IntegrityError:
+                # Created by a concurrent transition since the UPDATE
+                cls.objects.filter(**key).update(**increment)
+
+
+class IdempotencyKey(models.Model):
+    """
+    Stored outcome of a mutating request made with an Idempotency-Key header
+    Keys are unique per principal (the user, or an anonymous client's address)
+    Rows expire after IDEMPOTENCY_KEY_TTL and are purged by purge_idempotency_keys
+    """
+    KEY_STATUS = (
+        ('PROCESSING', 'PROCESSING'),
+        ('COMPLETED', 'COMPLETED'),
+    )
+
+    principal = models.CharField(max_length=255, default='')
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=KEY_STATUS, default='PROCESSING')
+    response_status = models.PositiveSmallIntegerField(blank=True, null=True)
+    response_body = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    locked_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['principal', 'key'], name='idempotency_key_per_principal'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_key_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.principal} {self.key} - {self.status}"
+
+
+class RateLimitBucket(models.Model):
+    """
+    Token bucket shared by every worker that calls an outbound API
+    Refilled lazily from updated_at whenever a token is taken
+    """
+    name = models.CharField(max_length=100, unique=True)
+    tokens = models.FloatField()
+    updated_at = models.FloatField(help_text="Unix time of the last refill")
+
+    def __str__(self):
+        return f"{self.name}: {self.tokens:.2f} tokens"
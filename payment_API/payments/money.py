@@ -0,0 +1,53 @@
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import models
+
+# Amounts are stored, summed and sent to Paystack as integers in the
+# currency's minor unit (kobo); Python code and the API see 2-place Decimals.
+MINOR_UNIT_EXPONENT = 2
+MINOR_UNIT = Decimal(1).scaleb(-MINOR_UNIT_EXPONENT)
+
+
+def to_minor_units(value):
+    """
+    Converts a Decimal, int, float or numeric string to integer minor units
+    Raises ValueError if the value has fractions of a minor unit
+    """
+    amount = Decimal(str(value)) if isinstance(value, float) else Decimal(value)
+    minor = amount.scaleb(MINOR_UNIT_EXPONENT)
+    if minor != minor.to_integral_value():
+        raise ValueError(f"{value} is not a whole number of minor units")
+    return int(minor)
+
+
+def from_minor_units(value):
+    return Decimal(int(value)).scaleb(-MINOR_UNIT_EXPONENT)
+
+
+def round_to_minor_unit(value):
+    """
+    Rounds a Decimal, float or numeric string half-up to the minor unit
+    """
+    amount = Decimal(str(value)) if isinstance(value, float) else Decimal(value)
+    return amount.quantize(MINOR_UNIT, rounding=ROUND_HALF_UP)
+
+
+class MoneyField(models.DecimalField):
+    """
+    Decimal amount stored as a BIGINT number of minor units
+    Sums and arithmetic run on integers in the database, so totals are exact
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('decimal_places', MINOR_UNIT_EXPONENT)
+        super().__init__(*args, **kwargs)
+
+    def get_internal_type(self):
+        return 'BigIntegerField'
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else from_minor_units(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        return None if value is None else to_minor_units(value)
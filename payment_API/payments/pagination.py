@@ -0,0 +1,122 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset pagination over (created_at, transaction_id), newest first
+    Pages may hold model instances or .values() rows
+    Every page is a single indexed range scan with no COUNT(*) or OFFSET,
+    so deep pages cost the same as the first one
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-transaction_id')
+
+    def get_page_size(self, request):
+        page_size = api_settings.PAGE_SIZE or 10
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return page_size
+        return max(1, min(requested, self.max_page_size))
+
+    def encode_cursor(self, direction, instance):
+        if isinstance(instance, dict):
+            created_at, transaction_id = instance['created_at'], instance['transaction_id']
+        else:
+            created_at, transaction_id = instance.created_at, instance.transaction_id
+        raw = f"{direction}|{created_at.isoformat()}|{transaction_id}"
+        return urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            direction, created_at, transaction_id = urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8').split('|')
+            created_at = parse_datetime(created_at)
+            if direction not in ('n', 'p') or created_at is None:
+                raise ValueError
+            return direction, created_at, int(transaction_id)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound("Invalid cursor")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        if cursor is None:
+            direction = 'n'
+            page = list(queryset.order_by(*self.ordering)[:self.page_size + 1])
+        else:
+            direction, created_at, transaction_id = cursor
+            if direction == 'n':
+                page = list(queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, transaction_id__lt=transaction_id)
+                ).order_by(*self.ordering)[:self.page_size + 1])
+            else:
+                page = list(queryset.filter(
+                    Q(created_at__gt=created_at) | Q(created_at=created_at, transaction_id__gt=transaction_id)
+                ).order_by('created_at', 'transaction_id')[:self.page_size + 1])
+
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if direction == 'p':
+            page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = page
+        return page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor('n', self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor('p', self.page[0]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class NoteCursorPagination(CursorPagination):
+    """
+    Oldest-first cursor pagination for append-only history notes
+    """
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
@@ -1,5 +1,15 @@
+from asgiref.sync import sync_to_async
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from .money import to_minor_units
+from .resilience import CircuitBreaker, TokenBucket
+import asyncio
+import random
+import threading
+import weakref
 import hmac
 import hashlib
 import logging
@@ -8,10 +18,145 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+_session = None
+_session_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_paystack_session():
+    """
+    Returns the process-wide pooled session used for Paystack calls
+    Connections are kept alive and reused across requests
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def _build_session():
+    pool_size = getattr(settings, 'PAYSTACK_POOL_MAXSIZE', 10)
+    # Only verify is idempotent, so retries are limited to GET requests.
+    retry = Retry(
+        total=getattr(settings, 'PAYSTACK_MAX_RETRIES', 3),
+        backoff_factor=getattr(settings, 'PAYSTACK_BACKOFF_FACTOR', 0.3),
+        backoff_jitter=getattr(settings, 'PAYSTACK_BACKOFF_JITTER', 0.2),
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        "Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}",
+        "Content-Type": "application/json"
+    })
+    return session
+
+
+def reset_paystack_session():
+    """
+    Closes the pooled session so the next call builds a fresh one
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get_async_paystack_client():
+    """
+    Returns the pooled httpx.AsyncClient for the running event loop
+    One client is kept per loop so connections are reused across requests
+    """
+    try:
+        import httpx
+    except ImportError:
+        raise ImproperlyConfigured("httpx is required for the async Paystack client")
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        connect_timeout = getattr(settings, 'PAYSTACK_CONNECT_TIMEOUT', 3.05)
+        read_timeout = getattr(settings, 'PAYSTACK_READ_TIMEOUT', 10)
+        client = httpx.AsyncClient(
+            headers={
+                "Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}",
+                "Content-Type": "application/json"
+            },
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=getattr(settings, 'PAYSTACK_ASYNC_MAX_CONNECTIONS', 200),
+                max_keepalive_connections=getattr(settings, 'PAYSTACK_ASYNC_MAX_KEEPALIVE', 50),
+            ),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def is_paystack_outage(exc):
+    """
+    Whether a failed Paystack call counts against the circuit breaker
+    Client errors (4xx other than 429) mean Paystack is up and answering
+    """
+    status_code = getattr(getattr(exc, 'response', None), 'status_code', None)
+    return status_code is None or status_code >= 500 or status_code == 429
+
+
 class PaystackMixin:
     PAYSTACK_SECRET_KEY = settings.PAYSTACK_SECRET_KEY
     PAYSTACK_BASE_URL = "https://api.paystack.co"
 
+    def get_paystack_timeout(self):
+        """
+        Returns the (connect, read) timeout used for Paystack calls
+        """
+        return (
+            getattr(settings, 'PAYSTACK_CONNECT_TIMEOUT', 3.05),
+            getattr(settings, 'PAYSTACK_READ_TIMEOUT', 10),
+        )
+
+    def get_paystack_breaker(self):
+        """
+        Returns the circuit breaker shared by all Paystack calls
+        """
+        return CircuitBreaker(
+            'paystack',
+            failure_threshold=getattr(settings, 'PAYSTACK_BREAKER_FAILURES', 5),
+            recovery_timeout=getattr(settings, 'PAYSTACK_BREAKER_RECOVERY', 30),
+            probe_timeout=sum(self.get_paystack_timeout()),
+            cache_alias=getattr(settings, 'PAYSTACK_BREAKER_CACHE', 'default'),
+        )
+
+    def get_paystack_limiter(self):
+        """
+        Returns the token bucket limiting outbound Paystack calls across workers
+        """
+        return TokenBucket(
+            'paystack',
+            rate=getattr(settings, 'PAYSTACK_RATE_LIMIT', 0),
+            capacity=getattr(settings, 'PAYSTACK_RATE_BURST', None),
+            max_wait=getattr(settings, 'PAYSTACK_RATE_LIMIT_WAIT', 1.0),
+        )
+
+    def call_paystack(self, method, url, **kwargs):
+        """
+        Sends a request to Paystack through the circuit breaker and rate limiter
+        Raises ServiceUnavailableError without calling Paystack while the
+        breaker is open or no token frees up within PAYSTACK_RATE_LIMIT_WAIT
+        """
+        with self.get_paystack_breaker().guard(is_paystack_outage):
+            self.get_paystack_limiter().acquire()
+            response = get_paystack_session().request(method, url, timeout=self.get_paystack_timeout(), **kwargs)
+            response.raise_for_status()
+            return response.json()
+
     def initialize_payment(self, email, amount, callback_url=None):
         """
         Initializes a payment with Paystack
@@ -19,41 +164,27 @@ class PaystackMixin:
         try:
             url = f"{self.PAYSTACK_BASE_URL}/transaction/initialize"
 
-            headers = {
-                "Authorization": f"Bearer {self.PAYSTACK_SECRET_KEY}",
-                "Content-Type": "application/json"
-            }
-            amount_in_kobo = int(amount * 100)
-
             payload = {
                 "email": email,
-                "amount": amount_in_kobo,
+                "amount": to_minor_units(amount),
                 "callback_url": callback_url
             }
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            return response.json()
+            return self.call_paystack('POST', url, json=payload)
         except requests.exceptions.RequestException as e:
             logger.error(f"Paystack Initialization Error: {str(e)}")
             raise ValueError("Error initializing payment")
-    
+
     def verify_payment(self, reference):
         """
         Verifies a payment with Paystack
         """
         try:
             url = f"{self.PAYSTACK_BASE_URL}/transaction/verify/{reference}"
-            headers = {
-                "Authorization": f"Bearer {self.PAYSTACK_SECRET_KEY}",
-                "Content-Type": "application/json"
-            }
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            return response.json()
+            return self.call_paystack('GET', url)
         except requests.exceptions.RequestException as e:
             logger.error(f"Paystack Verification Error: {str(e)}")
             raise ValueError("Error verifying payment")
-        
+
     def verify_webhook_signature(self, payload, signature):
         """
         Verifies that the webhook is from Paystack
@@ -64,5 +195,67 @@ class PaystackMixin:
             hashlib.sha512
         ).hexdigest()
         return hmac.compare_digest(computed_hmac, signature)
-        
-    
\ No newline at end of file
+
+
+class AsyncPaystackMixin(PaystackMixin):
+    """
+    Async counterpart of PaystackMixin for ASGI views
+    """
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    async def call_paystack(self, method, url, retries=0, **kwargs):
+        """
+        Sends a request to Paystack through the circuit breaker and rate limiter
+        Retries transport errors and retryable statuses with jittered backoff
+        """
+        import httpx
+
+        backoff = getattr(settings, 'PAYSTACK_BACKOFF_FACTOR', 0.3)
+        jitter = getattr(settings, 'PAYSTACK_BACKOFF_JITTER', 0.2)
+        async with self.get_paystack_breaker().aguard(is_paystack_outage):
+            wait = await sync_to_async(self.get_paystack_limiter().reserve)()
+            if wait:
+                await asyncio.sleep(wait)
+            for attempt in range(retries + 1):
+                try:
+                    response = await get_async_paystack_client().request(method, url, **kwargs)
+                    if response.status_code in self.RETRY_STATUSES and attempt < retries:
+                        raise httpx.TransportError(f"Retryable status {response.status_code}")
+                    response.raise_for_status()
+                    return response.json()
+                except httpx.TransportError:
+                    if attempt >= retries:
+                        raise
+                    await asyncio.sleep(backoff * (2 ** attempt) + random.uniform(0, jitter))
+
+    async def initialize_payment(self, email, amount, callback_url=None):
+        """
+        Initializes a payment with Paystack
+        """
+        import httpx
+
+        try:
+            url = f"{self.PAYSTACK_BASE_URL}/transaction/initialize"
+            payload = {
+                "email": email,
+                "amount": to_minor_units(amount),
+                "callback_url": callback_url
+            }
+            return await self.call_paystack('POST', url, json=payload)
+        except httpx.HTTPError as e:
+            logger.error(f"Paystack Initialization Error: {str(e)}")
+            raise ValueError("Error initializing payment")
+
+    async def verify_payment(self, reference):
+        """
+        Verifies a payment with Paystack
+        Retries with jittered backoff since verification is idempotent
+        """
+        import httpx
+
+        try:
+            url = f"{self.PAYSTACK_BASE_URL}/transaction/verify/{reference}"
+            return await self.call_paystack('GET', url, retries=getattr(settings, 'PAYSTACK_MAX_RETRIES', 3))
+        except httpx.HTTPError as e:
+            logger.error(f"Paystack Verification Error: {str(e)}")
+            raise ValueError("Error verifying payment")
@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from .models import Payment
+from .paystack import PaystackMixin
+from .sqlite import serialized_atomic
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Paystack transaction statuses that are final failures; anything else
+# other than "success" (ongoing, pending, queued...) is left as PENDING.
+FAILED_PAYSTACK_STATUSES = ('failed', 'abandoned', 'reversed')
+
+
+def _verify(client, reference):
+    try:
+        return reference, client.verify_payment(reference)['data']['status']
+    except Exception as e:
+        logger.error(f"Error verifying payment {reference}: {e}")
+        return reference, None
+
+
+def reconcile_pending_payments(queryset=None, workers=None, chunk_size=500, limit=None, client=None):
+    """
+    Verifies pending payments against Paystack concurrently and writes the
+    status changes back in batched UPDATEs, one chunk at a time
+    Returns a dict with the number of payments checked, completed, failed and errored
+    """
+    if queryset is None:
+        queryset = Payment.objects.all()
+    if workers is None:
+        workers = getattr(settings, 'PAYSTACK_POOL_MAXSIZE', 10)
+    client = client or PaystackMixin()
+
+    pending = queryset.filter(status='PENDING', payment_reference__isnull=False).exclude(payment_reference='')
+    results = {'checked': 0, 'completed': 0, 'failed': 0, 'errors': 0}
+    last_pk = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while limit is None or results['checked'] < limit:
+            size = chunk_size if limit is None else min(chunk_size, limit - results['checked'])
+            chunk = list(
+                pending.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('transaction_id', 'payment_reference')[:size]
+            )
+            if not chunk:
+                break
+            last_pk = chunk[-1][0]
+            results['checked'] += len(chunk)
+
+            statuses = dict(pool.map(lambda row: _verify(client, row[1]), chunk))
+            completed_ids, failed_ids = [], []
+            for pk, reference in chunk:
+                paystack_status = statuses[reference]
+                if paystack_status is None:
+                    results['errors'] += 1
+                elif paystack_status == 'success':
+                    completed_ids.append(pk)
+                elif paystack_status in FAILED_PAYSTACK_STATUSES:
+                    failed_ids.append(pk)
+
+            # One batched transition per outcome, so rows already moved on by a
+            # webhook or a manual verify in the meantime are left untouched.
+            with serialized_atomic():
+                results['completed'] += Payment.transition_queryset(
+                    Payment.objects.filter(pk__in=completed_ids), 'COMPLETED', True, reason="Paystack reconciliation")
+                results['failed'] += Payment.transition_queryset(
+                    Payment.objects.filter(pk__in=failed_ids), 'FAILED', False, reason="Paystack reconciliation")
+            logger.info(f"Reconciled {len(completed_ids) + len(failed_ids)} of {len(chunk)} pending payments up to {last_pk}")
+
+    return results
@@ -0,0 +1,179 @@
+from asgiref.sync import sync_to_async
+from contextlib import asynccontextmanager, contextmanager
+from django.core.cache import caches
+from .models import RateLimitBucket
+from .sqlite import serialized_atomic
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceUnavailableError(ValueError):
+    """
+    Raised instead of calling an outbound API that is failing or rate limited
+    retry_after is the number of seconds the caller should wait
+    """
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker whose state lives in a Django cache,
+    so it is shared by every worker using the same cache
+    After failure_threshold failures in a row the breaker opens and calls fail
+    fast for recovery_timeout seconds; then one probe call is let through
+    (half-open) and its outcome closes or re-opens the breaker
+    """
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30, probe_timeout=15, cache_alias='default'):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.probe_timeout = probe_timeout
+        self.cache = caches[cache_alias]
+        self.failures_key = f'breaker:{name}:failures'
+        self.opened_key = f'breaker:{name}:opened_at'
+        self.probe_key = f'breaker:{name}:probe'
+
+    @property
+    def state(self):
+        opened_at = self.cache.get(self.opened_key)
+        if opened_at is None:
+            return 'closed'
+        return 'open' if time.time() < opened_at + self.recovery_timeout else 'half-open'
+
+    def before_call(self):
+        """
+        Raises ServiceUnavailableError while the breaker is open
+        Returns a call token: None when closed, or 'probe' for the one
+        half-open call allowed through, else the failure count seen
+        """
+        state = self.cache.get_many([self.opened_key, self.failures_key])
+        opened_at = state.get(self.opened_key)
+        if opened_at is None:
+            return state.get(self.failures_key, 0)
+        remaining = opened_at + self.recovery_timeout - time.time()
+        if remaining > 0:
+            raise ServiceUnavailableError(f"{self.name} is unavailable", retry_after=remaining)
+        if not self.cache.add(self.probe_key, 1, timeout=self.probe_timeout):
+            raise ServiceUnavailableError(f"{self.name} is unavailable", retry_after=1)
+        return 'probe'
+
+    def record_success(self, token):
+        if token == 'probe':
+            self.cache.delete_many([self.opened_key, self.failures_key, self.probe_key])
+            logger.info(f"Circuit breaker {self.name} closed")
+        elif token:
+            self.cache.delete(self.failures_key)
+
+    def record_failure(self, token):
+        if token == 'probe':
+            self.cache.set(self.opened_key, time.time(), timeout=None)
+            self.cache.delete(self.probe_key)
+            logger.warning(f"Circuit breaker {self.name} probe failed, re-opened")
+            return
+        self.cache.add(self.failures_key, 0, timeout=None)
+        try:
+            failures = self.cache.incr(self.failures_key)
+        except ValueError:
+            # Evicted between add and incr
+            failures = 1
+            self.cache.set(self.failures_key, failures, timeout=None)
+        if failures >= self.failure_threshold and self.cache.add(self.opened_key, time.time(), timeout=None):
+            self.cache.delete(self.failures_key)
+            logger.warning(f"Circuit breaker {self.name} opened after {failures} consecutive failures")
+
+    def release(self, token):
+        """
+        Ends a call that never reached the service, without recording an outcome
+        """
+        if token == 'probe':
+            self.cache.delete(self.probe_key)
+
+    @contextmanager
+    def guard(self, is_failure=lambda exc: True):
+        """
+        Wraps one call to the service
+        Exceptions are recorded as failures unless is_failure(exc) is false;
+        ServiceUnavailableError raised inside the block records nothing
+        """
+        token = self.before_call()
+        try:
+            yield
+        except ServiceUnavailableError:
+            self.release(token)
+            raise
+        except Exception as exc:
+            if is_failure(exc):
+                self.record_failure(token)
+            else:
+                self.record_success(token)
+            raise
+        self.record_success(token)
+
+    @asynccontextmanager
+    async def aguard(self, is_failure=lambda exc: True):
+        """
+        guard() for async callers
+        The cache calls run through sync_to_async so a remote cache never
+        blocks the event loop
+        """
+        token = await sync_to_async(self.before_call)()
+        try:
+            yield
+        except ServiceUnavailableError:
+            await sync_to_async(self.release)(token)
+            raise
+        except Exception as exc:
+            await sync_to_async(self.record_failure if is_failure(exc) else self.record_success)(token)
+            raise
+        await sync_to_async(self.record_success)(token)
+
+    def reset(self):
+        self.cache.delete_many([self.opened_key, self.failures_key, self.probe_key])
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter stored in a RateLimitBucket row, so the rate is
+    enforced across all workers sharing the database
+    Holds up to capacity tokens and refills at rate tokens per second
+    """
+
+    def __init__(self, name, rate, capacity=None, max_wait=1.0):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.max_wait = max_wait
+
+    def reserve(self):
+        """
+        Takes one token, borrowing against the refill if the bucket is empty
+        Returns the seconds the caller must wait before using it, or raises
+        ServiceUnavailableError if that would be longer than max_wait
+        """
+        if not self.rate:
+            return 0
+        now = time.time()
+        with serialized_atomic():
+            bucket, created = RateLimitBucket.objects.select_for_update().get_or_create(
+                name=self.name, defaults={'tokens': self.capacity, 'updated_at': now})
+            elapsed = max(0.0, now - bucket.updated_at)
+            tokens = min(self.capacity, bucket.tokens + elapsed * self.rate) - 1
+            wait = -tokens / self.rate if tokens < 0 else 0
+            if wait > self.max_wait:
+                raise ServiceUnavailableError(f"{self.name} rate limit reached", retry_after=wait)
+            RateLimitBucket.objects.filter(pk=bucket.pk).update(tokens=tokens, updated_at=max(now, bucket.updated_at))
+        return wait
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    def reset(self):
+        RateLimitBucket.objects.filter(name=self.name).delete()
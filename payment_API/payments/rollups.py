@@ -0,0 +1,139 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Payment, PaymentRefund, PaymentRollup, PaymentTransition
+from .sqlite import serialized_atomic
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Models counted in PaymentRollup, by their key in the summary response
+ROLLUP_MODELS = {
+    'payments': Payment,
+    'refunds': PaymentRefund,
+}
+SETTLED_STATUSES = PaymentRollup.SETTLED_STATUSES
+CENTS = Decimal('0.01')
+
+
+def lock_ledger_tables():
+    """
+    Blocks writes to the ledger tables until the current transaction ends
+    SQLite transactions are already serializable: a write that lands after the
+    ledger was read makes this transaction's own write fail. Elsewhere SHARE
+    ROW EXCLUSIVE waits for in-flight writers to commit and conflicts with the
+    ROW EXCLUSIVE lock every later UPDATE, INSERT and DELETE takes
+    """
+    connection = transaction.get_connection()
+    if connection.vendor == 'sqlite':
+        return
+    tables = ", ".join(connection.ops.quote_name(model._meta.db_table) for model in ROLLUP_MODELS.values())
+    with connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {tables} IN SHARE ROW EXCLUSIVE MODE")
+
+
+def rebuild_rollups(chunk_size=2000):
+    """
+    Recomputes PaymentRollup from the ledger tables in one transaction
+    Rows are bucketed by the day of the transition that settled them, or by
+    updated_at for rows settled before transitions were recorded
+    Returns the number of rollup rows written
+    """
+    buckets = {}
+    # The ledger is read inside the transaction with writers locked out, so
+    # no transition can land between the read and the swap
+    with serialized_atomic():
+        lock_ledger_tables()
+        for model in ROLLUP_MODELS.values():
+            model_name = model._meta.model_name
+            settled_at = Subquery(
+                PaymentTransition.objects.filter(
+                    payment_model=model_name, object_id=OuterRef('pk'), to_status=OuterRef('status')
+                ).order_by('-id').values('created_at')[:1]
+            )
+            rows = (
+                model.objects.filter(status__in=SETTLED_STATUSES)
+                .annotate(settled_at=Coalesce(settled_at, 'updated_at'))
+                .values_list('status', 'email', 'amount', 'settled_at')
+            )
+            for status, email, amount, when in rows.iterator(chunk_size=chunk_size):
+                key = (model_name, timezone.localdate(when), status, PaymentRollup.email_domain_of(email))
+                count, total = buckets.get(key, (0, 0))
+                buckets[key] = (count + 1, total + amount)
+
+        PaymentRollup.objects.all().delete()
+        PaymentRollup.objects.bulk_create([
+            PaymentRollup(payment_model=model_name, day=day, status=status, email_domain=email_domain,
+                          count=count, total_amount=total)
+            for (model_name, day, status, email_domain), (count, total) in buckets.items()
+        ], batch_size=1000)
+    logger.info(f"Rebuilt {len(buckets)} payment rollup rows")
+    return len(buckets)
+
+
+def remove_from_rollups(sender, instance, **kwargs):
+    """
+    pre_delete receiver taking a settled payment or refund out of its rollup bucket
+    """
+    bucket = instance.rollup_bucket()
+    if bucket is not None:
+        status, email, amount, day = bucket
+        PaymentRollup.record(sender._meta.model_name, status, [(email, amount)], day, sign=-1)
+
+
+def _amount(value):
+    return f"{Decimal(value).quantize(CENTS):f}"
+
+
+def _ratio(numerator, denominator):
+    return float(numerator / denominator) if denominator else None
+
+
+def payment_summary(start=None, end=None):
+    """
+    Settled totals by status, day and email domain for payments and refunds,
+    plus the refund ratio and failure rate, read from PaymentRollup
+    start and end are inclusive dates
+    """
+    rollups = PaymentRollup.objects.all()
+    if start:
+        rollups = rollups.filter(day__gte=start)
+    if end:
+        rollups = rollups.filter(day__lte=end)
+
+    summary = {
+        key: {'by_status': {}, 'by_day': [], 'by_email_domain': []}
+        for key in ROLLUP_MODELS
+    }
+    keys = {model._meta.model_name: key for key, model in ROLLUP_MODELS.items()}
+    totals = {key: {} for key in ROLLUP_MODELS}
+
+    def grouped(*fields):
+        return (
+            rollups.values('payment_model', *fields)
+            .annotate(count_sum=Sum('count'), amount_sum=Sum('total_amount'))
+            .order_by('payment_model', *fields)
+        )
+
+    for row in grouped('status'):
+        key = keys[row['payment_model']]
+        summary[key]['by_status'][row['status']] = {
+            'count': row['count_sum'], 'total_amount': _amount(row['amount_sum'])}
+        totals[key][row['status']] = (row['count_sum'], row['amount_sum'])
+    for row in grouped('day', 'status'):
+        summary[keys[row['payment_model']]]['by_day'].append({
+            'day': row['day'].isoformat(), 'status': row['status'],
+            'count': row['count_sum'], 'total_amount': _amount(row['amount_sum'])})
+    for row in grouped('email_domain', 'status'):
+        summary[keys[row['payment_model']]]['by_email_domain'].append({
+            'email_domain': row['email_domain'], 'status': row['status'],
+            'count': row['count_sum'], 'total_amount': _amount(row['amount_sum'])})
+
+    completed_count, completed_amount = totals['payments'].get('COMPLETED', (0, 0))
+    failed_count, _ = totals['payments'].get('FAILED', (0, 0))
+    _, refunded_amount = totals['refunds'].get('COMPLETED', (0, 0))
+    summary['refund_ratio'] = _ratio(refunded_amount, completed_amount)
+    summary['failure_rate'] = _ratio(failed_count, completed_count + failed_count)
+    return summary
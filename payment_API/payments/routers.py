@@ -0,0 +1,40 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+
+REPLICA_ALIAS = 'replica'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads():
+    """
+    Sends reads made inside the block to the replica, when one is configured
+    """
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Writes, status transitions and any read outside replica_reads() go to the
+    primary; read-only list/retrieve/export paths opt in to the replica
+    """
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and REPLICA_ALIAS in settings.DATABASES:
+            return REPLICA_ALIAS
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -1,7 +1,25 @@
-from .models import Payment, PaymentHistory, PaymentRefund, PaymentCharge
+from .models import Payment, PaymentHistory, PaymentHistoryNote, PaymentRefund, PaymentCharge
 from rest_framework import serializers
 
 
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Resolves primary keys from objects prefetched into the serializer context
+    (context['prefetched'][field_name]) before falling back to a query
+    Lets bulk requests resolve every related object with one query
+    """
+    def to_internal_value(self, data):
+        prefetched = self.context.get('prefetched', {}).get(self.field_name)
+        if prefetched is not None and not isinstance(data, bool):
+            try:
+                obj = prefetched.get(int(data))
+            except (TypeError, ValueError):
+                obj = None
+            if obj is not None:
+                return obj
+        return super().to_internal_value(data)
+
+
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
@@ -18,6 +36,9 @@ class PaymentSerializer(serializers.ModelSerializer):
     
             
 class PaymentHistorySerializer(serializers.ModelSerializer):
+    # Initial note on create; notes are read through the notes/ action
+    notes = serializers.CharField(write_only=True, required=False, allow_blank=True)
+
     class Meta:
         model = PaymentHistory
         fields = ['transaction_id', 'amount','customer_name', 'email', 'status', 'created_at',
@@ -25,12 +46,35 @@ class PaymentHistorySerializer(serializers.ModelSerializer):
         read_only_fields = ['transaction_id', 'status', 'paid', 'created_at', 'updated_at']
 
     def validate(self, data):
-        if 'original_payment' not in data:
+        if 'original_payment' not in data and self.instance is None:
             raise serializers.ValidationError("Original payment is required")
         return data
 
+    def create(self, validated_data):
+        notes = validated_data.pop('notes', None)
+        history = super().create(validated_data)
+        if notes:
+            history.add_note(notes)
+        return history
+
+    def update(self, instance, validated_data):
+        notes = validated_data.pop('notes', None)
+        instance = super().update(instance, validated_data)
+        if notes:
+            instance.add_note(notes)
+        return instance
+
+
+class PaymentHistoryNoteSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PaymentHistoryNote
+        fields = ['id', 'note', 'created_at']
+        read_only_fields = fields
+
 
 class PaymentRefundSerializer(serializers.ModelSerializer):
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+
     class Meta:
         model = PaymentRefund
         fields = ['transaction_id', 'amount', 'email','customer_name', 'status', 'created_at', 
@@ -40,14 +84,19 @@ class PaymentRefundSerializer(serializers.ModelSerializer):
 
     
     def validate(self, data):
-        if data['amount'] > data['original_payment'].amount:
+        # On partial updates fall back to the instance, whose original_payment
+        # is already loaded by the viewset's select_related
+        amount = data.get('amount', getattr(self.instance, 'amount', None))
+        original_payment = data.get('original_payment') or getattr(self.instance, 'original_payment', None)
+        if amount is not None and original_payment is not None and amount > original_payment.amount:
             raise serializers.ValidationError(
                 "Refund amount cannot be greater than original payment amount"
             )
         return data
 
 class PaymentChargeSerializer(serializers.ModelSerializer):
-    total_amount = serializers.FloatField(read_only=True)
+    total_amount = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
     class Meta:
         model = PaymentCharge
         fields = ['transaction_id', 'amount', 'email','customer_name', 'status', 'created_at', 
@@ -58,10 +107,5 @@ class PaymentChargeSerializer(serializers.ModelSerializer):
         if value < 0:
             raise serializers.ValidationError("Tax cannot be negative")
         return value
-    
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        representation['total_amount'] = instance.calculate_total()
-        return representation
 
     
@@ -0,0 +1,80 @@
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import OperationalError, transaction
+import threading
+
+# SQLite allows one writer per database file. The profile below makes writers
+# wait for each other (WAL, busy_timeout, BEGIN IMMEDIATE) instead of failing
+# with "database is locked", and serialized_atomic() queues this process's
+# writers on a lock so they do not spin in SQLite's busy handler.
+# WAL is a property of the database file and is switched on by the
+# sqlite_journal_mode command; connections only get the per-connection pragmas.
+
+_write_locks = {}
+_write_locks_guard = threading.Lock()
+
+
+def pragma_statements(pragmas=None):
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {}) if pragmas is None else pragmas
+    return [f"PRAGMA {name} = {value}" for name, value in pragmas.items()]
+
+
+def apply_sqlite_profile(sender, connection, **kwargs):
+    """
+    connection_created receiver applying SQLITE_PRAGMAS to new SQLite connections
+    """
+    if connection.vendor != 'sqlite':
+        return
+    statements = pragma_statements()
+    if not statements:
+        return
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def set_journal_mode(connection, mode=None):
+    """
+    Switches a SQLite database to mode (SQLITE_JOURNAL_MODE by default)
+    Returns the journal mode in effect, which stays 'memory' for in-memory databases
+    """
+    mode = mode or getattr(settings, 'SQLITE_JOURNAL_MODE', None)
+    with connection.cursor() as cursor:
+        cursor.execute(f"PRAGMA journal_mode = {mode}" if mode else "PRAGMA journal_mode")
+        return cursor.fetchone()[0]
+
+
+def get_write_lock(alias):
+    """
+    Returns the in-process write lock for a database alias
+    """
+    lock = _write_locks.get(alias)
+    if lock is None:
+        with _write_locks_guard:
+            lock = _write_locks.setdefault(alias, threading.Lock())
+    return lock
+
+
+@contextmanager
+def serialized_atomic(using=None):
+    """
+    transaction.atomic() that, on SQLite, first takes the alias's write lock
+    Only the outermost block waits on the lock; nested blocks run as savepoints
+    Raises OperationalError if the lock is not free within busy_timeout
+    """
+    connection = transaction.get_connection(using)
+    if (connection.vendor != 'sqlite' or connection.in_atomic_block
+            or not getattr(settings, 'SQLITE_SERIALIZE_WRITES', False)):
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    lock = get_write_lock(connection.alias)
+    timeout = getattr(settings, 'SQLITE_PRAGMAS', {}).get('busy_timeout', 5000) / 1000
+    if not lock.acquire(timeout=timeout):
+        raise OperationalError("database is locked")
+    try:
+        with transaction.atomic(using=using):
+            yield
+    finally:
+        lock.release()
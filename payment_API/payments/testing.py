@@ -0,0 +1,225 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import hmac
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+
+# Webhook event sent when a transaction settles with each status
+SETTLED_EVENTS = {
+    'success': 'charge.success',
+    'failed': 'charge.failed',
+}
+
+
+class _FakePaystackHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without TCP_NODELAY the
+    # body waits on the client's delayed ACK and adds ~40 ms per call
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _inject_failure(self):
+        """
+        Applies the server's latency and sends an injected error response if one is due
+        """
+        status = self.server.next_failure()
+        time.sleep(self.server.latency)
+        if status:
+            self._send_json({"status": False, "message": "Injected failure"}, status=status)
+        return status
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        data = json.loads(self.rfile.read(length) or b"{}")
+        if self._inject_failure():
+            return
+        if self.path.rstrip('/') != "/transaction/initialize":
+            return self._send_json({"status": False, "message": "Not found"}, status=404)
+        reference = uuid.uuid4().hex
+        self.server.add_transaction(reference, data)
+        self._send_json({
+            "status": True,
+            "message": "Authorization URL created",
+            "data": {
+                "authorization_url": f"https://checkout.paystack.com/{reference}",
+                "access_code": reference[:12],
+                "reference": reference,
+                "amount": data.get("amount"),
+            }
+        })
+
+    def do_GET(self):
+        if self._inject_failure():
+            return
+        prefix = "/transaction/verify/"
+        if not self.path.startswith(prefix):
+            return self._send_json({"status": False, "message": "Not found"}, status=404)
+        reference = self.path[len(prefix):]
+        transaction = self.server.transactions.get(reference)
+        if transaction is None:
+            if self.server.unknown_status is None:
+                return self._send_json({"status": False, "message": "Transaction reference not found"}, status=400)
+            transaction = {"reference": reference, "status": self.server.unknown_status}
+        self._send_json({
+            "status": True,
+            "message": "Verification successful",
+            "data": transaction
+        })
+
+
+class _FakePaystackHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # Clients that gave up on a slow response have closed the connection
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def next_failure(self):
+        with self.lock:
+            self.calls += 1
+            if self.failures_left:
+                self.failures_left -= 1
+                return self.failure_status
+            if self.error_rate and random.random() < self.error_rate:
+                return self.failure_status
+        return None
+
+    def add_transaction(self, reference, data, status="ongoing"):
+        with self.lock:
+            self.transactions[reference] = {
+                "id": next(self.ids),
+                "reference": reference,
+                "amount": data.get("amount"),
+                "customer": {"email": data.get("email")},
+                "status": status,
+            }
+
+
+class FakePaystackServer:
+    """
+    Local stand-in for the Paystack API used by benchmarks and tests
+    Serves /transaction/initialize and /transaction/verify/{reference}
+    latency, error_rate and fail_next() inject slow responses and errors
+    References it did not issue verify with unknown_status, or are not
+    found (400, as Paystack answers) when unknown_status is None
+    settle() completes a transaction and builds the webhook Paystack would
+    send for it, signed with secret_key, posting it to webhook_url if set
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0, failure_status=503,
+                 secret_key=None, webhook_url=None, unknown_status="success"):
+        self.httpd = _FakePaystackHTTPServer((host, port), _FakePaystackHandler)
+        self.httpd.lock = threading.Lock()
+        self.httpd.latency = latency
+        self.httpd.error_rate = error_rate
+        self.httpd.failure_status = failure_status
+        self.httpd.failures_left = 0
+        self.httpd.calls = 0
+        self.httpd.transactions = {}
+        self.httpd.ids = itertools.count(1)
+        self.httpd.unknown_status = unknown_status
+        self.secret_key = secret_key
+        self.webhook_url = webhook_url
+        self._thread = None
+
+    @property
+    def latency(self):
+        return self.httpd.latency
+
+    @latency.setter
+    def latency(self, value):
+        self.httpd.latency = value
+
+    @property
+    def calls(self):
+        """
+        Number of requests received, including injected failures
+        """
+        return self.httpd.calls
+
+    def fail_next(self, count, status=None):
+        """
+        Answers the next count requests with status (default failure_status)
+        """
+        with self.httpd.lock:
+            self.httpd.failures_left = count
+            if status is not None:
+                self.httpd.failure_status = status
+
+    def add_transaction(self, reference, amount=None, email=None, status="ongoing"):
+        """
+        Registers a transaction as if it had been initialized, in any Paystack status
+        """
+        self.httpd.add_transaction(reference, {"amount": amount, "email": email}, status=status)
+
+    def sign(self, body):
+        """
+        HMAC-SHA512 of the raw body, as sent in the x-paystack-signature header
+        """
+        if self.secret_key is None:
+            raise ValueError("secret_key is required to sign webhooks")
+        return hmac.new(self.secret_key.encode('utf-8'), body, hashlib.sha512).hexdigest()
+
+    def settle(self, reference, status="success"):
+        """
+        Sets the status verify reports for reference and returns the signed
+        webhook for it as (body, signature)
+        """
+        with self.httpd.lock:
+            transaction = self.httpd.transactions[reference]
+            transaction["status"] = status
+            body = json.dumps({"event": SETTLED_EVENTS[status], "data": transaction}).encode('utf-8')
+        signature = self.sign(body)
+        if self.webhook_url:
+            self.send_webhook(body, signature)
+        return body, signature
+
+    def send_webhook(self, body, signature):
+        """
+        Posts a signed webhook to webhook_url and returns the response status
+        """
+        request = urllib.request.Request(self.webhook_url, data=body, method="POST", headers={
+            "Content-Type": "application/json",
+            "x-paystack-signature": signature,
+        })
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,1339 @@
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+import csv
+import hashlib
+import hmac
+import json
+import sqlite3
+import tempfile
+import threading
+import time
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from ..cache import LRUCache, ResponseCache, response_cache
+from .. import async_views
+from ..export import EXPORT_MODELS
+from ..testing import FakePaystackServer
+from ..fast_serializers import (
+    FastPaymentChargeSerializer, FastPaymentHistorySerializer, FastPaymentRefundSerializer, FastPaymentSerializer,
+)
+from ..money import to_minor_units
+from ..paystack import PaystackMixin, get_paystack_session, reset_paystack_session
+from ..reconcile import FAILED_PAYSTACK_STATUSES, reconcile_pending_payments
+from ..renderers import FastJSONRenderer
+from ..models import (
+    IdempotencyKey, Payment, PaymentHistory, PaymentOperationError, PaymentRefund, PaymentCharge, PaymentRollup,
+    PaymentTransition, WebhookEvent,
+)
+from ..resilience import CircuitBreaker, ServiceUnavailableError, TokenBucket
+from ..rollups import lock_ledger_tables, rebuild_rollups
+from ..serializers import PaymentSerializer
+from ..routers import REPLICA_ALIAS, PrimaryReplicaRouter, replica_reads
+from ..views import PaymentViewSet
+from ..webhooks import drain_webhook_events, enqueue_webhook_event, next_retry_delay, process_webhook_events
+from ..sqlite import apply_sqlite_profile, get_write_lock, serialized_atomic, set_journal_mode
+
+# List/retrieve/export reads go to the replica when one is configured
+READ_DB = REPLICA_ALIAS if REPLICA_ALIAS in settings.DATABASES else 'default'
+
+
+class ListQueryCountTests(TransactionTestCase):
+    """
+    List and retrieve endpoints must cost a fixed number of queries,
+    whatever the page size and whether related objects are expanded
+    Data is committed so a replica alias mirroring the test database sees it
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        response_cache.clear()
+        self.client = APIClient()
+        payments = Payment.objects.bulk_create([
+            Payment(customer_name=f"Customer {i}", amount='100.00', email=f"user{i}@example.com")
+            for i in range(30)
+        ])
+        PaymentHistory.objects.bulk_create([
+            PaymentHistory(customer_name=p.customer_name, amount=p.amount, email=p.email, original_payment=p)
+            for p in payments
+        ])
+        PaymentRefund.objects.bulk_create([
+            PaymentRefund(customer_name=p.customer_name, amount='10.00', email=p.email, original_payment=p)
+            for p in payments
+        ])
+        PaymentCharge.objects.bulk_create([
+            PaymentCharge(customer_name=p.customer_name, amount='10.00', email=p.email,
+                          description="Service charge", tax=1.5)
+            for p in payments
+        ])
+
+    def assert_list_queries(self, url, expected):
+        for page_size in (1, 5, 25):
+            with self.assertNumQueries(expected, using=READ_DB):
+                response = self.client.get(url, {'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['results']), page_size)
+            next_url = response.json()['next']
+            with self.assertNumQueries(expected, using=READ_DB):
+                self.assertEqual(self.client.get(next_url).status_code, 200)
+
+    def test_payment_list(self):
+        self.assert_list_queries('/api/v1/payments/', 1)
+
+    def test_charge_list(self):
+        self.assert_list_queries('/api/v1/payment-charges/', 1)
+
+    def test_history_list(self):
+        self.assert_list_queries('/api/v1/payment-history/', 1)
+        self.assert_list_queries('/api/v1/payment-history/?expand=original_payment', 1)
+
+    def test_refund_list(self):
+        self.assert_list_queries('/api/v1/payment-refunds/', 1)
+        self.assert_list_queries('/api/v1/payment-refunds/?expand=original_payment', 1)
+
+    def test_expanded_refund_matches_payment_detail(self):
+        refund = PaymentRefund.objects.first()
+        with self.assertNumQueries(1, using=READ_DB):
+            response = self.client.get(f'/api/v1/payment-refunds/{refund.pk}/', {'expand': 'original_payment'})
+        payment = self.client.get(f'/api/v1/payments/{refund.original_payment_id}/').json()
+        self.assertEqual(response.json()['original_payment'], payment)
+
+    def test_refund_partial_update(self):
+        refund = PaymentRefund.objects.first()
+        with self.assertNumQueries(2):
+            response = self.client.patch(f'/api/v1/payment-refunds/{refund.pk}/', {'refund_reason': "Duplicate"}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+
+class PaginationAndFilterTests(TransactionTestCase):
+    """
+    Keyset pages and list filters; data is committed so a replica alias
+    mirroring the test database sees it
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.payments = Payment.objects.bulk_create([
+            Payment(customer_name=f"Customer {i}", amount='10.00', email=f"user{i % 3}@example.com")
+            for i in range(25)
+        ])
+        # Ten days apart, with the first two sharing a timestamp so ties are broken by id
+        start = timezone.now() - timedelta(days=250)
+        for i, payment in enumerate(self.payments):
+            Payment.objects.filter(pk=payment.pk).update(created_at=start + timedelta(days=10 * max(i, 1)))
+        for payment in self.payments[:5]:
+            payment.mark_as_paid()
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [row['transaction_id'] for row in response.json()['results']]
+
+    def test_next_and_previous_links_walk_every_row_once(self):
+        newest_first = [p.pk for p in reversed(self.payments)]
+        newest_first[-2:] = sorted(newest_first[-2:], reverse=True)
+
+        pages, url = [], '/api/v1/payments/?page_size=10'
+        while url:
+            response = self.client.get(url)
+            pages.append((url, self.ids(response), response.json()['previous']))
+            url = response.json()['next']
+        self.assertEqual([len(ids) for _, ids, _ in pages], [10, 10, 5])
+        self.assertEqual([pk for _, ids, _ in pages for pk in ids], newest_first)
+
+        self.assertIsNone(pages[0][2])
+        for (_, earlier, _), (_, _, previous) in zip(pages, pages[1:]):
+            self.assertEqual(self.ids(self.client.get(previous)), earlier)
+        # The first page reached backwards has no previous link of its own
+        self.assertIsNone(self.client.get(pages[1][2]).json()['previous'])
+
+    def test_invalid_cursors_are_rejected(self):
+        for cursor in ('not-base64!', 'eHx5fHo=', urlsafe_b64encode(b'n|not-a-date|1').decode()):
+            self.assertEqual(self.client.get('/api/v1/payments/', {'cursor': cursor}).status_code, 404)
+
+    def test_filters(self):
+        url = '/api/v1/payments/'
+        self.assertEqual(
+            sorted(self.ids(self.client.get(url, {'email': "user1@example.com", 'page_size': 100}))),
+            [p.pk for p in self.payments if p.email == "user1@example.com"])
+        self.assertEqual(
+            sorted(self.ids(self.client.get(url, {'paid': 'true', 'page_size': 100}))), [p.pk for p in self.payments[:5]])
+        self.assertEqual(
+            sorted(self.ids(self.client.get(url, {'paid': '0', 'status': 'pending', 'page_size': 100}))),
+            [p.pk for p in self.payments[5:]])
+
+        day = timezone.localdate(Payment.objects.get(pk=self.payments[10].pk).created_at)
+        on_day = self.ids(self.client.get(url, {'created_after': day.isoformat(), 'created_before': day.isoformat()}))
+        self.assertEqual(on_day, [self.payments[10].pk])
+        after = self.ids(self.client.get(url, {'created_after': day.isoformat(), 'page_size': 100}))
+        self.assertEqual(sorted(after), [p.pk for p in self.payments[10:]])
+
+    def test_amount_filters(self):
+        Payment.objects.filter(pk=self.payments[0].pk).update(amount='1.01')
+        Payment.objects.filter(pk=self.payments[1].pk).update(amount='25.00')
+        url = '/api/v1/payments/'
+        self.assertEqual(self.ids(self.client.get(url, {'amount': '1.010'})), [self.payments[0].pk])
+        self.assertEqual(self.ids(self.client.get(url, {'amount_min': '10.01'})), [self.payments[1].pk])
+        self.assertEqual(
+            sorted(self.ids(self.client.get(url, {'amount_min': '1.01', 'amount_max': '10', 'page_size': 100}))),
+            [p.pk for p in self.payments if p.pk != self.payments[1].pk])
+
+    def test_invalid_filter_values_are_rejected(self):
+        for params in ({'paid': 'maybe'}, {'created_after': '2024-13-01'}, {'created_before': 'yesterday'},
+                       {'amount': '1.005'}, {'amount_min': 'ten'}, {'amount_max': 'NaN'}, {'amount': 'Infinity'}):
+            response = self.client.get('/api/v1/payments/', params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('detail', response.json())
+
+
+class BulkCreateTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_bulk_create_charges(self):
+        items = [
+            {'customer_name': "Customer", 'amount': '10.00', 'email': f"user{i}@example.com",
+             'description': "Service charge", 'tax': 1.5}
+            for i in range(50)
+        ]
+        with self.assertNumQueries(3):
+            response = self.client.post('/api/v1/payment-charges/', items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()), 50)
+        self.assertEqual(response.json()[0]['total_amount'], '11.50')
+        self.assertEqual(PaymentCharge.objects.count(), 50)
+
+    def test_bulk_create_refunds_resolves_payments_in_one_query(self):
+        payments = Payment.objects.bulk_create([
+            Payment(customer_name="Customer", amount='100.00', email=f"user{i}@example.com") for i in range(20)
+        ])
+        items = [
+            {'customer_name': "Customer", 'amount': '10.00', 'email': p.email, 'original_payment': p.pk}
+            for p in payments
+        ]
+        with self.assertNumQueries(4):
+            response = self.client.post('/api/v1/payment-refunds/', items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(PaymentRefund.objects.count(), 20)
+
+    def test_bulk_create_reports_errors_per_item(self):
+        items = [
+            {'customer_name': "Customer", 'amount': '10.00', 'email': "user@example.com"},
+            {'customer_name': "Customer", 'amount': '-1.00', 'email': "user@example.com"},
+        ]
+        response = self.client.post('/api/v1/payments/', items, format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual(errors[0], {})
+        self.assertIn('amount', errors[1])
+        self.assertEqual(Payment.objects.count(), 0)
+
+
+class ExportTests(TransactionTestCase):
+    """
+    Exports stream through the replica alias when one is configured
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.payments = [
+            Payment.objects.create(customer_name=f"Customer {i}", amount=amount, email=f"user{i}@example.com",
+                                   payment_reference=f"ref-{i}")
+            for i, amount in enumerate(['10.00', '20.50', '30.00'])
+        ]
+        start = timezone.now() - timedelta(days=30)
+        for i, payment in enumerate(self.payments):
+            Payment.objects.filter(pk=payment.pk).update(created_at=start + timedelta(days=10 * i))
+            payment.refresh_from_db()
+        self.payments[1].mark_as_paid()
+        self.payments[1].refresh_from_db()
+
+    def export(self, **params):
+        response = self.client.get('/api/v1/payments/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv_export_streams_every_row_oldest_first(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="payment.csv"')
+        rows = list(csv.reader(StringIO(content)))
+        self.assertEqual(rows[0], EXPORT_MODELS['payments'][1])
+        paid = self.payments[1]
+        self.assertEqual(rows[2], [
+            str(paid.pk), '20.50', "Customer 1", "user1@example.com", 'COMPLETED', 'True',
+            paid.created_at.isoformat(), paid.updated_at.isoformat(), 'ref-1'])
+        self.assertEqual([row[0] for row in rows[1:]], [str(p.pk) for p in self.payments])
+
+    def test_ndjson_export_applies_the_list_filters(self):
+        response, content = self.export(output='ndjson', paid='false')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['transaction_id'] for row in rows], [self.payments[0].pk, self.payments[2].pk])
+        self.assertEqual(rows[0]['amount'], '10.00')
+        self.assertEqual(set(rows[0]), set(EXPORT_MODELS['payments'][1]))
+
+        day = timezone.localdate(self.payments[2].created_at).isoformat()
+        _, content = self.export(output='ndjson', created_after=day)
+        self.assertEqual([json.loads(line)['transaction_id'] for line in content.splitlines()], [self.payments[2].pk])
+        _, content = self.export(status='completed')
+        self.assertEqual(len(content.splitlines()), 2)
+
+    def test_export_rejects_unknown_formats_and_filters(self):
+        self.assertEqual(self.client.get('/api/v1/payments/export/', {'output': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/payments/export/', {'paid': 'maybe'}).status_code, 400)
+
+    def test_export_command(self):
+        stdout = StringIO()
+        day = timezone.localdate(self.payments[1].created_at).isoformat()
+        call_command('export_payments', 'payments', '--output', 'ndjson', '--created-before', day,
+                     '--chunk-size', '1', stdout=stdout)
+        self.assertEqual(
+            [json.loads(line)['transaction_id'] for line in stdout.getvalue().splitlines()],
+            [self.payments[0].pk, self.payments[1].pk])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = f"{tmpdir}/payments.csv"
+            call_command('export_payments', 'payments', '--file', path)
+            with open(path, newline='', encoding='utf-8') as exported:
+                rows = list(csv.reader(exported))
+        _, content = self.export()
+        self.assertEqual(rows, list(csv.reader(StringIO(content))))
+
+        with self.assertRaisesMessage(CommandError, "Invalid date: 2024-13-01"):
+            call_command('export_payments', 'payments', '--created-after', '2024-13-01')
+
+
+class PaymentHistoryNoteTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        payment = Payment.objects.create(customer_name="Customer", amount='100.00', email="user@example.com")
+        self.history = PaymentHistory.objects.create(
+            customer_name="Customer", amount='100.00', email="user@example.com", original_payment=payment)
+
+    def test_add_note_is_a_single_insert(self):
+        self.history.add_note("first")
+        with self.assertNumQueries(1):
+            self.history.add_note("second")
+        self.assertEqual(list(self.history.history_notes.values_list('note', flat=True)), ["first", "second"])
+
+    def test_notes_are_paginated_oldest_first(self):
+        for i in range(5):
+            self.client.post(f'/api/v1/payment-history/{self.history.pk}/add_note/', {'note': f"note {i}"}, format='json')
+        response = self.client.get(f'/api/v1/payment-history/{self.history.pk}/notes/', {'page_size': 3})
+        self.assertEqual([n['note'] for n in response.json()['results']], ["note 0", "note 1", "note 2"])
+        response = self.client.get(response.json()['next'])
+        self.assertEqual([n['note'] for n in response.json()['results']], ["note 3", "note 4"])
+        self.assertEqual(self.client.get('/api/v1/payment-history/999/notes/').status_code, 404)
+
+
+class PaymentTransitionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.payment = Payment.objects.create(customer_name="Customer", amount='100.00', email="user@example.com")
+
+    def test_transitions_are_logged_once(self):
+        self.assertTrue(self.payment.mark_as_paid(reason="Manual"))
+        self.assertFalse(self.payment.mark_as_failed())
+        self.assertEqual(
+            list(PaymentTransition.objects.values_list('payment_model', 'object_id', 'from_status', 'to_status', 'reason')),
+            [('payment', self.payment.pk, 'PENDING', 'COMPLETED', "Manual")])
+        self.assertEqual(self.payment.version, 1)
+
+    def test_repeated_transitions_conflict(self):
+        url = f'/api/v1/payments/{self.payment.pk}/'
+        self.assertEqual(self.client.post(f'{url}process/').status_code, 200)
+        self.assertEqual(self.client.post(f'{url}process/').status_code, 409)
+        self.assertEqual(self.client.post(f'{url}mark_failed/').status_code, 409)
+        self.assertEqual(PaymentTransition.objects.count(), 1)
+        self.assertEqual(PaymentRollup.objects.get().count, 1)
+
+    def test_saving_a_stale_instance_keeps_the_transition(self):
+        stale = Payment.objects.get(pk=self.payment.pk)
+        self.payment.mark_as_paid()
+        # What a PATCH does with the instance it loaded before the transition committed
+        serializer = PaymentSerializer(stale, data={'customer_name': "Renamed"}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        payment = Payment.objects.get(pk=self.payment.pk)
+        self.assertEqual((payment.status, payment.paid, payment.version), ('COMPLETED', True, 1))
+        self.assertEqual(payment.customer_name, "Renamed")
+        self.assertFalse(stale.mark_as_paid())
+        self.assertEqual(PaymentTransition.objects.count(), 1)
+
+    def test_updates_cannot_reset_the_status(self):
+        self.payment.mark_as_paid()
+        response = self.client.patch(
+            f'/api/v1/payments/{self.payment.pk}/', {'customer_name': "Renamed", 'status': 'PENDING'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'COMPLETED')
+        self.payment.refresh_from_db()
+        self.assertEqual((self.payment.customer_name, self.payment.status, self.payment.version), ("Renamed", 'COMPLETED', 1))
+
+
+class PaymentRefundTests(TransactionTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.payment = Payment.objects.create(customer_name="Customer", amount='100.00', email="user@example.com")
+        self.payment.mark_as_paid()
+
+    def create_refund(self, amount):
+        return PaymentRefund.objects.create(
+            customer_name="Customer", amount=amount, email="user@example.com", original_payment=self.payment)
+
+    def process(self, refund):
+        return self.client.post(f'/api/v1/payment-refunds/{refund.pk}/process_refund/')
+
+    def completed_total(self):
+        return PaymentRefund.objects.filter(status='COMPLETED').aggregate(total=Sum('amount'))['total']
+
+    def test_refunds_cannot_exceed_the_original_amount(self):
+        item = {'customer_name': "Customer", 'amount': '100.01', 'email': "user@example.com", 'original_payment': self.payment.pk}
+        self.assertEqual(self.client.post('/api/v1/payment-refunds/', item, format='json').status_code, 400)
+
+        first, second, third = self.create_refund('60.00'), self.create_refund('60.00'), self.create_refund('40.00')
+        self.assertEqual(self.process(first).status_code, 200)
+        with self.assertLogs('payments.models', 'ERROR'):
+            response = self.process(second)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("cannot exceed the original payment amount", response.json()['error'])
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'FAILED')
+        self.assertEqual(self.process(third).status_code, 200)
+        self.assertEqual(self.completed_total(), Decimal('100.00'))
+
+        # Refunds only settle once
+        self.assertEqual(self.process(first).status_code, 409)
+        response = self.client.patch(f'/api/v1/payment-refunds/{third.pk}/', {'amount': '150.00'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_refunds_need_a_completed_payment(self):
+        pending = Payment.objects.create(customer_name="Customer", amount='100.00', email="user@example.com")
+        refund = PaymentRefund.objects.create(
+            customer_name="Customer", amount='10.00', email="user@example.com", original_payment=pending)
+        with self.assertLogs('payments.models', 'ERROR') as logs:
+            self.assertEqual(self.process(refund).status_code, 400)
+        self.assertIn("Original payment is not completed", logs.output[0])
+        refund.refresh_from_db()
+        self.assertEqual(refund.status, 'FAILED')
+
+    def run_concurrent_refunds(self):
+        # Refunds are loaded up front so the threads only touch the database inside
+        # process_refund; the in-memory test database fails unserialized reads that
+        # overlap a write instead of waiting for them
+        refunds = list(PaymentRefund.objects.select_related('original_payment').filter(
+            pk__in=[self.create_refund('30.00').pk for _ in range(6)]))
+        barrier = threading.Barrier(len(refunds))
+        outcomes = []
+
+        def process(refund):
+            try:
+                barrier.wait()
+                while True:
+                    try:
+                        outcomes.append(refund.process_refund())
+                    except PaymentOperationError:
+                        outcomes.append(False)
+                    except OperationalError:
+                        # Lost a lock race; the refund is still pending, so retry it
+                        time.sleep(0.01)
+                        continue
+                    break
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=process, args=(refund,)) for refund in refunds]
+        with self.assertLogs('payments.models', 'ERROR'):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(sorted(outcomes), [False] * 3 + [True] * 3)
+        self.assertEqual(self.completed_total(), Decimal('90.00'))
+        self.assertEqual(PaymentRefund.objects.filter(status='FAILED').count(), 3)
+
+    def test_concurrent_refunds_never_exceed_the_original_amount(self):
+        self.run_concurrent_refunds()
+
+    @override_settings(SQLITE_PRAGMAS={}, SQLITE_SERIALIZE_WRITES=False)
+    def test_concurrent_refunds_with_sqlite_tuning_off(self):
+        # The stock SQLite behaviour: deferred transactions that fail on lock
+        # contention instead of queueing for the write lock
+        options = connections.settings['default']['OPTIONS']
+        with mock.patch.dict(options, {key: value for key, value in options.items() if key != 'transaction_mode'},
+                             clear=True):
+            connections.close_all()
+            self.run_concurrent_refunds()
+        connections.close_all()
+
+    def test_lock_timeouts_leave_the_refund_pending(self):
+        refund = self.create_refund('30.00')
+        with mock.patch.object(PaymentRefund, 'mark_as_paid', side_effect=OperationalError("database is locked")):
+            response = self.process(refund)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        refund.refresh_from_db()
+        self.assertEqual(refund.status, 'PENDING')
+
+        self.assertEqual(self.process(refund).status_code, 200)
+        refund.refresh_from_db()
+        self.assertEqual(refund.status, 'COMPLETED')
+
+
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    def test_reads_use_replica_only_when_opted_in(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Payment), 'default')
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Payment), READ_DB)
+            self.assertEqual(router.db_for_write(Payment), 'default')
+        self.assertEqual(router.db_for_read(Payment), 'default')
+
+
+@override_settings(SQLITE_SERIALIZE_WRITES=True)
+class SQLiteProfileTests(TransactionTestCase):
+    @override_settings(SQLITE_PRAGMAS={'synchronous': 'NORMAL', 'busy_timeout': 4000})
+    def test_profile_is_applied_to_connections(self):
+        apply_sqlite_profile(None, connection)
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 4000)
+            cursor.execute("PRAGMA synchronous")
+            # 1 is NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_journal_mode_is_only_changed_explicitly(self):
+        default = connections['default']
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = f"{tmpdir}/scratch.sqlite3"
+            scratch = default.__class__({**default.settings_dict, 'NAME': path}, alias='scratch')
+            try:
+                # Opening a connection applies the per-connection pragmas only
+                with scratch.cursor() as cursor:
+                    cursor.execute("PRAGMA journal_mode")
+                    self.assertEqual(cursor.fetchone()[0], 'delete')
+                self.assertEqual(set_journal_mode(scratch, 'WAL'), 'wal')
+            finally:
+                scratch.close()
+            # The mode persists in the file for later connections
+            reopened = sqlite3.connect(path)
+            self.assertEqual(reopened.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+            reopened.close()
+
+        stdout = StringIO()
+        call_command('sqlite_journal_mode', mode='WAL', stdout=stdout)
+        # The test database is in memory, which has no WAL
+        self.assertEqual(stdout.getvalue(), "default: journal_mode = memory\n")
+
+    @override_settings(SQLITE_PRAGMAS={'busy_timeout': 50})
+    def test_outermost_block_waits_for_the_write_lock(self):
+        lock = get_write_lock(connection.alias)
+        with lock:
+            with self.assertRaises(OperationalError):
+                with serialized_atomic():
+                    pass
+            # Nested blocks already hold the database's write lock and do not wait
+            with transaction.atomic():
+                with serialized_atomic():
+                    Payment.objects.create(customer_name="Customer", amount='100.00', email="user@example.com")
+        with serialized_atomic():
+            Payment.objects.create(customer_name="Customer", amount='100.00', email="user@example.com")
+        self.assertEqual(Payment.objects.count(), 2)
+
+
+@override_settings(PAYMENTS_CACHE_ENABLED=True)
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        response_cache.clear()
+        self.client = APIClient()
+        self.payment = Payment.objects.create(customer_name="Customer", amount='100.00', email="user@example.com")
+        self.charge = PaymentCharge.objects.create(
+            customer_name="Customer", amount='100.00', email="user@example.com", description="Fee", tax=7.5)
+
+    def test_retrieve_is_cached_and_revalidated(self):
+        url = f'/api/v1/payments/{self.payment.pk}/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).json(), response.json())
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.payment.mark_as_paid()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'COMPLETED')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_calculate_total_is_invalidated_by_updates(self):
+        url = f'/api/v1/payment-charges/{self.charge.pk}/calculate_total/'
+        self.assertEqual(self.client.get(url).json()['total_amount'], '107.50')
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/v1/payment-charges/{self.charge.pk}/', {'tax': 10}, format='json')
+        self.assertEqual(self.client.get(url).json()['total_amount'], '110.00')
+        self.assertEqual(self.client.get('/api/v1/payment-charges/999/calculate_total/').status_code, 404)
+
+    def test_local_only_cache_is_opt_in(self):
+        shared = {**settings.CACHES, 'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                                'LOCATION': 'payments-response-cache-tests'}}
+        with self.settings(PAYMENTS_CACHE_ALIAS=None):
+            del settings.PAYMENTS_CACHE_ENABLED
+            self.assertFalse(ResponseCache().enabled)
+            with self.settings(PAYMENTS_CACHE_ALIAS='shared', CACHES=shared):
+                self.assertTrue(ResponseCache().enabled)
+
+    @override_settings(
+        PAYMENTS_CACHE_ALIAS='shared',
+        CACHES={**settings.CACHES, 'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                              'LOCATION': 'payments-response-cache-tests'}},
+    )
+    def test_invalidation_reaches_other_processes(self):
+        # Two workers sharing one cache alias, each with its own local tier
+        first, second = ResponseCache(), ResponseCache()
+        cached, token = first.get(Payment, self.payment.pk, 'retrieve')
+        self.assertIsNone(cached)
+        first.set(Payment, self.payment.pk, 'retrieve', {'status': 'PENDING'}, token)
+        self.assertEqual(second.get(Payment, self.payment.pk, 'retrieve')[0], {'status': 'PENDING'})
+
+        # The second worker now has a local copy; the first one invalidates
+        _, stale_token = first.get(Payment, self.payment.pk, 'calculate_total')
+        first.invalidate(Payment, [self.payment.pk])
+        cached, token = second.get(Payment, self.payment.pk, 'retrieve')
+        self.assertIsNone(cached)
+
+        # A response built from a read that raced with the invalidation is ignored
+        first.set(Payment, self.payment.pk, 'calculate_total', {'total': 'stale'}, stale_token)
+        self.assertIsNone(second.get(Payment, self.payment.pk, 'calculate_total')[0])
+
+        second.set(Payment, self.payment.pk, 'retrieve', {'status': 'COMPLETED'}, token)
+        self.assertEqual(first.get(Payment, self.payment.pk, 'retrieve')[0], {'status': 'COMPLETED'})
+        self.assertEqual(second.get(Payment, self.payment.pk, 'retrieve')[0], {'status': 'COMPLETED'})
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get_many(['a'])
+        cache.set('c', 3)
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
+
+
+class PaymentRollupTests(TransactionTestCase):
+    """
+    The summary is read through the replica alias when one is configured
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.payments = [
+            Payment.objects.create(customer_name="Customer", amount=amount, email=email)
+            for amount, email in [('100.00', "a@Example.com"), ('50.00', "b@example.com"), ('20.00', "c@other.org")]
+        ]
+
+    def test_transitions_update_rollups_incrementally(self):
+        self.payments[0].mark_as_paid()
+        Payment.transition_queryset(Payment.objects.filter(pk=self.payments[1].pk), 'COMPLETED', True)
+        self.payments[2].mark_as_failed()
+        refund = PaymentRefund.objects.create(
+            customer_name="Customer", amount='30.00', email="a@example.com", original_payment=self.payments[0])
+        refund.process_refund()
+
+        rollup = PaymentRollup.objects.get(payment_model='payment', status='COMPLETED', email_domain='example.com')
+        self.assertEqual((rollup.count, rollup.total_amount), (2, Decimal('150.00')))
+
+        with self.assertNumQueries(3, using=READ_DB):
+            summary = self.client.get('/api/v1/payments/summary/').json()
+        self.assertEqual(summary['payments']['by_status']['COMPLETED'], {'count': 2, 'total_amount': '150.00'})
+        self.assertEqual(summary['refunds']['by_status']['COMPLETED'], {'count': 1, 'total_amount': '30.00'})
+        self.assertEqual(summary['refund_ratio'], 0.2)
+        self.assertAlmostEqual(summary['failure_rate'], 1 / 3)
+        self.assertEqual(
+            [(row['email_domain'], row['status']) for row in summary['payments']['by_email_domain']],
+            [('example.com', 'COMPLETED'), ('other.org', 'FAILED')])
+
+        expected = sorted(PaymentRollup.objects.values_list(
+            'payment_model', 'day', 'status', 'email_domain', 'count', 'total_amount'))
+        PaymentRollup.objects.all().delete()
+        self.assertEqual(rebuild_rollups(), 3)
+        self.assertEqual(sorted(PaymentRollup.objects.values_list(
+            'payment_model', 'day', 'status', 'email_domain', 'count', 'total_amount')), expected)
+
+    def rollups(self):
+        return sorted(PaymentRollup.objects.values_list(
+            'payment_model', 'day', 'status', 'email_domain', 'count', 'total_amount'))
+
+    def assert_rollups_match_a_rebuild(self):
+        recorded = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(recorded, self.rollups())
+
+    def test_transitions_record_the_stored_amount(self):
+        stale = Payment.objects.get(pk=self.payments[0].pk)
+        Payment.objects.filter(pk=stale.pk).update(amount='70.00')
+        stale.mark_as_paid()
+        rollup = PaymentRollup.objects.get(payment_model='payment', status='COMPLETED')
+        self.assertEqual((rollup.count, rollup.total_amount), (1, Decimal('70.00')))
+
+    def test_edits_and_deletes_of_settled_rows_update_rollups(self):
+        for payment in self.payments[:2]:
+            payment.mark_as_paid()
+        self.payments[2].mark_as_failed()
+        refund = PaymentRefund.objects.create(
+            customer_name="Customer", amount='30.00', email="a@example.com", original_payment=self.payments[0])
+        refund.process_refund()
+
+        response = self.client.patch(f'/api/v1/payments/{self.payments[1].pk}/', {'amount': '45.00'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch(f'/api/v1/payments/{self.payments[2].pk}/', {'email': "c@example.com"}, format='json')
+        self.assertEqual(response.status_code, 200)
+        rollup = PaymentRollup.objects.get(payment_model='payment', status='COMPLETED', email_domain='example.com')
+        self.assertEqual((rollup.count, rollup.total_amount), (2, Decimal('145.00')))
+        self.assertFalse(PaymentRollup.objects.filter(email_domain='other.org').exists())
+        self.assert_rollups_match_a_rebuild()
+
+        self.assertEqual(self.client.delete(f'/api/v1/payment-refunds/{refund.pk}/').status_code, 204)
+        self.assertFalse(PaymentRollup.objects.filter(payment_model='paymentrefund').exists())
+        self.assert_rollups_match_a_rebuild()
+
+        # Deleting a payment also takes out the refunds deleted with it
+        refund = PaymentRefund.objects.create(
+            customer_name="Customer", amount='10.00', email="a@example.com", original_payment=self.payments[0])
+        refund.process_refund()
+        self.assertEqual(self.client.delete(f'/api/v1/payments/{self.payments[0].pk}/').status_code, 204)
+        self.assertEqual(PaymentRollup.objects.filter(payment_model='paymentrefund').count(), 0)
+        rollup = PaymentRollup.objects.get(payment_model='payment', status='COMPLETED', email_domain='example.com')
+        self.assertEqual((rollup.count, rollup.total_amount), (1, Decimal('45.00')))
+        self.assert_rollups_match_a_rebuild()
+
+    def test_rebuild_locks_out_ledger_writers_off_sqlite(self):
+        server = mock.MagicMock(vendor='postgresql')
+        server.ops.quote_name = lambda name: f'"{name}"'
+        with mock.patch('payments.rollups.transaction.get_connection', return_value=server):
+            lock_ledger_tables()
+        server.cursor.return_value.__enter__.return_value.execute.assert_called_once_with(
+            'LOCK TABLE "payments_payment", "payments_paymentrefund" IN SHARE ROW EXCLUSIVE MODE')
+
+        with mock.patch('payments.rollups.lock_ledger_tables') as lock:
+            rebuild_rollups()
+        lock.assert_called_once_with()
+
+    def test_summary_rejects_invalid_dates(self):
+        self.assertEqual(self.client.get('/api/v1/payments/summary/', {'start': '2024-13-45'}).status_code, 400)
+        summary = self.client.get('/api/v1/payments/summary/', {'start': '2000-01-01', 'end': '2000-01-31'}).json()
+        self.assertEqual(summary['payments']['by_day'], [])
+        self.assertIsNone(summary['refund_ratio'])
+
+
+class MoneyTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_amounts_are_stored_as_minor_units(self):
+        self.assertEqual(to_minor_units(19.99), 1999)
+        self.assertEqual(to_minor_units(Decimal('19.99')), 1999)
+        with self.assertRaises(ValueError):
+            to_minor_units(Decimal('0.005'))
+
+        payment = Payment.objects.create(customer_name="Customer", amount='19.99', email="user@example.com")
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT amount FROM payments_payment WHERE transaction_id = %s", [payment.pk])
+            self.assertEqual(cursor.fetchone()[0], 1999)
+        Payment.objects.create(customer_name="Customer", amount='0.01', email="user@example.com")
+        self.assertEqual(Payment.objects.aggregate(total=Sum('amount'))['total'], Decimal('20.00'))
+
+    def test_charge_totals_are_exact_and_batched(self):
+        charges = PaymentCharge.objects.bulk_create([
+            PaymentCharge(customer_name="Customer", amount='0.10', email="user@example.com", description="Fee", tax='0.20'),
+            PaymentCharge(customer_name="Customer", amount='19.99', email="user@example.com", description="Fee", tax='1.01'),
+        ])
+        self.assertEqual(charges[0].calculate_total(), Decimal('0.30'))
+
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                '/api/v1/payment-charges/calculate_totals/', {'ids': [charges[0].pk, charges[1].pk, 999]}, format='json')
+        self.assertEqual(response.json(), {
+            'totals': {str(charges[0].pk): '0.30', str(charges[1].pk): '21.00'}, 'missing': [999]})
+        response = self.client.post('/api/v1/payment-charges/calculate_totals/', {'ids': "1,2"}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        # List rows get total_amount from the database
+        serializer = FastPaymentChargeSerializer()
+        rows = serializer.many(serializer.values(PaymentCharge.objects.order_by('pk')))
+        self.assertEqual([row['total_amount'] for row in rows], ['0.30', '21.00'])
+        self.assertEqual(serializer.many_instances(charges), rows)
+
+
+class FastSerializerTests(TestCase):
+    """
+    The .values() fast path must render exactly what the DRF serializers render
+    """
+    def setUp(self):
+        payments = [
+            Payment.objects.create(customer_name="Customer", amount='19.99', email="user@example.com"),
+            Payment.objects.create(customer_name="Customer", amount='0.10', email="user@example.com",
+                                   payment_reference="ref-1"),
+        ]
+        payments[1].mark_as_paid()
+        PaymentHistory.objects.create(
+            customer_name="Customer", amount='19.99', email="user@example.com", original_payment=payments[0])
+        for reason in (None, "Duplicate"):
+            PaymentRefund.objects.create(customer_name="Customer", amount='0.05', email="user@example.com",
+                                         original_payment=payments[1], refund_reason=reason)
+        for tax in (Decimal('0'), Decimal('1.25')):
+            PaymentCharge.objects.create(customer_name="Customer", amount='20.00', email="user@example.com",
+                                         description="Service charge", tax=tax)
+
+    def render(self, fast, classic_data):
+        queryset = fast.serializer_class.Meta.model.objects.order_by('pk')
+        expected = json.loads(JSONRenderer().render(classic_data(list(queryset))))
+        self.assertEqual(json.loads(FastJSONRenderer().render(fast.many(fast.values(queryset)))), expected)
+        return queryset, expected
+
+    def test_fast_serializers_match_the_drf_serializers(self):
+        for fast_class in (FastPaymentSerializer, FastPaymentHistorySerializer,
+                           FastPaymentRefundSerializer, FastPaymentChargeSerializer):
+            with self.subTest(fast_class.__name__):
+                fast = fast_class()
+                queryset, expected = self.render(fast, lambda rows: fast_class.serializer_class(rows, many=True).data)
+                # Bulk create responses serialize the created instances
+                self.assertEqual(json.loads(FastJSONRenderer().render(fast.many_instances(queryset))), expected)
+
+    def test_expanded_original_payment_matches_the_payment_serializer(self):
+        def expanded(serializer_class):
+            def data(rows):
+                items = serializer_class(rows, many=True).data
+                for item, row in zip(items, rows):
+                    item['original_payment'] = PaymentSerializer(row.original_payment).data
+                return items
+            return data
+
+        for fast_class in (FastPaymentHistorySerializer, FastPaymentRefundSerializer):
+            with self.subTest(fast_class.__name__):
+                self.render(fast_class(expand=['original_payment']), expanded(fast_class.serializer_class))
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.payment = Payment.objects.create(customer_name="Customer", amount='19.99', email="user@example.com")
+
+    def test_replayed_initiate_payment_does_not_call_paystack_again(self):
+        url = f'/api/v1/payments/{self.payment.pk}/initiate_payment/'
+        with FakePaystackServer() as server, mock.patch.object(PaymentViewSet, 'PAYSTACK_BASE_URL', server.base_url):
+            first = self.client.post(url, HTTP_IDEMPOTENCY_KEY="initiate-1")
+            with mock.patch.object(PaymentViewSet, 'initialize_payment') as initialize:
+                replayed = self.client.post(url, HTTP_IDEMPOTENCY_KEY="initiate-1")
+            initialize.assert_not_called()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(replayed.json(), first.json())
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.payment_reference, first.json()['data']['reference'])
+
+    def test_key_reused_for_a_different_request_is_rejected(self):
+        item = {'customer_name': "Customer", 'amount': '10.00', 'email': "user@example.com"}
+        self.assertEqual(self.client.post('/api/v1/payments/', item, format='json', HTTP_IDEMPOTENCY_KEY="create-1").status_code, 201)
+        self.assertEqual(self.client.post('/api/v1/payments/', item, format='json', HTTP_IDEMPOTENCY_KEY="create-1").status_code, 201)
+        item['amount'] = '11.00'
+        self.assertEqual(self.client.post('/api/v1/payments/', item, format='json', HTTP_IDEMPOTENCY_KEY="create-1").status_code, 422)
+        self.assertEqual(Payment.objects.count(), 2)
+
+    def test_keys_are_scoped_per_principal(self):
+        item = {'customer_name': "Customer", 'amount': '10.00', 'email': "user@example.com"}
+        alice, bob = (User.objects.create_user(username=name) for name in ("alice", "bob"))
+        clients = [APIClient(REMOTE_ADDR='10.0.0.1'), APIClient(REMOTE_ADDR='10.0.0.2'), APIClient(), APIClient()]
+        clients[2].force_authenticate(alice)
+        clients[3].force_authenticate(bob)
+
+        for i, client in enumerate(clients):
+            # Same key, different bodies: neither a replay nor a mismatch for another principal
+            response = client.post('/api/v1/payments/', dict(item, amount=f'{10 + i}.00'), format='json',
+                                   HTTP_IDEMPOTENCY_KEY="create-1")
+            self.assertEqual(response.status_code, 201)
+            self.assertNotIn('Idempotent-Replayed', response)
+        replayed = clients[2].post('/api/v1/payments/', dict(item, amount='12.00'), format='json',
+                                   HTTP_IDEMPOTENCY_KEY="create-1")
+        self.assertEqual((replayed.status_code, replayed['Idempotent-Replayed']), (201, 'true'))
+        self.assertEqual(Payment.objects.count(), 5)
+        self.assertEqual(
+            sorted(IdempotencyKey.objects.values_list('principal', flat=True)),
+            ["anon:10.0.0.1", "anon:10.0.0.2", f"user:{alice.pk}", f"user:{bob.pk}"])
+
+    @override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0.05, IDEMPOTENCY_LOCK_TIMEOUT=60)
+    def test_duplicates_wait_for_the_first_request_then_take_over_abandoned_keys(self):
+        url = f'/api/v1/payments/{self.payment.pk}/process/'
+        fingerprint = hashlib.sha256(f"POST {url}\n".encode('utf-8')).hexdigest()
+        now = timezone.now()
+        record = IdempotencyKey.objects.create(
+            principal="anon:127.0.0.1", key="process-1", request_hash=fingerprint, locked_at=now,
+            expires_at=now + timedelta(days=1))
+
+        self.assertEqual(self.client.post(url, HTTP_IDEMPOTENCY_KEY="process-1").status_code, 409)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'PENDING')
+
+        IdempotencyKey.objects.filter(pk=record.pk).update(locked_at=now - timedelta(minutes=5))
+        self.assertEqual(self.client.post(url, HTTP_IDEMPOTENCY_KEY="process-1").status_code, 200)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'COMPLETED')
+        self.assertEqual(IdempotencyKey.objects.get(key="process-1").response_status, 200)
+
+
+@override_settings(PAYSTACK_RATE_LIMIT=0, PAYSTACK_MAX_RETRIES=3, PAYSTACK_BACKOFF_FACTOR=0.1,
+                   PAYSTACK_BACKOFF_JITTER=0, PAYSTACK_CONNECT_TIMEOUT=1.5, PAYSTACK_READ_TIMEOUT=4)
+class PaystackSessionTests(TestCase):
+    def setUp(self):
+        # The session is built from the settings above on first use
+        reset_paystack_session()
+        self.addCleanup(reset_paystack_session)
+        breaker = PaymentViewSet().get_paystack_breaker()
+        breaker.reset()
+        self.addCleanup(breaker.reset)
+        self.server = FakePaystackServer().start()
+        self.addCleanup(self.server.stop)
+        self.paystack = PaystackMixin()
+        self.paystack.PAYSTACK_BASE_URL = self.server.base_url
+
+    def pool(self):
+        pools = get_paystack_session().get_adapter(self.server.base_url).poolmanager.pools
+        self.assertEqual(len(pools), 1)
+        (key,) = pools.keys()
+        return pools[key]
+
+    def test_session_and_connections_are_reused(self):
+        session = get_paystack_session()
+        for _ in range(5):
+            self.assertEqual(self.paystack.verify_payment("ref")['data']['status'], 'success')
+        self.paystack.initialize_payment("user@example.com", Decimal('19.99'))
+        self.assertIs(get_paystack_session(), session)
+        self.assertEqual(self.pool().num_connections, 1)
+        self.assertEqual(self.pool().num_requests, 6)
+
+    def test_connect_and_read_timeouts_are_passed(self):
+        session = get_paystack_session()
+        with mock.patch.object(session, 'request', wraps=session.request) as request:
+            self.paystack.verify_payment("ref")
+            self.paystack.initialize_payment("user@example.com", Decimal('19.99'))
+        self.assertEqual([call.kwargs['timeout'] for call in request.call_args_list], [(1.5, 4), (1.5, 4)])
+
+    def test_verify_is_retried_with_backoff(self):
+        self.server.fail_next(2)
+        started = time.perf_counter()
+        self.assertEqual(self.paystack.verify_payment("ref")['data']['status'], 'success')
+        # The first retry is immediate, the second waits backoff_factor * 2
+        self.assertGreaterEqual(time.perf_counter() - started, 0.2)
+        self.assertEqual(self.server.calls, 3)
+
+    def test_verify_gives_up_after_max_retries(self):
+        self.server.fail_next(10)
+        with self.assertLogs('payments.paystack', 'ERROR'), self.assertRaises(ValueError):
+            self.paystack.verify_payment("ref")
+        self.assertEqual(self.server.calls, 4)
+
+    def test_initialize_is_never_retried(self):
+        # Retrying a POST could initialize (and charge) the same payment twice
+        self.server.fail_next(2)
+        with self.assertLogs('payments.paystack', 'ERROR'), self.assertRaises(ValueError):
+            self.paystack.initialize_payment("user@example.com", Decimal('19.99'))
+        self.assertEqual(self.server.calls, 1)
+
+        retry = get_paystack_session().get_adapter(self.server.base_url).max_retries
+        self.assertEqual(retry.allowed_methods, frozenset(['GET']))
+
+
+@override_settings(PAYSTACK_BREAKER_FAILURES=2, PAYSTACK_BREAKER_RECOVERY=60, PAYSTACK_RATE_LIMIT=0)
+class PaystackResilienceTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.payment = Payment.objects.create(customer_name="Customer", amount='19.99', email="user@example.com")
+        self.url = f'/api/v1/payments/{self.payment.pk}/initiate_payment/'
+        self.breaker.reset()
+        self.addCleanup(self.breaker.reset)
+
+    @property
+    def breaker(self):
+        return PaymentViewSet().get_paystack_breaker()
+
+    def fake_paystack(self, **kwargs):
+        server = FakePaystackServer(**kwargs).start()
+        self.addCleanup(server.stop)
+        patcher = mock.patch.object(PaymentViewSet, 'PAYSTACK_BASE_URL', server.base_url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return server
+
+    def test_breaker_opens_after_consecutive_failures_and_fails_fast(self):
+        server = self.fake_paystack()
+        server.fail_next(2)
+        self.assertEqual([self.client.post(self.url).status_code for _ in range(2)], [400, 400])
+        self.assertEqual(self.breaker.state, 'open')
+
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response['Retry-After']), 59)
+        self.assertEqual(server.calls, 2)
+
+    @override_settings(PAYSTACK_READ_TIMEOUT=0.05)
+    def test_slow_responses_count_as_failures(self):
+        server = self.fake_paystack(latency=0.3)
+        for _ in range(2):
+            self.assertEqual(self.client.post(self.url).status_code, 400)
+        started = time.perf_counter()
+        self.assertEqual(self.client.post(self.url).status_code, 503)
+        self.assertLess(time.perf_counter() - started, 0.05)
+        self.assertEqual(server.calls, 2)
+
+    def test_client_errors_and_successes_keep_the_breaker_closed(self):
+        server = self.fake_paystack()
+        server.fail_next(3, status=400)
+        self.assertEqual([self.client.post(self.url).status_code for _ in range(3)], [400, 400, 400])
+        server.fail_next(1, status=500)
+        self.assertEqual(self.client.post(self.url).status_code, 400)
+        self.assertEqual(self.client.post(self.url).status_code, 200)
+        server.fail_next(1, status=500)
+        self.assertEqual(self.client.post(self.url).status_code, 400)
+        self.assertEqual(self.breaker.state, 'closed')
+        self.assertEqual(server.calls, 6)
+
+    @override_settings(PAYSTACK_BREAKER_RECOVERY=0.05)
+    def test_half_open_probe_reopens_or_closes_the_breaker(self):
+        server = self.fake_paystack()
+        server.fail_next(3)
+        self.client.post(self.url)
+        self.client.post(self.url)
+        time.sleep(0.06)
+        self.assertEqual(self.breaker.state, 'half-open')
+
+        # Failed probe re-opens the breaker
+        self.assertEqual(self.client.post(self.url).status_code, 400)
+        self.assertEqual(self.client.post(self.url).status_code, 503)
+        self.assertEqual(server.calls, 3)
+
+        time.sleep(0.06)
+        self.assertEqual(self.client.post(self.url).status_code, 200)
+        self.assertEqual(self.breaker.state, 'closed')
+
+    def test_half_open_lets_one_probe_through_at_a_time(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, recovery_timeout=0)
+        self.addCleanup(breaker.reset)
+        breaker.record_failure(breaker.before_call())
+        self.assertEqual(breaker.before_call(), 'probe')
+        with self.assertRaises(ServiceUnavailableError):
+            breaker.before_call()
+        breaker.record_success('probe')
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_async_views_fail_fast_while_the_breaker_is_open(self):
+        server = self.fake_paystack()
+        server.fail_next(2)
+        with mock.patch.object(async_views.paystack, 'PAYSTACK_BASE_URL', server.base_url):
+            urls = [f'/api/v1/async/payments/{self.payment.pk}/initiate_payment/'] * 3
+            self.assertEqual([self.client.post(url).status_code for url in urls], [400, 400, 503])
+        self.assertEqual(server.calls, 2)
+
+    def test_token_bucket_is_shared_through_the_database(self):
+        first = TokenBucket('test', rate=10, capacity=2, max_wait=0)
+        second = TokenBucket('test', rate=10, capacity=2, max_wait=0.5)
+        self.assertEqual([first.reserve(), first.reserve()], [0, 0])
+        with self.assertRaises(ServiceUnavailableError):
+            first.reserve()
+        self.assertAlmostEqual(second.reserve(), 0.1, delta=0.02)
+
+    @override_settings(PAYSTACK_RATE_LIMIT=1, PAYSTACK_RATE_BURST=1, PAYSTACK_RATE_LIMIT_WAIT=0)
+    def test_rate_limited_calls_fail_fast_without_tripping_the_breaker(self):
+        server = self.fake_paystack()
+        self.assertEqual(self.client.post(self.url).status_code, 200)
+        for _ in range(3):
+            response = self.client.post(self.url)
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(server.calls, 1)
+        self.assertEqual(self.breaker.state, 'closed')
+
+
+@override_settings(PAYSTACK_RATE_LIMIT=0)
+class VerifyPaymentTests(TestCase):
+    """
+    The sync and async verify_payment views apply Paystack's status the same way
+    """
+    URLS = ('/api/v1/payments/{}/verify_payment/', '/api/v1/async/payments/{}/verify_payment/')
+
+    def setUp(self):
+        self.client = APIClient()
+        PaymentViewSet().get_paystack_breaker().reset()
+        self.server = FakePaystackServer().start()
+        self.addCleanup(self.server.stop)
+        for target in (PaymentViewSet, async_views.paystack):
+            patcher = mock.patch.object(target, 'PAYSTACK_BASE_URL', self.server.base_url)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def verify(self, paystack_status, payment_status='PENDING'):
+        """Verifies a payment in payment_status that Paystack reports in paystack_status, on each view"""
+        for url in self.URLS:
+            payment = Payment.objects.create(customer_name="Customer", amount='19.99', email="user@example.com")
+            payment.payment_reference = f"ref-{payment.pk}"
+            payment.save()
+            if payment_status != 'PENDING':
+                payment.transition_to(payment_status, payment_status == 'COMPLETED')
+            self.server.add_transaction(payment.payment_reference, status=paystack_status)
+            response = self.client.post(url.format(payment.pk))
+            payment.refresh_from_db()
+            yield response, payment
+
+    def test_settled_statuses_move_the_payment(self):
+        for response, payment in self.verify('success'):
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual((payment.status, payment.paid), ('COMPLETED', True))
+        with self.assertLogs('payments.models', 'ERROR'):
+            for paystack_status in FAILED_PAYSTACK_STATUSES:
+                for response, payment in self.verify(paystack_status):
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(payment.status, 'FAILED')
+
+    def test_pending_statuses_leave_the_payment_pending(self):
+        for paystack_status in ('ongoing', 'pending', 'queued'):
+            for response, payment in self.verify(paystack_status):
+                self.assertEqual(response.status_code, 202)
+                self.assertEqual(response.json()['data']['status'], paystack_status)
+                self.assertEqual(payment.status, 'PENDING')
+
+    def test_payments_no_longer_pending_are_a_conflict(self):
+        for response, payment in self.verify('success', payment_status='FAILED'):
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(payment.status, 'FAILED')
+        for response, payment in self.verify('failed', payment_status='COMPLETED'):
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(payment.status, 'COMPLETED')
+
+
+@override_settings(PAYSTACK_RATE_LIMIT=0)
+class AsyncPaymentViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.payment = Payment.objects.create(customer_name="Customer", amount='19.99', email="user@example.com")
+        PaymentViewSet().get_paystack_breaker().reset()
+        self.server = FakePaystackServer(secret_key=settings.PAYSTACK_SECRET_KEY).start()
+        self.addCleanup(self.server.stop)
+        patcher = mock.patch.object(async_views.paystack, 'PAYSTACK_BASE_URL', self.server.base_url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_initiate_and_verify_payment(self):
+        response = self.client.post(f'/api/v1/async/payments/{self.payment.pk}/initiate_payment/')
+        self.assertEqual(response.status_code, 200)
+        reference = response.json()['data']['reference']
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.payment_reference, reference)
+
+        self.server.settle(reference)
+        response = self.client.post(f'/api/v1/async/payments/{self.payment.pk}/verify_payment/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['reference'], reference)
+        self.payment.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.paid), ('COMPLETED', True))
+        self.assertEqual(self.server.calls, 2)
+        self.assertEqual(self.client.post('/api/v1/async/payments/999/verify_payment/').status_code, 404)
+
+    def test_replayed_initiate_payment_does_not_call_paystack_again(self):
+        url = f'/api/v1/async/payments/{self.payment.pk}/initiate_payment/'
+        first = self.client.post(url, HTTP_IDEMPOTENCY_KEY="async-initiate-1")
+        replayed = self.client.post(url, HTTP_IDEMPOTENCY_KEY="async-initiate-1")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(replayed.json(), first.json())
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.server.calls, 1)
+        self.assertEqual(self.client.post(url, HTTP_IDEMPOTENCY_KEY="async-initiate-2").status_code, 200)
+        self.assertEqual(self.server.calls, 2)
+
+
+@override_settings(PAYSTACK_RATE_LIMIT=0)
+class ReconcilePaymentsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        PaymentViewSet().get_paystack_breaker().reset()
+        self.server = FakePaystackServer(unknown_status=None).start()
+        self.addCleanup(self.server.stop)
+        patcher = mock.patch.object(PaystackMixin, 'PAYSTACK_BASE_URL', self.server.base_url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.payments = {}
+        for reference, paystack_status in [('ref-success', 'success'), ('ref-failed', 'failed'),
+                                           ('ref-abandoned', 'abandoned'), ('ref-ongoing', 'ongoing'),
+                                           ('ref-missing', None), (None, None)]:
+            self.payments[reference] = Payment.objects.create(
+                customer_name="Customer", amount='19.99', email="user@example.com", payment_reference=reference)
+            if paystack_status:
+                self.server.add_transaction(reference, amount=1999, status=paystack_status)
+        # Settled payments are not checked again
+        self.server.add_transaction('ref-settled', status='failed')
+        settled = Payment.objects.create(
+            customer_name="Customer", amount='19.99', email="user@example.com", payment_reference='ref-settled')
+        settled.mark_as_paid()
+
+    def statuses(self):
+        return {reference: Payment.objects.get(pk=payment.pk).status for reference, payment in self.payments.items()}
+
+    def test_command_applies_paystack_statuses_and_is_idempotent(self):
+        out = StringIO()
+        with self.assertLogs('payments', 'ERROR') as logs:
+            call_command('reconcile_payments', '--chunk-size', '2', stdout=out)
+        self.assertIn("Error verifying payment ref-missing", logs.output[-1])
+        self.assertEqual(out.getvalue().strip(), "Checked 5: 1 completed, 2 failed, 1 errors")
+        self.assertEqual(self.statuses(), {
+            'ref-success': 'COMPLETED', 'ref-failed': 'FAILED', 'ref-abandoned': 'FAILED',
+            'ref-ongoing': 'PENDING', 'ref-missing': 'PENDING', None: 'PENDING'})
+        self.assertEqual(self.server.calls, 5)
+        transitions = PaymentTransition.objects.filter(reason="Paystack reconciliation")
+        self.assertEqual(transitions.count(), 3)
+
+        # Only the payments still pending are checked again, and nothing changes
+        with self.assertLogs('payments', 'ERROR'):
+            results = reconcile_pending_payments(chunk_size=2)
+        self.assertEqual(results, {'checked': 2, 'completed': 0, 'failed': 0, 'errors': 1})
+        self.assertEqual(self.server.calls, 7)
+        self.assertEqual(transitions.count(), 3)
+        rollup = PaymentRollup.objects.get(payment_model='payment', status='COMPLETED')
+        self.assertEqual((rollup.count, rollup.total_amount), (2, Decimal('39.98')))
+
+    def test_verify_batch_checks_at_most_limit_payments(self):
+        url = '/api/v1/payments/verify_batch/'
+        response = self.client.post(url, {'limit': 2}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'], {'checked': 2, 'completed': 1, 'failed': 1, 'errors': 0})
+        self.assertEqual(self.statuses()['ref-abandoned'], 'PENDING')
+
+        with self.assertLogs('payments', 'ERROR'):
+            response = self.client.post(url, format='json')
+        self.assertEqual(response.json()['data'], {'checked': 3, 'completed': 0, 'failed': 1, 'errors': 1})
+        self.assertEqual(self.client.post(url, {'limit': "all"}, format='json').status_code, 400)
+
+
+@override_settings(PAYSTACK_WEBHOOK_RETRY_DELAY=5, PAYSTACK_WEBHOOK_MAX_ATTEMPTS=3)
+class WebhookQueueTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def deliver(self, payload):
+        body = json.dumps(payload).encode('utf-8')
+        signature = hmac.new(settings.PAYSTACK_SECRET_KEY.encode('utf-8'), body, hashlib.sha512).hexdigest()
+        return self.client.post('/api/v1/webhook/paystack/', body, content_type='application/json',
+                                HTTP_X_PAYSTACK_SIGNATURE=signature)
+
+    def make_due(self):
+        WebhookEvent.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+
+    def test_duplicate_deliveries_are_stored_once(self):
+        payload = {'event': 'charge.success', 'data': {'id': 7, 'reference': 'ref-1'}}
+        self.assertEqual([self.deliver(payload).status_code for _ in range(2)], [200, 200])
+        self.assertEqual(list(WebhookEvent.objects.values_list('event_key', flat=True)), ['charge.success:7'])
+        # The same transaction's failure is a different event
+        self.assertEqual(self.deliver({'event': 'charge.failed', 'data': {'id': 7, 'reference': 'ref-1'}}).status_code, 200)
+        # Deliveries without an id or reference are deduplicated by body
+        payload = {'event': 'transfer.success', 'data': {'amount': 100}}
+        body = json.dumps(payload).encode('utf-8')
+        self.assertTrue(enqueue_webhook_event(payload, body))
+        self.assertFalse(enqueue_webhook_event(payload, body))
+        self.assertEqual(WebhookEvent.objects.count(), 3)
+
+    def test_events_are_applied_in_batches(self):
+        payments = [
+            Payment.objects.create(customer_name="Customer", amount='19.99', email="user@example.com",
+                                   payment_reference=f"ref-{i}")
+            for i in range(5)
+        ]
+        for i in range(4):
+            self.deliver({'event': 'charge.success', 'data': {'id': i, 'reference': f"ref-{i}"}})
+        self.deliver({'event': 'charge.failed', 'data': {'id': 4, 'reference': 'ref-4'}})
+        self.deliver({'event': 'transfer.success', 'data': {'id': 5}})
+
+        # A fixed number of queries per batch, not per event: claim the events, look up and move
+        # their payments, log the transitions, roll them up and mark the events (plus savepoints)
+        with self.assertNumQueries(14):
+            self.assertEqual(process_webhook_events(batch_size=4), 4)
+        self.assertEqual(WebhookEvent.objects.filter(status='RECEIVED').count(), 2)
+        self.assertEqual(drain_webhook_events(batch_size=4), 2)
+        self.assertEqual(drain_webhook_events(), 0)
+
+        self.assertEqual(
+            [Payment.objects.get(pk=payment.pk).status for payment in payments],
+            ['COMPLETED'] * 4 + ['FAILED'])
+        self.assertEqual(WebhookEvent.objects.filter(status='PROCESSED').count(), 6)
+        self.assertEqual(PaymentTransition.objects.filter(reason__startswith="Webhook").count(), 5)
+
+    def test_event_for_an_unsaved_payment_is_retried_with_backoff(self):
+        self.assertEqual(self.deliver({'event': 'charge.success', 'data': {'id': 1, 'reference': 'ref-late'}}).status_code, 200)
+        self.assertEqual(drain_webhook_events(), 1)
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts, event.error), ('RECEIVED', 1, "Payment not found"))
+        self.assertAlmostEqual(next_retry_delay(), 5, delta=1)
+        # Not due yet
+        self.assertEqual(process_webhook_events(), 0)
+
+        payment = Payment.objects.create(
+            customer_name="Customer", amount='19.99', email="user@example.com", payment_reference='ref-late')
+        self.make_due()
+        self.assertEqual(process_webhook_events(), 1)
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts, event.error), ('PROCESSED', 2, None))
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'COMPLETED')
+        self.assertIsNone(next_retry_delay())
+
+    def test_event_fails_after_max_attempts(self):
+        self.deliver({'event': 'charge.success', 'data': {'id': 1, 'reference': 'ref-unknown'}})
+        process_webhook_events()
+        self.make_due()
+        process_webhook_events()
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), ('RECEIVED', 2))
+        # Backoff doubles
+        self.assertAlmostEqual((event.next_attempt_at - timezone.now()).total_seconds(), 10, delta=1)
+
+        self.make_due()
+        with self.assertLogs('payments.webhooks', 'ERROR'):
+            process_webhook_events()
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), ('FAILED', 3))
+        self.assertIsNone(next_retry_delay())
+
+
+class FakePaystackLifecycleTests(TestCase):
+    def test_settled_transactions_send_signed_webhooks_the_api_accepts(self):
+        client = APIClient()
+        payment = Payment.objects.create(customer_name="Customer", amount='19.99', email="user@example.com")
+        paystack = PaystackMixin()
+        with FakePaystackServer(secret_key=settings.PAYSTACK_SECRET_KEY) as server, \
+                mock.patch.object(PaystackMixin, 'PAYSTACK_BASE_URL', server.base_url):
+            reference = client.post(f'/api/v1/payments/{payment.pk}/initiate_payment/').json()['data']['reference']
+            self.assertEqual(paystack.verify_payment(reference)['data']['status'], 'ongoing')
+
+            body, signature = server.settle(reference)
+            self.assertTrue(paystack.verify_webhook_signature(body, signature))
+            verified = paystack.verify_payment(reference)['data']
+            self.assertEqual((verified['status'], verified['amount']), ('success', 1999))
+
+        url = '/api/v1/webhook/paystack/'
+        self.assertEqual(client.post(url, body, content_type='application/json', HTTP_X_PAYSTACK_SIGNATURE='0' * 128).status_code, 400)
+        self.assertEqual(client.post(url, body, content_type='application/json', HTTP_X_PAYSTACK_SIGNATURE=signature).status_code, 200)
+        drain_webhook_events()
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'COMPLETED')
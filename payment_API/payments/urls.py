@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import PaymentViewSet, PaymentHistoryViewSet, PaymentRefundViewSet, PaymentChargeViewSet
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'payments', PaymentViewSet, basename='payment')
@@ -15,5 +16,11 @@ urlpatterns = [
         path('webhook/paystack/', 
             PaymentViewSet.as_view({'post': 'paystack_webhook'}),
             name='paystack-webhook'),
+        path('async/payments/<int:pk>/initiate_payment/',
+            async_views.initiate_payment,
+            name='payment-initiate-payment-async'),
+        path('async/payments/<int:pk>/verify_payment/',
+            async_views.verify_payment,
+            name='payment-verify-payment-async'),
     ])),
 ]
\ No newline at end of file
@@ -1,55 +1,83 @@
 
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from .models import Payment, PaymentHistory, PaymentRefund, PaymentCharge
-from .serializers import PaymentSerializer, PaymentHistorySerializer, PaymentRefundSerializer, PaymentChargeSerializer
+from .models import Payment, PaymentHistory, PaymentHistoryNote, PaymentRefund, PaymentCharge
+from .serializers import PaymentSerializer, PaymentHistorySerializer, PaymentHistoryNoteSerializer, PaymentRefundSerializer, PaymentChargeSerializer
 from rest_framework.decorators import action
 from .paystack import PaystackMixin
+from .resilience import ServiceUnavailableError
+from .bulk import BulkCreateMixin
+from .cache import CachedResponseMixin
+from .export import EXPORT_MODELS, StreamingExportMixin
+from .fast_serializers import (
+    FastReadMixin, FastPaymentSerializer, FastPaymentHistorySerializer,
+    FastPaymentRefundSerializer, FastPaymentChargeSerializer,
+)
+from .filters import PaymentFilterMixin
+from .idempotency import IdempotentCreateMixin, idempotent
+from .pagination import NoteCursorPagination
+from .reconcile import FAILED_PAYSTACK_STATUSES, reconcile_pending_payments
+from .rollups import payment_summary
+from .routers import replica_reads
+from .webhooks import enqueue_webhook_event
 import json
 import logging
+from django.db import DatabaseError
+from django.http import Http404
+from django.utils.dateparse import parse_date
 from django.urls import reverse
 
 # Create your views here.
 logger = logging.getLogger(__name__)
 
-class PaymentViewSet(PaystackMixin, viewsets.ModelViewSet):
+class PaymentViewSet(PaystackMixin, IdempotentCreateMixin, BulkCreateMixin, PaymentFilterMixin, CachedResponseMixin, FastReadMixin, StreamingExportMixin, viewsets.ModelViewSet):
     """
     Viewset for payment operations
     """
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
+    fast_serializer_class = FastPaymentSerializer
+    export_fields = EXPORT_MODELS['payments'][1]
+    VERIFY_BATCH_LIMIT = 500
     
     
 
     @action(detail=True, methods=['post'])
+    @idempotent
     def process(self, request, pk=None):
         payment = self.get_object()
         try:
-            payment.process_payment()
+            if not payment.process_payment():
+                return Response({
+                    "error": "Payment is not pending"}, status=status.HTTP_409_CONFLICT)
             return Response({
                 "message": "Payment processed successfully"}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({
                 "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     @action(detail=True, methods=['post'])
+    @idempotent
     def mark_failed(self, request, pk=None):
         payment = self.get_object()
         try:
-            payment.mark_as_failed()
+            if not payment.mark_as_failed():
+                return Response({
+                    "error": "Payment is not pending"}, status=status.HTTP_409_CONFLICT)
             return Response({
                 "message": "Payment marked as failed"}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({
                 "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     @action(detail=True, methods=['post'])
+    @idempotent
     def initiate_payment(self, request, pk=None):
         payment = self.get_object()
         callback_url = request.build_absolute_uri(reverse('payment-process', kwargs={'pk': str(payment.transaction_id)}))
         try:
-            paystack_response = self.initialize_payment(amount=float(payment.amount), email=payment.email, callback_url=callback_url)
+            paystack_response = self.initialize_payment(amount=payment.amount, email=payment.email, callback_url=callback_url)
 
             payment.payment_reference = paystack_response['data']['reference']
-            payment.save()
+            payment.save(update_fields=['payment_reference', 'updated_at'])
 
             return Response({
                 "status": "success",
@@ -59,37 +87,94 @@ class PaymentViewSet(PaystackMixin, viewsets.ModelViewSet):
                     "reference": paystack_response['data']['reference']
                     }
             })
+        except ServiceUnavailableError as e:
+            return Response({
+                "error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': str(e.retry_after)})
         except Exception as e:
             return Response({
                 "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     @action(detail=True, methods=['post'])
+    @idempotent
     def verify_payment(self, request, pk=None):
         payment = self.get_object()
     
         reference = payment.payment_reference
         try:
-            verification_response = self.verify_payment(reference)
-            
-            if verification_response['data']['status'] == "success":
-                payment.mark_as_paid()
-               
+            # The action shadows PaystackMixin.verify_payment on this class
+            verification_response = PaystackMixin.verify_payment(self, reference)
+            paystack_status = verification_response['data']['status']
+
+            # Statuses that are neither settled nor failed (ongoing, pending...) leave the payment pending
+            if paystack_status == "success":
+                transitioned = payment.mark_as_paid()
+            elif paystack_status in FAILED_PAYSTACK_STATUSES:
+                transitioned = payment.mark_as_failed()
+            else:
                 return Response({
-                    "message": "Payment verified successfully", 
+                    "message": "Payment is still pending",
                     "data": verification_response['data']
-                    }, status=status.HTTP_200_OK)
-            else:
-                payment.mark_as_failed()
+                    }, status=status.HTTP_202_ACCEPTED)
+            if not transitioned:
+                return Response({
+                    "error": "Payment is not pending",
+                    "data": verification_response['data']
+                    }, status=status.HTTP_409_CONFLICT)
+            if paystack_status == "success":
                 return Response({
-                    "message": "Payment failed", 
+                    "message": "Payment verified successfully",
                     "data": verification_response['data']
-                    }, status=status.HTTP_400_BAD_REQUEST)
+                    }, status=status.HTTP_200_OK)
+            return Response({
+                "message": "Payment failed",
+                "data": verification_response['data']
+                }, status=status.HTTP_400_BAD_REQUEST)
+        except ServiceUnavailableError as e:
+            return Response({
+                "error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': str(e.retry_after)})
         except Exception as e:
             logger.error(f"Error verifying payment: {str(e)}")
             return Response({
                 "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-       
 
-    
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def verify_batch(self, request):
+        """
+        Verifies up to `limit` pending payments with Paystack in one request
+        Use the reconcile_payments management command for full backlogs
+        """
+        try:
+            limit = min(int(request.data.get('limit', self.VERIFY_BATCH_LIMIT)), self.VERIFY_BATCH_LIMIT)
+        except (TypeError, ValueError):
+            return Response({
+                "error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        results = reconcile_pending_payments(limit=limit)
+        return Response({
+            "message": "Batch verification complete",
+            "data": results
+            }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """
+        Settled payment and refund totals by status, day and email domain
+        Reads the rollup table; narrow it with ?start=YYYY-MM-DD&end=YYYY-MM-DD
+        """
+        bounds = {}
+        for name in ('start', 'end'):
+            value = request.query_params.get(name)
+            if value:
+                try:
+                    bounds[name] = parse_date(value)
+                except ValueError:
+                    bounds[name] = None
+                if bounds[name] is None:
+                    return Response({
+                        "error": f"{name} must be a date (YYYY-MM-DD)"}, status=status.HTTP_400_BAD_REQUEST)
+        with replica_reads():
+            data = payment_summary(**bounds)
+        return Response(data, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['post'])
     def paystack_webhook(self, request):
         #Verify the webhook signature
@@ -100,41 +185,32 @@ class PaymentViewSet(PaystackMixin, viewsets.ModelViewSet):
         if not self.verify_webhook_signature(request.body, paystack_signature):
             return Response({
                 "error": "Invalid Paystack Signature"}, status=status.HTTP_400_BAD_REQUEST)
-        #Process the webhook
-        payload = json.loads(request.body)
-        event = payload['event']
-        data = payload['data']
-
+        #Queue the webhook; it is applied by the webhook workers
         try:
-            payment = Payment.objects.get(payment_reference=data['reference'])
-            if event == 'charge.success':
-                payment.mark_as_paid()
-                payment.save()
-            elif event == 'charge.failed':
-                payment.mark_as_failed()
-            return Response({
-                "message": "Webhook processed successfully"}, status=status.HTTP_200_OK)
-        except Payment.DoesNotExist:
-            logger.error(f"Payment with reference {data['reference']} not found")
-            return Response({
-                "error": "Payment not found"}, status=status.HTTP_400_BAD_REQUEST)
-        except Exception as e:
-            logger.error(f"Error processing webhook: {str(e)}")
+            payload = json.loads(request.body)
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict) or 'event' not in payload or 'data' not in payload:
             return Response({
-                "error": "Error processing webhook"}, status=status.HTTP_400_BAD_REQUEST)
+                "error": "Invalid webhook payload"}, status=status.HTTP_400_BAD_REQUEST)
+
+        enqueue_webhook_event(payload, request.body)
+        return Response({
+            "message": "Webhook received"}, status=status.HTTP_200_OK)
 
-        
-                
-        
 
-class PaymentHistoryViewSet(viewsets.ModelViewSet):
+class PaymentHistoryViewSet(IdempotentCreateMixin, PaymentFilterMixin, FastReadMixin, StreamingExportMixin, viewsets.ModelViewSet):
     """
     Viewset for payment history operations
     """
-    queryset = PaymentHistory.objects.all()
+    queryset = PaymentHistory.objects.select_related('original_payment')
     serializer_class = PaymentHistorySerializer
+    fast_serializer_class = FastPaymentHistorySerializer
+    export_fields = ['transaction_id', 'amount', 'customer_name', 'email', 'status', 'paid',
+                     'created_at', 'updated_at', 'original_payment']
 
     @action(detail=True, methods=['post'])
+    @idempotent
     def add_note(self, request, pk=None):
         payment_history = self.get_object()
         note = request.data.get('note')
@@ -143,42 +219,86 @@ class PaymentHistoryViewSet(viewsets.ModelViewSet):
             return Response({
                 "error": "Note is required"}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            payment_history.add_note(note)
+            entry = payment_history.add_note(note)
             return Response({
-                "message": "Note added successfully"}, status=status.HTTP_200_OK)
+                "message": "Note added successfully",
+                "data": PaymentHistoryNoteSerializer(entry).data}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({
                 "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-class PaymentRefundViewSet(viewsets.ModelViewSet):
+
+    @action(detail=True, methods=['get'])
+    def notes(self, request, pk=None):
+        """
+        Lists the notes of a payment history entry, oldest first
+        """
+        if not self.get_queryset().filter(pk=pk).exists():
+            raise Http404
+        queryset = PaymentHistoryNote.objects.filter(history_id=pk).only('id', 'note', 'created_at')
+        paginator = NoteCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(PaymentHistoryNoteSerializer(page, many=True).data)
+class PaymentRefundViewSet(IdempotentCreateMixin, BulkCreateMixin, PaymentFilterMixin, FastReadMixin, StreamingExportMixin, viewsets.ModelViewSet):
     """
     Viewset for payment refund operations
     """
-    queryset = PaymentRefund.objects.all()
+    queryset = PaymentRefund.objects.select_related('original_payment')
     serializer_class = PaymentRefundSerializer
+    fast_serializer_class = FastPaymentRefundSerializer
+    export_fields = EXPORT_MODELS['refunds'][1]
+    bulk_related_fields = {'original_payment': Payment}
 
     @action(detail=True, methods=['post'])
+    @idempotent
     def process_refund(self, request, pk=None):
         payment_refund = self.get_object()
         try:
-            payment_refund.process_refund()
+            if not payment_refund.process_refund():
+                return Response({
+                    "error": "Refund is not pending"}, status=status.HTTP_409_CONFLICT)
             return Response({
                 "message": "Refund processed successfully"}, status=status.HTTP_200_OK)
+        except DatabaseError as e:
+            return Response({
+                "error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
         except Exception as e:
             return Response({
                 "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     
-class PaymentChargeViewSet(viewsets.ModelViewSet):
+class PaymentChargeViewSet(IdempotentCreateMixin, BulkCreateMixin, PaymentFilterMixin, CachedResponseMixin, FastReadMixin, StreamingExportMixin, viewsets.ModelViewSet):
     """
     Viewset for payment charge operations
     """
     queryset = PaymentCharge.objects.all()
     serializer_class = PaymentChargeSerializer
+    fast_serializer_class = FastPaymentChargeSerializer
+    export_fields = EXPORT_MODELS['charges'][1]
+    TOTALS_BATCH_LIMIT = 1000
 
     @action(detail=True, methods=['get'])
     def calculate_total(self, request, pk=None):
-        payment_charge = self.get_object()
-        total = payment_charge.calculate_total()
+        def build():
+            payment_charge = self.get_object()
+            return {"total_amount": str(payment_charge.calculate_total())}, payment_charge.updated_at
+        return self.cached_response(request, pk, build)
+
+    @action(detail=False, methods=['post'])
+    def calculate_totals(self, request):
+        """
+        Returns the total amount of up to TOTALS_BATCH_LIMIT charges, computed
+        by the database in one query; unknown ids are listed under "missing"
+        """
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+            return Response({
+                "error": "ids must be a list of charge ids"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > self.TOTALS_BATCH_LIMIT:
+            return Response({
+                "error": f"At most {self.TOTALS_BATCH_LIMIT} ids per request"}, status=status.HTTP_400_BAD_REQUEST)
+        totals = PaymentCharge.calculate_totals(ids)
         return Response({
-            "total_amount": total}, status=status.HTTP_200_OK)
+            "totals": {pk: str(total) for pk, total in totals.items()},
+            "missing": [pk for pk in dict.fromkeys(ids) if pk not in totals],
+            }, status=status.HTTP_200_OK)
    
@@ -0,0 +1,195 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from datetime import timedelta
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Min, Q
+from django.utils import timezone
+from .models import Payment, WebhookEvent
+from .sqlite import serialized_atomic
+import hashlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Event types that move a payment out of PENDING, with the (status, paid) they set.
+PAYMENT_EVENT_UPDATES = {
+    'charge.success': ('COMPLETED', True),
+    'charge.failed': ('FAILED', False),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+# Timer that drains the queue when the earliest deferred event is due, and its monotonic due time
+_retry_timer = None
+_retry_due = None
+
+
+def webhook_event_key(payload, body):
+    """
+    Returns the idempotency key for a webhook delivery
+    Uses the Paystack event id when present, otherwise a digest of the raw body
+    """
+    data = payload.get('data') or {}
+    event_id = data.get('id') or data.get('reference')
+    if event_id is None:
+        return f"sha256:{hashlib.sha256(body).hexdigest()}"
+    return f"{payload.get('event')}:{event_id}"
+
+
+def enqueue_webhook_event(payload, body):
+    """
+    Durably stores a webhook delivery for asynchronous processing
+    Returns False if the same event was already received
+    """
+    data = payload.get('data') or {}
+    try:
+        with serialized_atomic():
+            WebhookEvent.objects.create(
+                event_key=webhook_event_key(payload, body),
+                event=payload.get('event', ''),
+                reference=data.get('reference'),
+                payload=payload,
+            )
+    except IntegrityError:
+        logger.info(f"Duplicate webhook delivery for {data.get('reference')} ignored")
+        return False
+    transaction.on_commit(schedule_webhook_processing)
+    return True
+
+
+def retry_delay(attempts):
+    """
+    Seconds to wait before retrying an event that has failed attempts times
+    Doubles from PAYSTACK_WEBHOOK_RETRY_DELAY up to PAYSTACK_WEBHOOK_RETRY_MAX_DELAY
+    """
+    base = getattr(settings, 'PAYSTACK_WEBHOOK_RETRY_DELAY', 5)
+    return min(base * 2 ** (attempts - 1), getattr(settings, 'PAYSTACK_WEBHOOK_RETRY_MAX_DELAY', 3600))
+
+
+def process_webhook_events(batch_size=500):
+    """
+    Claims a batch of due webhook events and applies them in one transaction
+    Payment status updates are grouped so each event type costs one UPDATE
+    Events whose payment is not saved yet are deferred with backoff, and
+    marked FAILED once they have been tried PAYSTACK_WEBHOOK_MAX_ATTEMPTS times
+    Returns the number of events handled
+    """
+    with serialized_atomic():
+        now = timezone.now()
+        events = list(
+            WebhookEvent.objects.select_for_update(skip_locked=True)
+            .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now), status='RECEIVED')
+            .order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0
+
+        references = {}
+        for event in events:
+            if event.event in PAYMENT_EVENT_UPDATES and event.reference:
+                references.setdefault(event.event, set()).add(event.reference)
+
+        known = set(
+            Payment.objects.filter(payment_reference__in=set().union(*references.values()))
+            .values_list('payment_reference', flat=True)
+        ) if references else set()
+
+        for event_type, refs in references.items():
+            # Only PENDING rows move, so replays and out-of-order duplicates are no-ops.
+            new_status, paid = PAYMENT_EVENT_UPDATES[event_type]
+            Payment.transition_queryset(
+                Payment.objects.filter(payment_reference__in=refs), new_status, paid, reason=f"Webhook {event_type}")
+
+        max_attempts = getattr(settings, 'PAYSTACK_WEBHOOK_MAX_ATTEMPTS', 10)
+        processed_ids, deferred, failed = [], {}, []
+        for event in events:
+            if event.event not in PAYMENT_EVENT_UPDATES or event.reference in known:
+                processed_ids.append(event.pk)
+            elif event.reference and event.attempts + 1 < max_attempts:
+                # The webhook can arrive before the payment's reference is saved
+                deferred.setdefault(event.attempts + 1, []).append(event.pk)
+            else:
+                failed.append(event)
+        WebhookEvent.objects.filter(pk__in=processed_ids).update(
+            status='PROCESSED', processed_at=now, attempts=F('attempts') + 1, error=None)
+        for attempts, pks in deferred.items():
+            WebhookEvent.objects.filter(pk__in=pks).update(
+                attempts=attempts, next_attempt_at=now + timedelta(seconds=retry_delay(attempts)),
+                error="Payment not found")
+        WebhookEvent.objects.filter(pk__in=[event.pk for event in failed]).update(
+            status='FAILED', processed_at=now, attempts=F('attempts') + 1, error="Payment not found")
+
+    for event in failed:
+        logger.error(f"Webhook event {event.pk}: payment {event.reference} not found after {event.attempts + 1} attempts")
+    logger.info(f"Processed {len(events)} webhook events")
+    return len(events)
+
+
+def next_retry_delay():
+    """
+    Seconds until the earliest deferred webhook event is due, or None if none is waiting
+    """
+    next_attempt_at = WebhookEvent.objects.filter(
+        status='RECEIVED', next_attempt_at__isnull=False).aggregate(due=Min('next_attempt_at'))['due']
+    if next_attempt_at is None:
+        return None
+    return max(0.0, (next_attempt_at - timezone.now()).total_seconds())
+
+
+def drain_webhook_events(batch_size=500):
+    """
+    Processes webhook events until the queue is empty
+    """
+    total = 0
+    while True:
+        handled = process_webhook_events(batch_size=batch_size)
+        if not handled:
+            return total
+        total += handled
+
+
+def _drain_in_worker():
+    close_old_connections()
+    try:
+        drain_webhook_events()
+        delay = next_retry_delay()
+    except Exception as e:
+        logger.error(f"Error processing webhook events: {e}")
+        delay = None
+    finally:
+        close_old_connections()
+    if delay is not None:
+        schedule_webhook_processing(delay=delay)
+
+
+def schedule_webhook_processing(delay=0):
+    """
+    Hands queue draining to the in-process worker pool, after delay seconds
+    Only the earliest delayed drain is kept, since one drain handles every
+    due event
+    Disabled when PAYSTACK_WEBHOOK_LOCAL_WORKERS is 0, leaving the queue to
+    the process_webhooks management command
+    """
+    global _executor, _retry_timer, _retry_due
+    workers = getattr(settings, 'PAYSTACK_WEBHOOK_LOCAL_WORKERS', 1)
+    if workers <= 0:
+        return
+    if delay > 0:
+        due = time.monotonic() + delay
+        with _executor_lock:
+            if _retry_timer is not None and _retry_timer.is_alive() and _retry_due <= due:
+                return
+            if _retry_timer is not None:
+                _retry_timer.cancel()
+            _retry_timer = threading.Timer(delay, schedule_webhook_processing)
+            _retry_timer.daemon = True
+            _retry_due = due
+            _retry_timer.start()
+        return
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='paystack-webhooks')
+    _executor.submit(_drain_in_worker)
@@ -0,0 +1,68 @@
+"""
+Catalog lookup latency from 5 to 1M products, indexed vs the old list scans
+
+    python benchmark_catalog.py [--sizes 5 1000 100000 1000000]
+"""
+import argparse
+import random
+import time
+
+from catalog import Catalog
+
+CATEGORIES = ["electronics", "sports", "home", "clothing", "books"]
+
+
+def make_products(count):
+    return [
+        {
+            "id": str(i),
+            "name": f"Product {i}",
+            "price": round(random.uniform(1, 1000), 2),
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "stock": 1000,
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def per_call_us(func, args, repeat=1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for arg in args:
+            func(arg)
+    return (time.perf_counter() - started) / (len(args) * repeat) * 1e6
+
+
+def run(size, lookups):
+    products = make_products(size)
+    started = time.perf_counter()
+    catalog = Catalog(products)
+    build = time.perf_counter() - started
+
+    ids = [str(random.randint(1, size)) for _ in range(lookups)]
+    carts = [ids[i:i + 10] for i in range(0, lookups, 10)]
+    prices = [catalog.get(product_id)["price"] for product_id in ids]
+    scan_ids = ids[:max(1, min(lookups, 2_000_000 // size))]
+
+    get = per_call_us(catalog.get, ids)
+    scan = per_call_us(lambda product_id: next(p for p in products if p["id"] == product_id), scan_ids)
+    cart = per_call_us(lambda cart: [catalog.get(product_id) for product_id in cart], carts)
+    price_range = per_call_us(lambda price: catalog.in_price_range(price, price), prices)
+    catalog.adjust_stock(ids[0], -1)
+    return build, get, scan, cart, price_range
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 1_000, 100_000, 1_000_000])
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args()
+
+    print(f"{'products':>10} {'build s':>8} {'get us':>8} {'scan us':>10} {'10-item cart us':>16} {'price point us':>15}")
+    for size in args.sizes:
+        build, get, scan, cart, price_range = run(size, args.lookups)
+        print(f"{size:>10} {build:>8.2f} {get:>8.3f} {scan:>10.1f} {cart:>16.2f} {price_range:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Memory held per order and per product by the in-memory engine: the dict
+records it used to keep against the compact records in records.py
+
+    python benchmark_memory.py [--orders 100000] [--products 10000] [--customers 5000]
+"""
+import argparse
+import gc
+import random
+import tracemalloc
+import uuid
+from datetime import datetime
+
+from catalog import Catalog
+from records import OrderStore, Product
+
+
+def new_order(rng, products, customers):
+    """An order dict as checkout builds it, with its strings freshly parsed as if from a request"""
+    customer = rng.randrange(customers)
+    items = []
+    for product in rng.sample(products, rng.randint(1, 4)):
+        quantity = rng.randint(1, 5)
+        items.append({
+            "product_id": product["id"],
+            "name": product["name"],
+            "price": product["price"],
+            "quantity": quantity,
+            "subtotal": product["price"] * quantity
+        })
+    return {
+        "id": str(uuid.uuid4()),
+        "items": items,
+        "total": sum(item["subtotal"] for item in items),
+        "shipping_address": f"{customer} Benchmark Street, Lagos",
+        "email": f"customer{customer}@example.com",
+        "status": "confirmed",
+        "created_at": datetime.utcnow().isoformat()
+    }
+
+
+def retained(build):
+    """Bytes still allocated after build() returns, and its result"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--customers", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows = [
+        {"id": str(i), "name": f"Product {i}", "price": round(random.Random(i).uniform(1, 1000), 2),
+         "category": f"category {i % 20}", "stock": 100}
+        for i in range(args.products)
+    ]
+
+    dict_products, catalog = retained(lambda: Catalog(dict(row) for row in rows))
+    slotted_products, _ = retained(lambda: Catalog(Product.from_dict(row) for row in rows))
+
+    def dict_orders():
+        rng = random.Random(args.seed)
+        orders, by_email = {}, {}
+        for _ in range(args.orders):
+            order = new_order(rng, rows, args.customers)
+            orders[order["id"]] = order
+            by_email.setdefault(order["email"], []).append(order["id"])
+        return orders
+
+    def compact_orders():
+        rng = random.Random(args.seed)
+        store = OrderStore()
+        for _ in range(args.orders):
+            store.add(new_order(rng, rows, args.customers))
+        return store
+
+    dict_bytes, _ = retained(dict_orders)
+    compact_bytes, _ = retained(compact_orders)
+
+    print(f"{'record':<8} {'layout':<22} {'bytes each':>10}")
+    print(f"{'product':<8} {'dict':<22} {dict_products / args.products:>10.0f}")
+    print(f"{'product':<8} {'slotted Product':<22} {slotted_products / args.products:>10.0f}")
+    print(f"{'order':<8} {'dict + email index':<22} {dict_bytes / args.orders:>10.0f}")
+    print(f"{'order':<8} {'OrderStore columns':<22} {compact_bytes / args.orders:>10.0f}")
+    print(f"orders: {dict_bytes / compact_bytes:.1f}x smaller, "
+          f"{(dict_bytes - compact_bytes) / 2**20:.1f} MiB saved over {args.orders} orders")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Hot-path latency of each storage engine: product lookup, checkout
+(reserve + order insert) and order lookup
+
+    python benchmark_storage.py [--engines memory sqlite] [--products 100000] [--orders 20000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+from storage import open_storage
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    return ordered[len(ordered) // 2] * 1e6, ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1e6
+
+
+def timed(func, args):
+    samples = []
+    for arg in args:
+        started = time.perf_counter()
+        func(arg)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def run(storage, products, orders):
+    storage.seed_products(
+        {"id": str(i), "name": f"Product {i}", "price": round(random.uniform(1, 1000), 2),
+         "category": "bench", "stock": 1_000_000}
+        for i in range(products)
+    )
+    ids = [str(random.randrange(products)) for _ in range(orders)]
+
+    def checkout(product_id):
+        reservation = storage.reserve([(product_id, 1)])
+        product = storage.get_product(product_id)
+        order = {
+            "id": str(uuid.uuid4()),
+            "items": [{"product_id": product_id, "name": product["name"], "price": product["price"],
+                       "quantity": 1, "subtotal": product["price"]}],
+            "total": product["price"],
+            "shipping_address": "1 Benchmark Way",
+            "email": "bench@example.com",
+            "status": "confirmed",
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        storage.place_order(order, reservation.id)
+        order_ids.append(order["id"])
+
+    order_ids = []
+    return {
+        "get product": percentiles(timed(storage.get_product, ids)),
+        "checkout": percentiles(timed(checkout, ids)),
+        "get order": percentiles(timed(storage.get_order, order_ids)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--engines", nargs="+", default=["memory", "sqlite"], choices=["memory", "sqlite"])
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--orders", type=int, default=20_000)
+    args = parser.parse_args()
+
+    print(f"{'engine':<8} {'operation':<12} {'p50 us':>8} {'p99 us':>8}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for engine in args.engines:
+            url = "memory" if engine == "memory" else f"sqlite:///{os.path.join(tmpdir, 'checkout.db')}"
+            storage = open_storage(url)
+            try:
+                results = run(storage, args.products, args.orders)
+            finally:
+                storage.close()
+            for operation, (p50, p99) in results.items():
+                print(f"{engine:<8} {operation:<12} {p50:>8.1f} {p99:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
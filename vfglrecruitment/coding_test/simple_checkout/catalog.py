@@ -0,0 +1,118 @@
+from bisect import bisect_left, bisect_right
+import threading
+
+
+class Catalog:
+    """
+    In-memory product store with an id index, a category index and a
+    sorted price index, so lookups don't scan the whole catalog
+    """
+
+    def __init__(self, products=()):
+        self._by_id = {}
+        # category -> {product_id: None}, an insertion-ordered set
+        self._by_category = {}
+        # Parallel lists sorted by price, for range queries
+        self._prices = []
+        self._price_ids = []
+        self._lock = threading.RLock()
+        # product_id -> Lock guarding that product's stock, created on first use
+        self._stock_locks = {}
+        self.extend(products)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, product_id):
+        return product_id in self._by_id
+
+    def extend(self, products):
+        """Add many products, rebuilding the price index once"""
+        with self._lock:
+            for product in products:
+                self._add(product)
+            order = sorted((p["price"], p["id"]) for p in self._by_id.values())
+            self._prices = [price for price, _ in order]
+            self._price_ids = [product_id for _, product_id in order]
+
+    def add(self, product):
+        """Add one product"""
+        with self._lock:
+            self._add(product)
+            self._index_price(product)
+
+    def _add(self, product):
+        if product["id"] in self._by_id:
+            raise ValueError(f"Product {product['id']} already exists")
+        self._by_id[product["id"]] = product
+        self._by_category.setdefault(product["category"], {})[product["id"]] = None
+
+    def _index_price(self, product):
+        position = bisect_right(self._prices, product["price"])
+        self._prices.insert(position, product["price"])
+        self._price_ids.insert(position, product["id"])
+
+    def _unindex_price(self, product):
+        position = bisect_left(self._prices, product["price"])
+        while self._price_ids[position] != product["id"]:
+            position += 1
+        del self._prices[position]
+        del self._price_ids[position]
+
+    def get(self, product_id):
+        """Get a product by id, or None"""
+        return self._by_id.get(product_id)
+
+    def all(self):
+        """All products, in the order they were added"""
+        return list(self._by_id.values())
+
+    def by_category(self, category):
+        """Products in a category, in the order they were added"""
+        ids = self._by_category.get(category, {})
+        return [self._by_id[product_id] for product_id in ids]
+
+    def in_price_range(self, min_price=None, max_price=None):
+        """Products priced between min_price and max_price (inclusive), cheapest first"""
+        start = 0 if min_price is None else bisect_left(self._prices, min_price)
+        end = len(self._prices) if max_price is None else bisect_right(self._prices, max_price)
+        return [self._by_id[product_id] for product_id in self._price_ids[start:end]]
+
+    def update(self, product_id, **changes):
+        """Change product fields, keeping the category and price indexes in step"""
+        with self._lock:
+            product = self._by_id[product_id]
+            if "id" in changes and changes["id"] != product_id:
+                raise ValueError("Product id cannot change")
+            if "category" in changes and changes["category"] != product["category"]:
+                del self._by_category[product["category"]][product_id]
+                self._by_category.setdefault(changes["category"], {})[product_id] = None
+            if "price" in changes and changes["price"] != product["price"]:
+                self._unindex_price(product)
+                product["price"] = changes["price"]
+                self._index_price(product)
+            with self.stock_lock(product_id):
+                product.update(changes)
+            return product
+
+    def stock_lock(self, product_id):
+        """The lock guarding one product's stock; unrelated products never share one"""
+        lock = self._stock_locks.get(product_id)
+        if lock is None:
+            lock = self._stock_locks.setdefault(product_id, threading.Lock())
+        return lock
+
+    def adjust_stock(self, product_id, delta):
+        """Add delta (negative to take) to a product's stock; stock is not indexed"""
+        product = self._by_id[product_id]
+        with self.stock_lock(product_id):
+            product["stock"] += delta
+            return product["stock"]
+
+    def remove(self, product_id):
+        """Remove a product and its index entries"""
+        with self._lock:
+            product = self._by_id.pop(product_id)
+            del self._by_category[product["category"]][product_id]
+            self._unindex_price(product)
+            return product
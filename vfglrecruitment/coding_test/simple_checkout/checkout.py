@@ -1,22 +1,32 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, EmailStr
+from fastapi import FastAPI, HTTPException, Query
+from pydantic import BaseModel, EmailStr, Field
 from typing import List, Optional
 from datetime import datetime, timedelta
+import os
 import uuid
 
+from reservations import InsufficientStock, ProductNotFound, StockReservations
+from storage import open_storage
+
 app = FastAPI(title="Skill Test E-commerce API")
+# Handlers that use storage are plain functions: its calls block (sqlite3,
+# locks), so FastAPI runs them on its threadpool instead of the event loop
+
+# Stock held for carts; holds not checked out within RESERVATION_TTL seconds are released
+RESERVATION_TTL = 15 * 60
 
-# In-memory storage (for testing purposes)
-users_db = {}
-products_db = [
+# Storage engine: "memory" (per process, for testing) or "sqlite:///path/to/checkout.db",
+# which every uvicorn worker pointed at the same file shares
+storage = open_storage(os.getenv("CHECKOUT_STORAGE", "memory"), reservation_ttl=RESERVATION_TTL)
+SEED_PRODUCTS = [
     {"id": "1", "name": "Wireless Headphones", "price": 79.99, "category": "electronics", "stock": 50},
     {"id": "2", "name": "Running Shoes", "price": 89.99, "category": "sports", "stock": 30},
     {"id": "3", "name": "Coffee Maker", "price": 49.99, "category": "home", "stock": 20},
     {"id": "4", "name": "Laptop Stand", "price": 34.99, "category": "electronics", "stock": 40},
     {"id": "5", "name": "Yoga Mat", "price": 24.99, "category": "sports", "stock": 60},
 ]
+storage.seed_products(SEED_PRODUCTS)
 categories_db = ["electronics", "sports", "home", "clothing", "books"]
-orders_db = {}
 
 # ============ MODELS ============
 
@@ -35,12 +45,16 @@ class AuthResponse(BaseModel):
 
 class CartItem(BaseModel):
     product_id: str
-    quantity: int
+    quantity: int = Field(gt=0)
+
+class ReservationRequest(BaseModel):
+    items: List[CartItem]
 
 class CheckoutRequest(BaseModel):
     items: List[CartItem]
     shipping_address: str
     email: EmailStr
+    reservation_id: Optional[str] = None
 
 class CheckoutResponse(BaseModel):
     order_id: str
@@ -48,23 +62,27 @@ class CheckoutResponse(BaseModel):
     status: str
     message: str
 
+class BatchCheckoutRequest(BaseModel):
+    carts: List[CheckoutRequest] = Field(max_length=1000)
+
 # ============ AUTHENTICATION ENDPOINTS ============
 
 @app.post("/api/auth/register", response_model=AuthResponse)
-async def register(data: RegisterRequest):
+def register(data: RegisterRequest):
     """Register a new user"""
-    if data.email in users_db:
+    if storage.get_user(data.email):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     user_id = str(uuid.uuid4())
     token = f"token_{user_id}"
     
-    users_db[data.email] = {
+    if not storage.add_user({
         "id": user_id,
         "email": data.email,
         "name": data.name,
         "password": data.password  # In production, hash this!
-    }
+    }):
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     return {
         "token": token,
@@ -76,9 +94,9 @@ async def register(data: RegisterRequest):
     }
 
 @app.post("/api/auth/login", response_model=AuthResponse)
-async def login(data: LoginRequest):
+def login(data: LoginRequest):
     """Login user"""
-    user = users_db.get(data.email)
+    user = storage.get_user(data.email)
     
     if not user or user["password"] != data.password:
         raise HTTPException(status_code=401, detail="Invalid credentials")
@@ -104,50 +122,79 @@ async def get_categories():
     }
 
 @app.get("/api/categories/{category}/products")
-async def get_products_by_category(category: str):
+def get_products_by_category(category: str):
     """Get products by category"""
     if category not in categories_db:
         raise HTTPException(status_code=404, detail="Category not found")
     
-    filtered_products = [p for p in products_db if p["category"] == category]
     return {
         "category": category,
-        "products": filtered_products
+        "products": storage.products_by_category(category)
     }
 
 # ============ PRODUCTS ENDPOINTS ============
 
 @app.get("/api/products")
-async def get_products():
-    """Get all products"""
-    return {"products": products_db}
+def get_products(min_price: Optional[float] = None, max_price: Optional[float] = None):
+    """Get all products, or those in a price range (cheapest first)"""
+    if min_price is None and max_price is None:
+        return {"products": storage.list_products()}
+    return {"products": storage.products_in_price_range(min_price, max_price)}
 
 @app.get("/api/products/{product_id}")
-async def get_product(product_id: str):
+def get_product(product_id: str):
     """Get single product"""
-    product = next((p for p in products_db if p["id"] == product_id), None)
+    product = storage.get_product(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     return product
 
+# ============ RESERVATION ENDPOINTS ============
+
+def reserve_cart(items):
+    """Hold stock for every cart item or none, as an HTTP error if that fails"""
+    try:
+        return storage.reserve([(item.product_id, item.quantity) for item in items])
+    except ProductNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except InsufficientStock as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/reservations")
+def create_reservation(data: ReservationRequest):
+    """Hold stock for a cart until checkout, for RESERVATION_TTL seconds"""
+    reservation = reserve_cart(data.items)
+    return {
+        "reservation_id": reservation.id,
+        "expires_at": (datetime.utcnow() + timedelta(seconds=RESERVATION_TTL)).isoformat(),
+        "items": [{"product_id": product_id, "quantity": quantity} for product_id, quantity in reservation.items.items()]
+    }
+
+@app.delete("/api/reservations/{reservation_id}")
+def release_reservation(reservation_id: str):
+    """Give a held cart's stock back"""
+    if not storage.release_reservation(reservation_id):
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    return {"reservation_id": reservation_id, "status": "released"}
+
 # ============ CHECKOUT ENDPOINT ============
 
-@app.post("/api/checkout", response_model=CheckoutResponse)
-async def checkout(data: CheckoutRequest):
-    """Process checkout"""
-    
-    # Validate items and calculate total
+def held_reservation(data):
+    """The cart's existing hold, as an HTTP error if it expired or doesn't match the cart"""
+    reservation = storage.get_reservation(data.reservation_id)
+    if not reservation:
+        raise HTTPException(status_code=410, detail="Reservation expired or not found")
+    if StockReservations.merge((item.product_id, item.quantity) for item in data.items) != reservation.items:
+        raise HTTPException(status_code=400, detail="Cart does not match reservation")
+    return reservation
+
+def build_order(data, products):
+    """Order for a reserved cart, priced from products ({product_id: product})"""
     total = 0
     order_items = []
     
     for item in data.items:
-        product = next((p for p in products_db if p["id"] == item.product_id), None)
-        
-        if not product:
-            raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
-        
-        if product["stock"] < item.quantity:
-            raise HTTPException(status_code=400, detail=f"Insufficient stock for {product['name']}")
+        product = products[item.product_id]
         
         item_total = product["price"] * item.quantity
         total += item_total
@@ -159,14 +206,9 @@ async def checkout(data: CheckoutRequest):
             "quantity": item.quantity,
             "subtotal": item_total
         })
-        
-        # Update stock
-        product["stock"] -= item.quantity
     
-    # Create order
-    order_id = str(uuid.uuid4())
-    order = {
-        "id": order_id,
+    return {
+        "id": str(uuid.uuid4()),
         "items": order_items,
         "total": total,
         "shipping_address": data.shipping_address,
@@ -174,22 +216,113 @@ async def checkout(data: CheckoutRequest):
         "status": "confirmed",
         "created_at": datetime.utcnow().isoformat()
     }
-    
-    orders_db[order_id] = order
-    
+
+def order_confirmation(order):
     return {
-        "order_id": order_id,
-        "total": total,
+        "order_id": order["id"],
+        "total": order["total"],
         "status": "confirmed",
         "message": "Order placed successfully!"
     }
 
+@app.post("/api/checkout", response_model=CheckoutResponse)
+def checkout(data: CheckoutRequest):
+    """Process checkout"""
+    
+    # Hold stock for the whole cart (or use the cart's existing hold) before
+    # building the order, so a bad item leaves every product's stock untouched
+    if data.reservation_id:
+        reservation = held_reservation(data)
+    else:
+        reservation = reserve_cart(data.items)
+    
+    order = build_order(data, storage.get_products({item.product_id for item in data.items}))
+    if not storage.place_order(order, reservation.id):
+        raise HTTPException(status_code=410, detail="Reservation expired or not found")
+    
+    return order_confirmation(order)
+
+@app.post("/api/checkout/batch")
+def checkout_batch(data: BatchCheckoutRequest):
+    """Process many carts at once; each cart is confirmed or fails on its own"""
+    results = [None] * len(data.carts)
+    reservations = {}
+    
+    def failed(index, status_code, detail):
+        results[index] = {"status": "failed", "status_code": status_code, "detail": detail}
+    
+    # Carts with their own hold are checked against it; the rest are reserved together
+    to_reserve = []
+    for index, cart in enumerate(data.carts):
+        if not cart.reservation_id:
+            to_reserve.append(index)
+            continue
+        try:
+            reservations[index] = held_reservation(cart)
+        except HTTPException as e:
+            failed(index, e.status_code, e.detail)
+    
+    carts = [[(item.product_id, item.quantity) for item in data.carts[index].items] for index in to_reserve]
+    for index, outcome in zip(to_reserve, storage.reserve_many(carts)):
+        if isinstance(outcome, ProductNotFound):
+            failed(index, 404, str(outcome))
+        elif isinstance(outcome, InsufficientStock):
+            failed(index, 400, str(outcome))
+        else:
+            reservations[index] = outcome
+    
+    # One catalog pass prices every reserved cart
+    products = storage.get_products(
+        {item.product_id for index in reservations for item in data.carts[index].items})
+    orders = {index: build_order(data.carts[index], products) for index in reservations}
+    placed = storage.place_orders([(orders[index], reservations[index].id) for index in orders])
+    for (index, order), ok in zip(orders.items(), placed):
+        if ok:
+            results[index] = order_confirmation(order)
+        else:
+            failed(index, 410, "Reservation expired or not found")
+    
+    confirmed = sum(1 for result in results if result["status"] == "confirmed")
+    return {
+        "results": results,
+        "confirmed": confirmed,
+        "failed": len(results) - confirmed
+    }
+
 # ============ ORDER ENDPOINTS ============
 
+MAX_ORDER_IDS = 1000
+
+@app.get("/api/orders")
+def get_orders(
+    ids: Optional[str] = None,
+    email: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[int] = Query(None, ge=0),
+):
+    """Get orders by id (ids=a,b,c), or a customer's orders by email, oldest first"""
+    if ids is not None:
+        order_ids = [order_id for order_id in ids.split(",") if order_id]
+        if len(order_ids) > MAX_ORDER_IDS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_ORDER_IDS} ids per request")
+        found = storage.get_orders(order_ids)
+        return {
+            "orders": [found[order_id] for order_id in order_ids if order_id in found],
+            "missing": [order_id for order_id in order_ids if order_id not in found]
+        }
+    if email is not None:
+        orders, next_cursor = storage.orders_by_email(email, limit=limit, cursor=cursor)
+        return {
+            "email": email,
+            "orders": orders,
+            "next_cursor": next_cursor
+        }
+    raise HTTPException(status_code=400, detail="Pass ids or email")
+
 @app.get("/api/orders/{order_id}")
-async def get_order(order_id: str):
+def get_order(order_id: str):
     """Get order details"""
-    order = orders_db.get(order_id)
+    order = storage.get_order(order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     return order
@@ -211,12 +344,18 @@ async def root():
                 "products": "GET /api/categories/{category}/products"
             },
             "products": {
-                "list": "GET /api/products",
+                "list": "GET /api/products?min_price=&max_price=",
                 "detail": "GET /api/products/{id}"
             },
+            "reservations": {
+                "create": "POST /api/reservations",
+                "release": "DELETE /api/reservations/{id}"
+            },
             "checkout": {
                 "create": "POST /api/checkout",
-                "order": "GET /api/orders/{id}"
+                "batch": "POST /api/checkout/batch",
+                "order": "GET /api/orders/{id}",
+                "orders": "GET /api/orders?ids=a,b,c or GET /api/orders?email=&limit=&cursor="
             }
         }
     }
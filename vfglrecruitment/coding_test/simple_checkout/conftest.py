@@ -0,0 +1,29 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import checkout
+from storage import open_storage
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def storage_url(request, tmp_path):
+    """Every storage test runs against both engines"""
+    if request.param == "memory":
+        return "memory"
+    return f"sqlite:///{tmp_path / 'checkout.db'}"
+
+
+@pytest.fixture
+def storage(storage_url):
+    """A fresh engine holding checkout's seed products"""
+    engine = open_storage(storage_url, reservation_ttl=checkout.RESERVATION_TTL)
+    engine.seed_products(checkout.SEED_PRODUCTS)
+    yield engine
+    engine.close()
+
+
+@pytest.fixture
+def client(storage, monkeypatch):
+    """The checkout app, serving from the storage fixture"""
+    monkeypatch.setattr(checkout, "storage", storage)
+    return TestClient(checkout.app)
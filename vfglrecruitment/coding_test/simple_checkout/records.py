@@ -0,0 +1,177 @@
+from array import array
+from collections.abc import Mapping
+from datetime import datetime, timedelta
+import sys
+import threading
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def format_id(key):
+    """Canonical UUID string for 16 id bytes; str(uuid.UUID(bytes=key)) without the object"""
+    h = key.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+class Product(Mapping):
+    """
+    Slotted product record, a fraction of the size of a dict
+    Reads and writes like the dicts it replaces (product["stock"] -= 1),
+    and dict(product) gives the API representation
+    """
+    __slots__ = ("id", "name", "price", "category", "stock")
+
+    def __init__(self, id, name, price, category, stock):
+        self.id = id
+        self.name = name
+        self.price = price
+        # Ids and names are unique per product; only categories repeat
+        self.category = sys.intern(category)
+        self.stock = stock
+
+    @classmethod
+    def from_dict(cls, product):
+        return cls(**{field: product[field] for field in cls.__slots__})
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except (AttributeError, TypeError):
+            raise KeyError(field)
+
+    def __setitem__(self, field, value):
+        if field not in self.__slots__:
+            raise KeyError(field)
+        setattr(self, field, value)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def update(self, changes):
+        for field, value in changes.items():
+            self[field] = value
+
+
+class OrderStore:
+    """
+    Column-oriented order storage
+    Each order is a row number into per-field arrays, and line items live in
+    shared line arrays referenced by offset, so an order costs a few machine
+    words instead of a dict of dicts. Ids are kept as 16 raw bytes, repeated
+    strings (emails, addresses, product ids and names) are interned, and
+    created_at is stored as integer microseconds; get() rebuilds the exact
+    dict that was added
+    """
+
+    def __init__(self):
+        self._rows = {}
+        self._ids = []
+        self._emails = []
+        self._addresses = []
+        self._statuses = []
+        self._created = array("q")
+        self._totals = array("d")
+        self._line_starts = array("Q")
+        self._line_counts = array("I")
+        self._line_product_ids = []
+        self._line_names = []
+        self._line_prices = array("d")
+        self._line_quantities = array("Q")
+        # email -> row numbers, oldest first
+        self._by_email = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    @staticmethod
+    def _key(order_id):
+        """16-byte key for a canonical UUID string, or None for anything else"""
+        try:
+            key = bytes.fromhex(order_id.replace("-", ""))
+        except (ValueError, TypeError, AttributeError):
+            return None
+        return key if len(key) == 16 and format_id(key) == order_id else None
+
+    def add(self, order):
+        """Store an order dict as built by checkout; its id must be a canonical UUID string"""
+        key = self._key(order["id"])
+        if key is None:
+            raise ValueError(f"Order id {order['id']!r} is not a canonical UUID")
+        since_epoch = datetime.fromisoformat(order["created_at"]) - EPOCH
+        email = sys.intern(order["email"])
+        items = order["items"]
+        # Typed values are packed before taking the lock, so one that doesn't
+        # fit its column raises here instead of leaving the columns misaligned
+        created = array("q", [since_epoch // timedelta(microseconds=1)])
+        total = array("d", [order["total"]])
+        count = array("I", [len(items)])
+        prices = array("d", [item["price"] for item in items])
+        quantities = array("Q", [item["quantity"] for item in items])
+        product_ids = [sys.intern(item["product_id"]) for item in items]
+        names = [sys.intern(item["name"]) for item in items]
+        with self._lock:
+            row = len(self._ids)
+            self._ids.append(key)
+            self._emails.append(email)
+            self._addresses.append(sys.intern(order["shipping_address"]))
+            self._statuses.append(sys.intern(order["status"]))
+            self._created.extend(created)
+            self._totals.extend(total)
+            self._line_starts.append(len(self._line_prices))
+            self._line_counts.extend(count)
+            self._line_product_ids.extend(product_ids)
+            self._line_names.extend(names)
+            self._line_prices.extend(prices)
+            self._line_quantities.extend(quantities)
+            self._by_email.setdefault(email, array("Q")).append(row)
+            self._rows[key] = row
+
+    def _order(self, row):
+        start = self._line_starts[row]
+        items = []
+        for line in range(start, start + self._line_counts[row]):
+            price, quantity = self._line_prices[line], self._line_quantities[line]
+            items.append({
+                "product_id": self._line_product_ids[line],
+                "name": self._line_names[line],
+                "price": price,
+                "quantity": quantity,
+                "subtotal": price * quantity
+            })
+        return {
+            "id": format_id(self._ids[row]),
+            "items": items,
+            "total": self._totals[row],
+            "shipping_address": self._addresses[row],
+            "email": self._emails[row],
+            "status": self._statuses[row],
+            "created_at": (EPOCH + timedelta(0, 0, self._created[row])).isoformat()
+        }
+
+    def get(self, order_id):
+        row = self._rows.get(self._key(order_id))
+        return None if row is None else self._order(row)
+
+    def __contains__(self, order_id):
+        return self._key(order_id) in self._rows
+
+    def get_many(self, order_ids):
+        """{order_id: order} for the ids that exist"""
+        orders = {}
+        for order_id in order_ids:
+            row = self._rows.get(self._key(order_id))
+            if row is not None:
+                orders[order_id] = self._order(row)
+        return orders
+
+    def by_email(self, email, limit=50, cursor=None):
+        """A page of an email's orders, oldest first, and the offset of the next page (or None)"""
+        rows = self._by_email.get(email, ())
+        start = cursor or 0
+        page = rows[start:start + limit]
+        next_cursor = start + len(page) if start + len(page) < len(rows) else None
+        return [self._order(row) for row in page], next_cursor
@@ -0,0 +1,147 @@
+from contextlib import ExitStack
+import heapq
+import threading
+import time
+import uuid
+
+
+class ProductNotFound(Exception):
+    def __init__(self, product_id):
+        super().__init__(f"Product {product_id} not found")
+        self.product_id = product_id
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product):
+        super().__init__(f"Insufficient stock for {product['name']}")
+        self.product = product
+
+
+class Reservation:
+    __slots__ = ("id", "items", "expires_at")
+
+    def __init__(self, items, expires_at):
+        self.id = str(uuid.uuid4())
+        # product_id -> quantity, in cart order
+        self.items = items
+        # time.monotonic() deadline
+        self.expires_at = expires_at
+
+
+class StockReservations:
+    """
+    All-or-nothing stock holds on a Catalog
+    A cart's products are locked with the catalog's per-product stock locks,
+    taken in id order so concurrent carts can't deadlock, and carts with no
+    products in common never wait on each other. Holds that are neither
+    committed nor released within ttl seconds give their stock back.
+    """
+
+    def __init__(self, catalog, ttl=900):
+        self.catalog = catalog
+        self.ttl = ttl
+        self._holds = {}
+        # (expires_at, reservation_id) min-heap; entries for holds already
+        # committed or released are skipped when they come up, and the heap is
+        # rebuilt from the live holds once they make up half of it, so it stays
+        # proportional to the holds outstanding rather than to throughput * ttl
+        self._expiry = []
+        self._stale = 0
+        self._holds_lock = threading.Lock()
+
+    @staticmethod
+    def merge(items):
+        """Sum quantities per product from (product_id, quantity) pairs, keeping cart order"""
+        quantities = {}
+        for product_id, quantity in items:
+            if quantity <= 0:
+                raise ValueError(f"Quantity for product {product_id} must be positive")
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        return quantities
+
+    def reserve(self, items, ttl=None):
+        """
+        Take stock for every (product_id, quantity) in items, or for none of them
+        Raises ProductNotFound or InsufficientStock for the first bad item in cart order
+        """
+        self.expire()
+        quantities = self.merge(items)
+        products = {}
+        for product_id in quantities:
+            products[product_id] = self.catalog.get(product_id)
+            if products[product_id] is None:
+                raise ProductNotFound(product_id)
+
+        with ExitStack() as locks:
+            for product_id in sorted(quantities):
+                locks.enter_context(self.catalog.stock_lock(product_id))
+            for product_id, quantity in quantities.items():
+                if products[product_id]["stock"] < quantity:
+                    raise InsufficientStock(products[product_id])
+            for product_id, quantity in quantities.items():
+                products[product_id]["stock"] -= quantity
+
+        reservation = Reservation(quantities, time.monotonic() + (self.ttl if ttl is None else ttl))
+        with self._holds_lock:
+            self._holds[reservation.id] = reservation
+            heapq.heappush(self._expiry, (reservation.expires_at, reservation.id))
+        return reservation
+
+    def get(self, reservation_id):
+        """The live reservation with this id, or None if it was committed, released or expired"""
+        reservation = self._holds.get(reservation_id)
+        if reservation is None or reservation.expires_at <= time.monotonic():
+            return None
+        return reservation
+
+    def commit(self, reservation_id):
+        """Make a hold's stock deduction permanent; False if it already expired or was released"""
+        with self._holds_lock:
+            reservation = self._holds.get(reservation_id)
+            if reservation is None or reservation.expires_at <= time.monotonic():
+                return False
+            del self._holds[reservation_id]
+            self._discard()
+        return True
+
+    def release(self, reservation_id):
+        """Give a hold's stock back; False if it was already committed, released or expired"""
+        with self._holds_lock:
+            reservation = self._holds.pop(reservation_id, None)
+            if reservation is not None:
+                self._discard()
+        if reservation is None:
+            return False
+        self._restock(reservation)
+        return True
+
+    def expire(self, now=None):
+        """Release every hold past its deadline; returns how many were released"""
+        now = time.monotonic() if now is None else now
+        if not self._expiry or self._expiry[0][0] > now:
+            return 0
+        expired = []
+        with self._holds_lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                _, reservation_id = heapq.heappop(self._expiry)
+                reservation = self._holds.pop(reservation_id, None)
+                if reservation is not None:
+                    expired.append(reservation)
+                else:
+                    self._stale -= 1
+        for reservation in expired:
+            self._restock(reservation)
+        return len(expired)
+
+    def _discard(self):
+        """Counts a hold that left before its deadline; called with _holds_lock held"""
+        self._stale += 1
+        if self._stale * 2 > len(self._expiry):
+            self._expiry = [(reservation.expires_at, reservation.id) for reservation in self._holds.values()]
+            heapq.heapify(self._expiry)
+            self._stale = 0
+
+    def _restock(self, reservation):
+        for product_id, quantity in reservation.items.items():
+            if product_id in self.catalog:
+                self.catalog.adjust_stock(product_id, quantity)
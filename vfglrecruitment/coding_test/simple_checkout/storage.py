@@ -0,0 +1,508 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+from catalog import Catalog
+from records import OrderStore, Product
+from reservations import InsufficientStock, ProductNotFound, Reservation, StockReservations
+
+PRODUCT_COLUMNS = ("id", "name", "price", "category", "stock")
+
+
+class Storage(ABC):
+    """
+    What checkout.py needs from a storage engine
+    reserve() holds stock for a whole cart or raises ProductNotFound /
+    InsufficientStock; place_order() commits a hold and stores its order
+    together, returning False if the hold had already expired
+    """
+
+    @abstractmethod
+    def seed_products(self, products):
+        """Add products that don't exist yet"""
+
+    @abstractmethod
+    def get_product(self, product_id):
+        pass
+
+    @abstractmethod
+    def get_products(self, product_ids):
+        """{product_id: product} for the ids that exist, in one pass"""
+
+    @abstractmethod
+    def list_products(self):
+        pass
+
+    @abstractmethod
+    def products_by_category(self, category):
+        pass
+
+    @abstractmethod
+    def products_in_price_range(self, min_price=None, max_price=None):
+        pass
+
+    @abstractmethod
+    def get_user(self, email):
+        pass
+
+    @abstractmethod
+    def add_user(self, user):
+        """Store a user; False if the email is already registered"""
+
+    @abstractmethod
+    def reserve(self, items, ttl=None):
+        pass
+
+    def reserve_many(self, carts, ttl=None):
+        """
+        reserve() for each cart in carts; returns a Reservation or the
+        ProductNotFound / InsufficientStock raised, per cart
+        """
+        results = []
+        for items in carts:
+            try:
+                results.append(self.reserve(items, ttl=ttl))
+            except (ProductNotFound, InsufficientStock) as e:
+                results.append(e)
+        return results
+
+    @abstractmethod
+    def get_reservation(self, reservation_id):
+        pass
+
+    @abstractmethod
+    def release_reservation(self, reservation_id):
+        pass
+
+    @abstractmethod
+    def expire_reservations(self):
+        pass
+
+    @abstractmethod
+    def place_order(self, order, reservation_id):
+        pass
+
+    def place_orders(self, orders):
+        """place_order() for each (order, reservation_id); returns a bool per order"""
+        return [self.place_order(order, reservation_id) for order, reservation_id in orders]
+
+    @abstractmethod
+    def get_order(self, order_id):
+        pass
+
+    @abstractmethod
+    def get_orders(self, order_ids):
+        """{order_id: order} for the ids that exist"""
+
+    @abstractmethod
+    def orders_by_email(self, email, limit=50, cursor=None):
+        """
+        Orders for an email, oldest first, limit at a time
+        Returns (orders, next_cursor); next_cursor is an int to pass back for
+        the next page, or None on the last page
+        """
+
+    def close(self):
+        pass
+
+
+class MemoryStorage(Storage):
+    """
+    Process-local engine: a Catalog of slotted Product records,
+    StockReservations and a column-oriented OrderStore
+    Product reads release expired holds first, so stock held by abandoned carts
+    comes back without waiting for the next reserve()
+    """
+
+    def __init__(self, reservation_ttl=900):
+        self.catalog = Catalog()
+        self.reservations = StockReservations(self.catalog, ttl=reservation_ttl)
+        self.users = {}
+        self.orders = OrderStore()
+
+    def seed_products(self, products):
+        self.catalog.extend(Product.from_dict(p) for p in products if p["id"] not in self.catalog)
+
+    def get_product(self, product_id):
+        self.reservations.expire()
+        return self.catalog.get(product_id)
+
+    def get_products(self, product_ids):
+        self.reservations.expire()
+        products = {}
+        for product_id in product_ids:
+            product = self.catalog.get(product_id)
+            if product is not None:
+                products[product_id] = product
+        return products
+
+    def list_products(self):
+        self.reservations.expire()
+        return self.catalog.all()
+
+    def products_by_category(self, category):
+        self.reservations.expire()
+        return self.catalog.by_category(category)
+
+    def products_in_price_range(self, min_price=None, max_price=None):
+        self.reservations.expire()
+        return self.catalog.in_price_range(min_price, max_price)
+
+    def get_user(self, email):
+        return self.users.get(email)
+
+    def add_user(self, user):
+        return self.users.setdefault(user["email"], user) is user
+
+    def reserve(self, items, ttl=None):
+        return self.reservations.reserve(items, ttl=ttl)
+
+    def get_reservation(self, reservation_id):
+        return self.reservations.get(reservation_id)
+
+    def release_reservation(self, reservation_id):
+        return self.reservations.release(reservation_id)
+
+    def expire_reservations(self):
+        return self.reservations.expire()
+
+    def place_order(self, order, reservation_id):
+        if not self.reservations.commit(reservation_id):
+            return False
+        self.orders.add(order)
+        return True
+
+    def get_order(self, order_id):
+        return self.orders.get(order_id)
+
+    def get_orders(self, order_ids):
+        return self.orders.get_many(order_ids)
+
+    def orders_by_email(self, email, limit=50, cursor=None):
+        return self.orders.by_email(email, limit, cursor)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    price REAL NOT NULL,
+    category TEXT NOT NULL,
+    stock INTEGER NOT NULL CHECK (stock >= 0)
+);
+CREATE INDEX IF NOT EXISTS products_category ON products (category);
+CREATE INDEX IF NOT EXISTS products_price ON products (price);
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reservations (
+    id TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reservations_expiry ON reservations (expires_at);
+CREATE TABLE IF NOT EXISTS reservation_items (
+    reservation_id TEXT NOT NULL REFERENCES reservations (id),
+    product_id TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    PRIMARY KEY (reservation_id, product_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS orders (
+    id TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_email ON orders (email);
+"""
+
+# Statements are kept as constants so every connection's statement cache
+# reuses the prepared form
+SELECT_PRODUCT = "SELECT id, name, price, category, stock FROM products WHERE id = ?"
+TAKE_STOCK = "UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?"
+RETURN_STOCK = "UPDATE products SET stock = stock + ? WHERE id = ?"
+INSERT_RESERVATION = "INSERT INTO reservations (id, expires_at) VALUES (?, ?)"
+INSERT_RESERVATION_ITEM = "INSERT INTO reservation_items (reservation_id, product_id, quantity) VALUES (?, ?, ?)"
+SELECT_RESERVATION = "SELECT expires_at FROM reservations WHERE id = ?"
+SELECT_RESERVATION_ITEMS = "SELECT product_id, quantity FROM reservation_items WHERE reservation_id = ?"
+SELECT_DUE_RESERVATION = "SELECT 1 FROM reservations WHERE expires_at <= ? LIMIT 1"
+DELETE_RESERVATION = "DELETE FROM reservations WHERE id = ?"
+DELETE_RESERVATION_ITEMS = "DELETE FROM reservation_items WHERE reservation_id = ?"
+INSERT_ORDER = "INSERT INTO orders (id, email, created_at, body) VALUES (?, ?, ?, ?)"
+SELECT_ORDER = "SELECT body FROM orders WHERE id = ?"
+# Ids per IN (...) query, below SQLite's default variable limit
+IN_BATCH_SIZE = 500
+
+
+def product_row(row):
+    return dict(zip(PRODUCT_COLUMNS, row))
+
+
+class SQLiteStorage(Storage):
+    """
+    SQLite engine that several uvicorn workers can share through one file
+    Connections are pooled, run in WAL mode and reuse prepared statements;
+    writes take the database lock up front (BEGIN IMMEDIATE), so a cart's
+    stock is checked and taken in one transaction across all processes.
+    WAL checkpoints run on a background thread every checkpoint_interval
+    seconds instead of inside whichever commit crosses the autocheckpoint size
+    """
+
+    def __init__(self, path, pool_size=8, reservation_ttl=900, busy_timeout_ms=5000, checkpoint_interval=1.0):
+        self.path = path
+        self.pool_size = pool_size
+        self.reservation_ttl = reservation_ttl
+        self.busy_timeout_ms = busy_timeout_ms
+        self._pool = queue.LifoQueue()
+        self._opened = 0
+        self._pool_lock = threading.Lock()
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+        self._closed = threading.Event()
+        if checkpoint_interval:
+            threading.Thread(target=self._checkpoint_loop, args=(checkpoint_interval,), daemon=True).start()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False, cached_statements=256,
+            timeout=self.busy_timeout_ms / 1000, uri=self.path.startswith("file:"),
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA wal_autocheckpoint = 0")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        return conn
+
+    def _checkpoint_loop(self, interval):
+        conn = self._connect()
+        try:
+            while not self._closed.wait(interval):
+                conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        finally:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection, opening one if fewer than pool_size exist"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                opening = self._opened < self.pool_size
+                if opening:
+                    self._opened += 1
+            conn = self._connect() if opening else self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def seed_products(self, products):
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO products (id, name, price, category, stock) VALUES (?, ?, ?, ?, ?)",
+                [tuple(p[column] for column in PRODUCT_COLUMNS) for p in products],
+            )
+
+    def _release_expired(self):
+        """
+        Expires due holds before a product read; the check is an index probe on
+        reservations_expiry, so the write lock is only taken when one is due
+        """
+        with self.connection() as conn:
+            due = conn.execute(SELECT_DUE_RESERVATION, (time.time(),)).fetchone()
+        if due:
+            self.expire_reservations()
+
+    def get_product(self, product_id):
+        self._release_expired()
+        with self.connection() as conn:
+            row = conn.execute(SELECT_PRODUCT, (product_id,)).fetchone()
+        return product_row(row) if row else None
+
+    def _in_batches(self, sql, ids):
+        """Rows of sql, whose one {} placeholder becomes an IN list, for ids in batches"""
+        ids = list(dict.fromkeys(ids))
+        with self.connection() as conn:
+            for start in range(0, len(ids), IN_BATCH_SIZE):
+                batch = ids[start:start + IN_BATCH_SIZE]
+                yield from conn.execute(sql.format(", ".join("?" * len(batch))), batch)
+
+    def get_products(self, product_ids):
+        self._release_expired()
+        return {
+            row[0]: product_row(row)
+            for row in self._in_batches("SELECT id, name, price, category, stock FROM products WHERE id IN ({})", product_ids)
+        }
+
+    def _products(self, sql, params=()):
+        self._release_expired()
+        with self.connection() as conn:
+            return [product_row(row) for row in conn.execute(sql, params)]
+
+    def list_products(self):
+        return self._products("SELECT id, name, price, category, stock FROM products ORDER BY rowid")
+
+    def products_by_category(self, category):
+        return self._products(
+            "SELECT id, name, price, category, stock FROM products WHERE category = ? ORDER BY rowid", (category,))
+
+    def products_in_price_range(self, min_price=None, max_price=None):
+        # Only the bounds that are set go in the WHERE, so SQLite can SEARCH the
+        # price index for the range instead of scanning all of it
+        bounds = [(clause, value) for clause, value in (("price >= ?", min_price), ("price <= ?", max_price))
+                  if value is not None]
+        where = " WHERE " + " AND ".join(clause for clause, _ in bounds) if bounds else ""
+        return self._products(
+            f"SELECT id, name, price, category, stock FROM products{where} ORDER BY price, rowid",
+            [value for _, value in bounds],
+        )
+
+    def get_user(self, email):
+        with self.connection() as conn:
+            row = conn.execute("SELECT body FROM users WHERE email = ?", (email,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add_user(self, user):
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO users (email, body) VALUES (?, ?)", (user["email"], json.dumps(user)))
+        return cursor.rowcount == 1
+
+    def _reserve(self, conn, items, ttl):
+        quantities = StockReservations.merge(items)
+        reservation = Reservation(quantities, time.time() + (self.reservation_ttl if ttl is None else ttl))
+        for product_id, quantity in quantities.items():
+            if not conn.execute(TAKE_STOCK, (quantity, product_id, quantity)).rowcount:
+                row = conn.execute(SELECT_PRODUCT, (product_id,)).fetchone()
+                if row is None:
+                    raise ProductNotFound(product_id)
+                raise InsufficientStock(product_row(row))
+        conn.execute(INSERT_RESERVATION, (reservation.id, reservation.expires_at))
+        conn.executemany(INSERT_RESERVATION_ITEM, [
+            (reservation.id, product_id, quantity) for product_id, quantity in quantities.items()])
+        return reservation
+
+    def reserve(self, items, ttl=None):
+        with self.transaction() as conn:
+            self._expire(conn)
+            return self._reserve(conn, items, ttl)
+
+    def reserve_many(self, carts, ttl=None):
+        # One transaction for all carts; a failed cart only rolls back its savepoint
+        results = []
+        with self.transaction() as conn:
+            self._expire(conn)
+            for items in carts:
+                conn.execute("SAVEPOINT cart")
+                try:
+                    results.append(self._reserve(conn, items, ttl))
+                except (ProductNotFound, InsufficientStock) as e:
+                    conn.execute("ROLLBACK TO cart")
+                    results.append(e)
+                conn.execute("RELEASE cart")
+        return results
+
+    def get_reservation(self, reservation_id):
+        with self.connection() as conn:
+            row = conn.execute(SELECT_RESERVATION, (reservation_id,)).fetchone()
+            if row is None or row[0] <= time.time():
+                return None
+            reservation = Reservation(dict(conn.execute(SELECT_RESERVATION_ITEMS, (reservation_id,))), row[0])
+        reservation.id = reservation_id
+        return reservation
+
+    def _remove_reservation(self, conn, reservation_id, restock):
+        items = conn.execute(SELECT_RESERVATION_ITEMS, (reservation_id,)).fetchall()
+        if restock:
+            conn.executemany(RETURN_STOCK, [(quantity, product_id) for product_id, quantity in items])
+        conn.execute(DELETE_RESERVATION_ITEMS, (reservation_id,))
+        conn.execute(DELETE_RESERVATION, (reservation_id,))
+
+    def release_reservation(self, reservation_id):
+        with self.transaction() as conn:
+            if conn.execute(SELECT_RESERVATION, (reservation_id,)).fetchone() is None:
+                return False
+            self._remove_reservation(conn, reservation_id, restock=True)
+        return True
+
+    def _expire(self, conn):
+        expired = [row[0] for row in conn.execute(
+            "SELECT id FROM reservations WHERE expires_at <= ?", (time.time(),))]
+        for reservation_id in expired:
+            self._remove_reservation(conn, reservation_id, restock=True)
+        return len(expired)
+
+    def expire_reservations(self):
+        with self.transaction() as conn:
+            return self._expire(conn)
+
+    def _place_order(self, conn, order, reservation_id):
+        row = conn.execute(SELECT_RESERVATION, (reservation_id,)).fetchone()
+        if row is None or row[0] <= time.time():
+            return False
+        self._remove_reservation(conn, reservation_id, restock=False)
+        conn.execute(INSERT_ORDER, (order["id"], order["email"], order["created_at"], json.dumps(order)))
+        return True
+
+    def place_order(self, order, reservation_id):
+        with self.transaction() as conn:
+            return self._place_order(conn, order, reservation_id)
+
+    def place_orders(self, orders):
+        with self.transaction() as conn:
+            return [self._place_order(conn, order, reservation_id) for order, reservation_id in orders]
+
+    def get_order(self, order_id):
+        with self.connection() as conn:
+            row = conn.execute(SELECT_ORDER, (order_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_orders(self, order_ids):
+        return {
+            order_id: json.loads(body)
+            for order_id, body in self._in_batches("SELECT id, body FROM orders WHERE id IN ({})", order_ids)
+        }
+
+    def orders_by_email(self, email, limit=50, cursor=None):
+        with self.connection() as conn:
+            rows = conn.execute(
+                "SELECT rowid, body FROM orders WHERE email = ? AND rowid > ? ORDER BY rowid LIMIT ?",
+                (email, cursor or 0, limit + 1),
+            ).fetchall()
+        page = rows[:limit]
+        next_cursor = page[-1][0] if len(rows) > limit else None
+        return [json.loads(body) for _, body in page], next_cursor
+
+    def close(self):
+        self._closed.set()
+        with self._pool_lock:
+            while self._opened:
+                self._pool.get().close()
+                self._opened -= 1
+
+
+def open_storage(url, **options):
+    """
+    Storage engine for a URL: "memory", or "sqlite:///path/to/checkout.db"
+    """
+    if url == "memory":
+        return MemoryStorage(**options)
+    if url.startswith("sqlite:///"):
+        return SQLiteStorage(url[len("sqlite:///"):], **options)
+    raise ValueError(f"Unknown storage URL {url!r}")
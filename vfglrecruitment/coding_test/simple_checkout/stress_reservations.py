@@ -0,0 +1,120 @@
+"""
+Hammers StockReservations from many threads and checks that no stock is
+oversold or lost: for every product, final stock + units sold == initial stock
+
+    python stress_reservations.py [--threads 64] [--carts 200000] [--naive]
+
+--naive runs the old check-then-decrement checkout loop instead, to show the
+check catches the races the reservation engine removes
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+
+from catalog import Catalog
+from reservations import InsufficientStock, StockReservations
+
+
+def naive_checkout(catalog, items):
+    """The original checkout loop: per-item check then decrement, no rollback"""
+    for product_id, quantity in items:
+        product = catalog.get(product_id)
+        if product["stock"] < quantity:
+            raise InsufficientStock(product)
+        product["stock"] -= quantity
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--carts", type=int, default=200_000, help="Carts attempted across all threads")
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--stock", type=int, default=5_000, help="Initial stock per product")
+    parser.add_argument("--abandon-rate", type=float, default=0.2, help="Fraction of holds released or left to expire")
+    parser.add_argument("--ttl", type=float, default=0.05, help="Reservation TTL in seconds")
+    parser.add_argument("--naive", action="store_true")
+    args = parser.parse_args()
+
+    # Switch threads as often as possible to expose check-then-act races
+    sys.setswitchinterval(1e-6)
+    catalog = Catalog([
+        {"id": str(i), "name": f"Product {i}", "price": 10.0, "category": "stress", "stock": args.stock}
+        for i in range(args.products)
+    ])
+    reservations = StockReservations(catalog, ttl=args.ttl)
+    counts = {"committed": 0, "rejected": 0, "released": 0, "left to expire": 0}
+    sold = {str(i): 0 for i in range(args.products)}
+    lock = threading.Lock()
+
+    def worker(carts):
+        local = dict.fromkeys(counts, 0)
+        local_sold = dict.fromkeys(sold, 0)
+        rng = random.Random()
+        for _ in range(carts):
+            items = [(str(rng.randrange(args.products)), rng.randint(1, 5)) for _ in range(rng.randint(1, 4))]
+            if args.naive:
+                try:
+                    naive_checkout(catalog, items)
+                except InsufficientStock:
+                    local["rejected"] += 1
+                    continue
+                local["committed"] += 1
+                for product_id, quantity in items:
+                    local_sold[product_id] += quantity
+                continue
+
+            try:
+                reservation = reservations.reserve(items)
+            except InsufficientStock:
+                local["rejected"] += 1
+                continue
+            roll = rng.random()
+            if roll < args.abandon_rate / 2:
+                reservations.release(reservation.id)
+                local["released"] += 1
+            elif roll < args.abandon_rate:
+                local["left to expire"] += 1
+            elif reservations.commit(reservation.id):
+                local["committed"] += 1
+                for product_id, quantity in reservation.items.items():
+                    local_sold[product_id] += quantity
+            else:
+                local["left to expire"] += 1
+        with lock:
+            for key, value in local.items():
+                counts[key] += value
+            for key, value in local_sold.items():
+                sold[key] += value
+
+    per_thread = args.carts // args.threads
+    threads = [threading.Thread(target=worker, args=(per_thread,)) for _ in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    time.sleep(args.ttl)
+    expired = reservations.expire()
+
+    oversold = sum(max(0, -catalog.get(product_id)["stock"]) for product_id in sold)
+    mismatched = [
+        product_id for product_id, units in sold.items()
+        if catalog.get(product_id)["stock"] + units != args.stock
+    ]
+    print(f"{'naive loop' if args.naive else 'reservations'}: {per_thread * args.threads} carts on {args.threads} threads "
+          f"in {elapsed:.2f}s ({per_thread * args.threads / elapsed:,.0f} carts/s)")
+    print("  " + ", ".join(f"{key} {value}" for key, value in counts.items()) + f", expired by sweep {expired}")
+    print(f"  units sold {sum(sold.values())} of {args.stock * args.products}, oversold units {oversold}, "
+          f"products with stock + sold != initial: {len(mismatched)}")
+    if oversold or mismatched:
+        print("FAIL")
+        sys.exit(1)
+    print("OK: zero oversell")
+
+
+if __name__ == "__main__":
+    main()
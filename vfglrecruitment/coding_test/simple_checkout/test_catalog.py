@@ -0,0 +1,87 @@
+import pytest
+
+from catalog import Catalog
+from records import Product
+
+
+def ids(products):
+    return [product["id"] for product in products]
+
+
+def make_catalog():
+    return Catalog(Product("p%d" % n, "Product %d" % n, price, category, 10) for n, (price, category) in enumerate([
+        (20.0, "books"), (5.0, "home"), (12.5, "books"), (12.5, "home"), (40.0, "toys"),
+    ]))
+
+
+def test_category_lookup_keeps_insertion_order():
+    catalog = make_catalog()
+    assert ids(catalog.by_category("books")) == ["p0", "p2"]
+    assert ids(catalog.by_category("home")) == ["p1", "p3"]
+    assert catalog.by_category("garden") == []
+
+
+@pytest.mark.parametrize("min_price, max_price, expected", [
+    (None, None, ["p1", "p2", "p3", "p0", "p4"]),
+    (12.5, 20.0, ["p2", "p3", "p0"]),
+    (12.6, None, ["p0", "p4"]),
+    (None, 12.5, ["p1", "p2", "p3"]),
+    (41.0, None, []),
+    (30.0, 10.0, []),
+])
+def test_price_range_is_inclusive_and_cheapest_first(min_price, max_price, expected):
+    assert ids(make_catalog().in_price_range(min_price, max_price)) == expected
+
+
+def test_indexes_follow_updates_and_removals():
+    catalog = make_catalog()
+    catalog.update("p0", price=1.0, category="home")
+    assert ids(catalog.by_category("books")) == ["p2"]
+    assert ids(catalog.by_category("home")) == ["p1", "p3", "p0"]
+    assert ids(catalog.in_price_range(None, 5.0)) == ["p0", "p1"]
+
+    catalog.add(Product("p5", "Product 5", 12.5, "books", 1))
+    assert ids(catalog.in_price_range(12.5, 12.5)) == ["p2", "p3", "p5"]
+
+    catalog.remove("p3")
+    assert "p3" not in catalog
+    assert ids(catalog.by_category("home")) == ["p1", "p0"]
+    assert ids(catalog.in_price_range(12.5, 12.5)) == ["p2", "p5"]
+
+
+def test_duplicate_and_renamed_ids_are_rejected():
+    catalog = make_catalog()
+    with pytest.raises(ValueError):
+        catalog.add(Product("p1", "Again", 1.0, "home", 1))
+    with pytest.raises(ValueError):
+        catalog.update("p1", id="p9")
+    assert len(catalog) == 5
+
+
+def test_storage_lookups(storage):
+    assert ids(storage.products_by_category("electronics")) == ["1", "4"]
+    assert storage.products_by_category("books") == []
+    assert ids(storage.products_in_price_range(30, 80)) == ["4", "3", "1"]
+    assert ids(storage.products_in_price_range(min_price=50)) == ["1", "2"]
+    assert ids(storage.products_in_price_range(max_price=34.99)) == ["5", "4"]
+    assert ids(storage.list_products()) == ["1", "2", "3", "4", "5"]
+
+
+def test_category_endpoint(client):
+    response = client.get("/api/categories/sports/products")
+    assert response.status_code == 200
+    assert response.json()["category"] == "sports"
+    assert ids(response.json()["products"]) == ["2", "5"]
+
+    assert client.get("/api/categories/books/products").json()["products"] == []
+    assert client.get("/api/categories/garden/products").status_code == 404
+
+
+def test_price_range_endpoint(client):
+    response = client.get("/api/products", params={"min_price": 30, "max_price": 80})
+    assert ids(response.json()["products"]) == ["4", "3", "1"]
+    assert response.json()["products"][0] == {
+        "id": "4", "name": "Laptop Stand", "price": 34.99, "category": "electronics", "stock": 40,
+    }
+    assert ids(client.get("/api/products").json()["products"]) == ["1", "2", "3", "4", "5"]
+    assert ids(client.get("/api/products", params={"max_price": 30}).json()["products"]) == ["5"]
@@ -0,0 +1,107 @@
+import pytest
+
+import checkout
+
+
+def cart(items, email="b@example.com", **fields):
+    return {
+        "items": [{"product_id": product_id, "quantity": quantity} for product_id, quantity in items],
+        "shipping_address": "1 Test Street",
+        "email": email,
+        **fields,
+    }
+
+
+def stock(client, product_id):
+    return client.get(f"/api/products/{product_id}").json()["stock"]
+
+
+def place(client, count, email="b@example.com"):
+    return [client.post("/api/checkout", json=cart([("5", 1)], email=email)).json()["order_id"]
+            for _ in range(count)]
+
+
+def test_batch_results_are_per_cart(client):
+    hold = client.post("/api/reservations", json={"items": [{"product_id": "2", "quantity": 1}]}).json()
+    response = client.post("/api/checkout/batch", json={"carts": [
+        cart([("2", 2), ("5", 1)]),
+        cart([("2", 1), ("zzz", 1)]),
+        cart([("5", 1000)]),
+        cart([("2", 1)], reservation_id=hold["reservation_id"]),
+        cart([("2", 3)], reservation_id=hold["reservation_id"]),
+        cart([("4", 1)], email="c@example.com"),
+        cart([("1", 1)], reservation_id="no-such-hold"),
+    ]})
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["confirmed"], body["failed"]) == (3, 4)
+    assert [result["status"] for result in body["results"]] == [
+        "confirmed", "failed", "failed", "confirmed", "failed", "confirmed", "failed"]
+    assert [result.get("status_code") for result in body["results"]] == [None, 404, 400, None, 400, None, 410]
+    assert body["results"][0]["total"] == pytest.approx(2 * 89.99 + 24.99)
+
+    # Failed carts took nothing; the held cart's unit was already taken by its hold
+    assert (stock(client, "2"), stock(client, "5"), stock(client, "4"), stock(client, "1")) == (27, 59, 39, 50)
+    for result in body["results"]:
+        if result["status"] == "confirmed":
+            assert client.get(f"/api/orders/{result['order_id']}").json()["status"] == "confirmed"
+
+
+def test_batch_rejects_too_many_carts(client):
+    carts = [cart([("5", 1)])] * 1001
+    assert client.post("/api/checkout/batch", json={"carts": carts}).status_code == 422
+    assert stock(client, "5") == 60
+
+
+def test_batch_matches_single_checkouts(client):
+    carts = [cart([("3", 7)]), cart([("3", 7)]), cart([("3", 7)]), cart([("3", 6)])]
+    body = client.post("/api/checkout/batch", json={"carts": carts}).json()
+    # Carts are reserved in order, so the third no longer fits but the fourth does
+    assert [result["status"] for result in body["results"]] == ["confirmed", "confirmed", "failed", "confirmed"]
+    assert stock(client, "3") == 0
+
+
+def test_orders_by_ids_keep_request_order(client):
+    order_ids = place(client, 3)
+    missing = "00000000-0000-4000-8000-000000000000"
+    requested = [order_ids[2], "not-a-uuid", order_ids[0], missing, order_ids[1]]
+    body = client.get("/api/orders", params={"ids": ",".join(requested)}).json()
+    assert [order["id"] for order in body["orders"]] == [order_ids[2], order_ids[0], order_ids[1]]
+    assert body["missing"] == ["not-a-uuid", missing]
+    assert body["orders"][0] == client.get(f"/api/orders/{order_ids[2]}").json()
+
+
+def test_too_many_ids_are_rejected(client):
+    ids = ",".join(["00000000-0000-4000-8000-000000000000"] * (checkout.MAX_ORDER_IDS + 1))
+    assert client.get("/api/orders", params={"ids": ids}).status_code == 400
+
+
+def test_orders_by_email_page_oldest_first(client):
+    order_ids = place(client, 7)
+    place(client, 2, email="other@example.com")
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        params = {"email": "b@example.com", "limit": 3}
+        if cursor is not None:
+            params["cursor"] = cursor
+        body = client.get("/api/orders", params=params).json()
+        assert len(body["orders"]) <= 3
+        seen += [order["id"] for order in body["orders"]]
+        pages += 1
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == order_ids
+    assert pages == 3
+
+    body = client.get("/api/orders", params={"email": "nobody@example.com"}).json()
+    assert body == {"email": "nobody@example.com", "orders": [], "next_cursor": None}
+
+
+def test_order_lookup_errors(client):
+    assert client.get("/api/orders").status_code == 400
+    assert client.get("/api/orders", params={"email": "b@example.com", "limit": 0}).status_code == 422
+    assert client.get("/api/orders", params={"email": "b@example.com", "limit": 501}).status_code == 422
+    assert client.get("/api/orders", params={"email": "b@example.com", "cursor": -1}).status_code == 422
+    assert client.get("/api/orders/not-a-uuid").status_code == 404
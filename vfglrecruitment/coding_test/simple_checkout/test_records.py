@@ -0,0 +1,107 @@
+from datetime import datetime
+import uuid
+
+import pytest
+
+from records import OrderStore, Product
+
+
+def line(product_id="1", name="Wireless Headphones", price=79.99, quantity=1):
+    return {"product_id": product_id, "name": name, "price": price, "quantity": quantity,
+            "subtotal": price * quantity}
+
+
+def make_order(items, email="a@example.com", created_at=None):
+    return {
+        "id": str(uuid.uuid4()),
+        "items": items,
+        "total": sum(item["subtotal"] for item in items),
+        "shipping_address": "1 Test Street",
+        "email": email,
+        "status": "confirmed",
+        "created_at": created_at or datetime.utcnow().isoformat(),
+    }
+
+
+@pytest.mark.parametrize("items, created_at", [
+    ([line(), line("4", "Laptop Stand", 34.99, 3)], None),
+    ([line(price=0.1, quantity=3)], "2026-10-16T23:59:59.999999"),
+    ([line(quantity=2**40)], "1970-01-01T00:00:00"),
+    ([line(price=1e-7)], "1969-07-20T20:17:40.000001"),
+    ([], "2026-01-01T00:00:00.000001"),
+])
+def test_round_trip_is_exact(items, created_at):
+    store = OrderStore()
+    order = make_order(items, created_at=created_at)
+    store.add(order)
+    assert store.get(order["id"]) == order
+    assert all(type(item["quantity"]) is int for item in store.get(order["id"])["items"])
+    assert order["id"] in store and len(store) == 1
+
+
+def test_orders_with_more_lines_than_a_short_holds():
+    store = OrderStore()
+    order = make_order([line(str(n % 5), quantity=n + 1) for n in range(70000)])
+    store.add(order)
+    assert store.get(order["id"]) == order
+
+
+def test_rejected_order_leaves_the_store_unchanged():
+    store = OrderStore()
+    first = make_order([line(quantity=2)])
+    store.add(first)
+    with pytest.raises(OverflowError):
+        store.add(make_order([line(quantity=1), line(quantity=-1)]))
+    with pytest.raises(OverflowError):
+        store.add(make_order([line(quantity=2**64)]))
+    with pytest.raises(ValueError):
+        store.add(dict(make_order([line()]), id="ORDER-1"))
+    with pytest.raises(ValueError):
+        store.add(dict(make_order([line()]), id=str(uuid.uuid4()).upper()))
+    assert len(store) == 1
+
+    second = make_order([line("2", "Running Shoes", 89.99, 1)])
+    store.add(second)
+    assert store.get(first["id"]) == first
+    assert store.get(second["id"]) == second
+    assert store.by_email("a@example.com") == ([first, second], None)
+
+
+def test_lookups():
+    store = OrderStore()
+    orders = [make_order([line(quantity=n + 1)], email="a@example.com" if n % 2 else "b@example.com")
+              for n in range(7)]
+    for order in orders:
+        store.add(order)
+    mine = orders[1::2]
+
+    assert store.get_many([orders[3]["id"], "nope", orders[0]["id"]]) == {
+        orders[3]["id"]: orders[3], orders[0]["id"]: orders[0]}
+    assert store.get("nope") is None
+    assert store.get(str(uuid.uuid4())) is None
+
+    page, cursor = store.by_email("a@example.com", limit=2)
+    assert page == mine[:2]
+    page, cursor = store.by_email("a@example.com", limit=2, cursor=cursor)
+    assert (page, cursor) == (mine[2:], None)
+    assert store.by_email("c@example.com") == ([], None)
+
+
+def test_storage_round_trip(storage):
+    order = make_order([line(), line("4", "Laptop Stand", 34.99, 3)])
+    reservation = storage.reserve([("1", 1), ("4", 3)])
+    assert storage.place_order(order, reservation.id)
+    assert storage.get_order(order["id"]) == order
+    assert storage.get_orders([order["id"]]) == {order["id"]: order}
+
+
+def test_product_reads_like_a_dict():
+    product = Product("1", "Wireless Headphones", 79.99, "electronics", 50)
+    product["stock"] -= 1
+    assert dict(product) == {"id": "1", "name": "Wireless Headphones", "price": 79.99,
+                             "category": "electronics", "stock": 49}
+    assert Product.from_dict(dict(product)) == product
+    with pytest.raises(KeyError):
+        product["colour"]
+    with pytest.raises(KeyError):
+        product["colour"] = "red"
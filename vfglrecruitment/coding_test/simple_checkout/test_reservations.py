@@ -0,0 +1,157 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+import pytest
+
+import checkout
+from reservations import InsufficientStock, ProductNotFound
+from storage import MemoryStorage
+
+
+def stocks(storage):
+    return {product["id"]: product["stock"] for product in storage.list_products()}
+
+
+def test_reserve_takes_stock_for_the_whole_cart(storage):
+    reservation = storage.reserve([("1", 2), ("3", 5), ("1", 3)])
+    assert reservation.items == {"1": 5, "3": 5}
+    assert stocks(storage) == {"1": 45, "2": 30, "3": 15, "4": 40, "5": 60}
+    assert storage.get_reservation(reservation.id).items == {"1": 5, "3": 5}
+
+
+@pytest.mark.parametrize("items, error", [
+    ([("1", 2), ("missing", 1)], ProductNotFound),
+    ([("1", 2), ("3", 21)], InsufficientStock),
+    ([("3", 15), ("4", 1), ("3", 6)], InsufficientStock),
+])
+def test_failed_reservation_leaves_stock_untouched(storage, items, error):
+    before = stocks(storage)
+    with pytest.raises(error):
+        storage.reserve(items)
+    assert stocks(storage) == before
+
+
+def test_release_gives_stock_back_once(storage):
+    reservation = storage.reserve([("2", 10), ("5", 1)])
+    assert storage.release_reservation(reservation.id)
+    assert stocks(storage)["2"] == 30 and stocks(storage)["5"] == 60
+    assert storage.get_reservation(reservation.id) is None
+    assert not storage.release_reservation(reservation.id)
+    assert stocks(storage)["2"] == 30
+
+
+def test_expired_holds_are_released(storage):
+    kept = storage.reserve([("3", 4)])
+    expired = storage.reserve([("3", 6), ("4", 1)], ttl=0)
+    time.sleep(0.01)
+    assert storage.get_reservation(expired.id) is None
+    assert storage.expire_reservations() == 1
+    assert stocks(storage)["3"] == 16 and stocks(storage)["4"] == 40
+    assert storage.expire_reservations() == 0
+    assert storage.get_reservation(kept.id).items == {"3": 4}
+
+
+def test_product_reads_release_expired_holds(storage):
+    storage.reserve([("3", 6), ("4", 1)], ttl=0)
+    time.sleep(0.01)
+    # No reserve() in between: the reads themselves give the stock back
+    assert storage.get_product("3")["stock"] == 20
+    assert storage.expire_reservations() == 0
+
+    storage.reserve([("3", 6)], ttl=0)
+    time.sleep(0.01)
+    assert stocks(storage)["3"] == 20
+
+
+def test_abandoned_hold_reappears_in_the_catalog(client, storage):
+    storage.reserve([("3", 20)], ttl=0)
+    time.sleep(0.01)
+    assert client.get("/api/products/3").json()["stock"] == 20
+    assert {product["id"]: product["stock"] for product in client.get("/api/products").json()["products"]}["3"] == 20
+
+
+def test_expiry_heap_stays_bounded_by_outstanding_holds():
+    storage = MemoryStorage(reservation_ttl=900)
+    storage.seed_products(checkout.SEED_PRODUCTS)
+    kept = storage.reserve([("5", 1)], ttl=0.2)
+    order = {"items": [], "total": 0.0, "shipping_address": "x", "email": "a@example.com",
+             "status": "confirmed", "created_at": "2026-01-01T00:00:00"}
+    for i in range(100):
+        reservation = storage.reserve([("5", 1)])
+        if i % 2:
+            assert storage.release_reservation(reservation.id)
+        else:
+            assert storage.place_order(dict(order, id=f"00000000-0000-4000-8000-{i:012d}"), reservation.id)
+    # Committed and released holds don't linger until their 15 minute deadline
+    assert len(storage.reservations._expiry) <= 4
+    time.sleep(0.25)
+    assert stocks(storage)["5"] == 10
+    assert storage.get_reservation(kept.id) is None
+
+
+def test_expired_hold_cannot_be_ordered(storage):
+    reservation = storage.reserve([("3", 4)], ttl=0)
+    time.sleep(0.01)
+    order = {"id": "00000000-0000-4000-8000-000000000001", "items": [], "total": 0.0,
+             "shipping_address": "x", "email": "a@example.com", "status": "confirmed",
+             "created_at": "2026-01-01T00:00:00"}
+    assert not storage.place_order(order, reservation.id)
+    assert storage.get_order(order["id"]) is None
+
+
+def test_reserving_the_last_units_concurrently(storage):
+    # 20 Coffee Makers in stock; exactly 20 single-unit carts can win
+    def attempt(_):
+        try:
+            return storage.reserve([("3", 1), ("5", 1)])
+        except InsufficientStock:
+            return None
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(attempt, range(50)))
+    assert sum(result is not None for result in results) == 20
+    assert stocks(storage)["3"] == 0 and stocks(storage)["5"] == 40
+
+
+def test_reservation_endpoints(client):
+    response = client.post("/api/reservations", json={"items": [
+        {"product_id": "3", "quantity": 15}, {"product_id": "3", "quantity": 5}]})
+    assert response.status_code == 200
+    hold = response.json()
+    assert hold["items"] == [{"product_id": "3", "quantity": 20}]
+    assert client.get("/api/products/3").json()["stock"] == 0
+
+    assert client.delete(f"/api/reservations/{hold['reservation_id']}").json()["status"] == "released"
+    assert client.get("/api/products/3").json()["stock"] == 20
+    assert client.delete(f"/api/reservations/{hold['reservation_id']}").status_code == 404
+
+
+@pytest.mark.parametrize("items, status_code", [
+    ([{"product_id": "1", "quantity": 2}, {"product_id": "nope", "quantity": 1}], 404),
+    ([{"product_id": "1", "quantity": 2}, {"product_id": "3", "quantity": 21}], 400),
+    ([{"product_id": "1", "quantity": 0}], 422),
+])
+def test_failed_checkout_leaves_stock_untouched(client, items, status_code):
+    response = client.post("/api/checkout", json={
+        "items": items, "shipping_address": "x", "email": "a@example.com"})
+    assert response.status_code == status_code
+    assert client.get("/api/products/1").json()["stock"] == 50
+    assert client.get("/api/products/3").json()["stock"] == 20
+
+
+def test_checkout_against_a_hold(client):
+    items = [{"product_id": "1", "quantity": 2}, {"product_id": "4", "quantity": 1}]
+    hold = client.post("/api/reservations", json={"items": items}).json()
+    cart = {"items": items, "shipping_address": "x", "email": "a@example.com",
+            "reservation_id": hold["reservation_id"]}
+
+    mismatched = dict(cart, items=items[:1])
+    assert client.post("/api/checkout", json=mismatched).status_code == 400
+
+    response = client.post("/api/checkout", json=cart)
+    assert response.status_code == 200
+    assert response.json()["total"] == pytest.approx(2 * 79.99 + 34.99)
+    # The hold already took the stock; checking out doesn't take it twice
+    assert client.get("/api/products/1").json()["stock"] == 48
+    assert client.get("/api/products/4").json()["stock"] == 39
+    assert client.post("/api/checkout", json=cart).status_code == 410
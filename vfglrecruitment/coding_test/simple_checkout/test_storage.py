@@ -0,0 +1,171 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import subprocess
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+import checkout
+from storage import SQLiteStorage, Storage, open_storage
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# A worker process: opens the shared file, reserves a cart and checks it out,
+# then prints the order id, or the error if the cart couldn't be reserved
+WORKER = """
+import sys, uuid
+from reservations import InsufficientStock
+from storage import open_storage
+storage = open_storage("sqlite:///" + sys.argv[1], checkpoint_interval=0)
+try:
+    reservation = storage.reserve([("3", int(sys.argv[2]))])
+except InsufficientStock as e:
+    print("failed", e)
+else:
+    order = {"id": str(uuid.uuid4()), "items": [], "total": 0.0, "shipping_address": "x",
+             "email": "worker@example.com", "status": "confirmed", "created_at": "2026-01-01T00:00:00"}
+    assert storage.place_order(order, reservation.id)
+    print("ordered", order["id"])
+storage.close()
+"""
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "checkout.db")
+
+
+def open_worker(path):
+    engine = open_storage(f"sqlite:///{path}", checkpoint_interval=0)
+    engine.seed_products(checkout.SEED_PRODUCTS)
+    return engine
+
+
+def run_worker(path, quantity):
+    return subprocess.Popen(
+        [sys.executable, "-c", WORKER, path, str(quantity)],
+        cwd=HERE, stdout=subprocess.PIPE, text=True,
+    )
+
+
+def test_storage_is_abstract():
+    with pytest.raises(TypeError):
+        Storage()
+
+
+def test_unknown_url_is_rejected():
+    with pytest.raises(ValueError):
+        open_storage("postgres://localhost/checkout")
+
+
+def test_workers_share_stock_reservations_and_orders(path):
+    first, second = open_worker(path), open_worker(path)
+    try:
+        reservation = first.reserve([("1", 5)])
+        # Seeding again from another worker doesn't reset stock
+        second.seed_products(checkout.SEED_PRODUCTS)
+        assert second.get_product("1")["stock"] == 45
+        assert second.get_reservation(reservation.id).items == {"1": 5}
+
+        order = {"id": "00000000-0000-4000-8000-000000000001", "items": [], "total": 0.0,
+                 "shipping_address": "x", "email": "a@example.com", "status": "confirmed",
+                 "created_at": "2026-01-01T00:00:00"}
+        assert second.place_order(order, reservation.id)
+        assert not first.place_order(order, reservation.id)
+        assert not first.release_reservation(reservation.id)
+        assert first.get_order(order["id"]) == order
+        assert first.get_product("1")["stock"] == 45
+
+        assert first.add_user({"email": "a@example.com", "name": "A"})
+        assert not second.add_user({"email": "a@example.com", "name": "B"})
+        assert second.get_user("a@example.com") == {"email": "a@example.com", "name": "A"}
+    finally:
+        first.close()
+        second.close()
+
+
+def test_data_survives_reopening(path):
+    engine = open_worker(path)
+    reservation = engine.reserve([("2", 3)])
+    engine.add_user({"email": "a@example.com", "name": "A"})
+    engine.close()
+
+    engine = open_worker(path)
+    try:
+        assert engine.get_product("2")["stock"] == 27
+        assert engine.get_reservation(reservation.id).items == {"2": 3}
+        assert engine.get_user("a@example.com")["name"] == "A"
+    finally:
+        engine.close()
+
+
+def test_worker_processes_never_oversell(path):
+    open_worker(path).close()
+    # 20 Coffee Makers in stock and six processes wanting 8 each: two can win
+    workers = [run_worker(path, 8) for _ in range(6)]
+    outcomes = [worker.communicate(timeout=60)[0].split() for worker in workers]
+    assert all(worker.returncode == 0 for worker in workers)
+    ordered = [outcome[1] for outcome in outcomes if outcome[0] == "ordered"]
+    assert len(ordered) == 2
+
+    engine = open_worker(path)
+    try:
+        assert engine.get_product("3")["stock"] == 4
+        assert sorted(engine.get_orders(ordered)) == sorted(ordered)
+        orders, _ = engine.orders_by_email("worker@example.com")
+        assert sorted(order["id"] for order in orders) == sorted(ordered)
+    finally:
+        engine.close()
+
+
+def test_pool_is_shared_by_threads(path):
+    engine = SQLiteStorage(path, pool_size=2, checkpoint_interval=0)
+    engine.seed_products(checkout.SEED_PRODUCTS)
+    try:
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda _: engine.release_reservation(engine.reserve([("5", 1)]).id), range(40)))
+        assert engine.get_product("5")["stock"] == 60
+        assert engine._opened <= 2
+    finally:
+        engine.close()
+
+
+@pytest.mark.parametrize("min_price, max_price, plan", [
+    (30, 80, "SEARCH products USING INDEX products_price (price>? AND price<?)"),
+    (30, None, "SEARCH products USING INDEX products_price (price>?)"),
+    (None, 80, "SEARCH products USING INDEX products_price (price<?)"),
+])
+def test_price_range_searches_the_price_index(path, min_price, max_price, plan):
+    engine = SQLiteStorage(path, pool_size=1, checkpoint_interval=0)
+    try:
+        statements = []
+        with engine.connection() as conn:
+            conn.set_trace_callback(statements.append)
+        engine.products_in_price_range(min_price, max_price)
+        with engine.connection() as conn:
+            conn.set_trace_callback(None)
+            (select,) = [statement for statement in statements if "FROM products" in statement]
+            assert [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + select)] == [plan]
+    finally:
+        engine.close()
+
+
+def test_app_serves_from_sqlite(path, monkeypatch):
+    engine = open_worker(path)
+    monkeypatch.setattr(checkout, "storage", engine)
+    try:
+        response = TestClient(checkout.app).post("/api/checkout", json={
+            "items": [{"product_id": "4", "quantity": 2}], "shipping_address": "x", "email": "a@example.com"})
+        assert response.status_code == 200
+    finally:
+        engine.close()
+
+    engine = open_worker(path)
+    try:
+        assert engine.get_product("4")["stock"] == 38
+        order = engine.get_order(response.json()["order_id"])
+        assert order["total"] == pytest.approx(69.98)
+        assert order["items"][0]["quantity"] == 2
+    finally:
+        engine.close()